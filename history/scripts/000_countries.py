@@ -1,23 +1,68 @@
+import argparse
+import functools
+import os
 import pathlib
-import pandas as pd
+import sys
+import time
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'tools'))
+import country_generator
+import state_loader
+
+# 国の履歴ファイルをテンプレートから作り直す (1行目の首都はそのまま残す)
+# リポジトリ直下で実行する。例:
+#   python history/scripts/000_countries.py              すべての国を作り直す
+#   python history/scripts/000_countries.py --dry-run --diff   書き込まずに変更内容を表示する
+# テンプレートと変数は tools/country_generator.py を参照。内容が変わらないファイルには書き込まない。
+
 input_dir = 'history/countries'
-base_file_path = "history/scripts/countries.txt"
-# フォルダ内に保存されているファイル一覧
-country_list = list(pathlib.Path(input_dir).glob('**/*.txt'))
-with open(base_file_path,"r",encoding="utf-8") as b:
-    base = b.read()
-print(base)
-for i in range (len(country_list)):
-
-    with open(country_list[i],"r",encoding="utf-8") as f:
-        file = f.readlines()
-        file = [file[0]]
-        file.append(base)
-        print(file)
-
-
-    with open(country_list[i],"w",encoding="utf-8") as f:
-        
-        f.write("")
-        for j in range(len(file)):
-            f.write(str(file[j]))
\ No newline at end of file
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="国の履歴ファイルをテンプレートから作り直す")
+    parser.add_argument("files", nargs="*", help="対象の国のファイル (省略時は history/countries のすべて)")
+    parser.add_argument("--template", default=country_generator.DEFAULT_TEMPLATE, help="既定のテンプレート")
+    parser.add_argument("--template-dir", default=country_generator.TEMPLATE_DIR, help="タグごとのテンプレートのフォルダ")
+    parser.add_argument("--overrides", default=country_generator.OVERRIDES_TSV, help="国ごとの変数の TSV (無ければ使わない)")
+    parser.add_argument("--dry-run", action="store_true", help="書き込まずに変更されるファイルを表示する")
+    parser.add_argument("--diff", action="store_true", help="変更内容を unified diff で表示する")
+    parser.add_argument("--workers", type=int, default=0, help="並列に処理するプロセス数 (0 ならCPUコア数)")
+    args = parser.parse_args(argv)
+
+    started = time.perf_counter()
+    try:
+        templates = country_generator.read_templates(args.template, args.template_dir)
+        overrides = country_generator.read_overrides(args.overrides)
+    except (OSError, UnicodeDecodeError, ValueError) as e:
+        print(f"エラー: {e}", file=sys.stderr)
+        return 1
+    # フォルダ内に保存されているファイル一覧
+    country_list = args.files or sorted(str(path) for path in pathlib.Path(input_dir).glob('**/*.txt'))
+    generate = functools.partial(country_generator.generate_country_file, templates=templates, overrides=overrides,
+                                 write=not args.dry_run, diff=args.diff)
+    results = state_loader.parse_files(country_list, generate, args.workers)
+
+    changed = 0
+    errors = 0
+    for result in results:
+        if result["error"]:
+            errors += 1
+            print(f"エラー: {result['filepath']}: {result['error']}", file=sys.stderr)
+            continue
+        if not result["changed"]:
+            continue
+        changed += 1
+        if args.diff:
+            sys.stdout.write(result["diff"])
+        elif args.dry_run:
+            print(f"変更予定: {result['filepath']}")
+    unknown = sorted(set(overrides) - {result["tag"] for result in results})
+    if unknown and not args.files:
+        print(f"警告: {args.overrides} のタグに国のファイルがありません: {', '.join(unknown)}", file=sys.stderr)
+    verb = "変更します (書き込みはしません)" if args.dry_run else "変更しました"
+    print(f"{len(country_list)} ファイル中 {changed} ファイルを{verb} ({time.perf_counter() - started:.2f} 秒)",
+          file=sys.stderr if args.diff else sys.stdout) # diff はそのままパッチとして使えるようにする
+    return 1 if errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
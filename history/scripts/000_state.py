@@ -1,23 +1,59 @@
+import argparse
+import functools
+import os
 import pathlib
-import pandas as pd
+import sys
+import time
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'tools'))
+import state_loader
+import state_scrubber
+
+# ステートの所有者・中核・請求などを取り除いて、マップをリセットする
+# リポジトリ直下で実行する。例:
+#   python history/scripts/000_state.py              すべてのステートをリセットする
+#   python history/scripts/000_state.py --dry-run --diff   書き込まずに変更内容を表示する
+# 削除する文のキーは tools/state_scrubber.py の REMOVE_KEYS。内容が変わらないファイルには書き込まない。
+
 input_dir = 'history/states'
-# フォルダ内に保存されているファイル一覧
-state_list = list(pathlib.Path(input_dir).glob('**/*.txt'))
-for i in range (len(state_list)):
-
-    with open(state_list[i],"r",encoding="utf-8") as f:
-        df = pd.Series(f.readlines())
-        print(df)
-        df.drop(df[df.str.contains('owner')].index,inplace=True)
-        df.drop(df[df.str.contains('add_core_of')].index,inplace=True)
-        df.drop(df[df.str.contains('add_claim_by')].index,inplace=True)
-        df.drop(df[df.str.contains('add_to_array')].index,inplace=True)
-        df.drop(df[df.str.contains('add_dynamic_modifier')].index,inplace=True)
-        df.drop(df[df.str.contains('set_demilitarized_zone')].index,inplace=True)
-        lines = df.to_list()
-
-    with open(state_list[i],"w",encoding="utf-8") as f:
-        
-        f.write("")
-        for j in range(len(lines)):
-            f.write(str(lines[j]))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="ステートの所有者・中核・請求などを取り除く")
+    parser.add_argument("files", nargs="*", help="対象のステートファイル (省略時は history/states のすべて)")
+    parser.add_argument("--dry-run", action="store_true", help="書き込まずに変更されるファイルを表示する")
+    parser.add_argument("--diff", action="store_true", help="変更内容を unified diff で表示する")
+    parser.add_argument("--workers", type=int, default=0, help="並列に処理するプロセス数 (0 ならCPUコア数)")
+    args = parser.parse_args(argv)
+
+    started = time.perf_counter()
+    # フォルダ内に保存されているファイル一覧
+    state_list = args.files or sorted(str(path) for path in pathlib.Path(input_dir).glob('**/*.txt'))
+    scrub = functools.partial(state_scrubber.scrub_file, write=not args.dry_run, diff=args.diff)
+    results = state_loader.parse_files(state_list, scrub, args.workers)
+
+    changed = 0
+    errors = 0
+    removed = {}
+    for result in results:
+        if result["error"]:
+            errors += 1
+            print(f"エラー: {result['filepath']}: {result['error']}", file=sys.stderr)
+            continue
+        if not result["changed"]:
+            continue
+        changed += 1
+        for key, count in result["removed"].items():
+            removed[key] = removed.get(key, 0) + count
+        if args.diff:
+            sys.stdout.write(result["diff"])
+        elif args.dry_run:
+            print(f"変更予定: {result['filepath']}")
+    summary = ", ".join(f"{key} {count}" for key, count in sorted(removed.items()))
+    verb = "変更します (書き込みはしません)" if args.dry_run else "変更しました"
+    print(f"{len(state_list)} ファイル中 {changed} ファイルを{verb} ({summary or '削除なし'}、{time.perf_counter() - started:.2f} 秒)",
+          file=sys.stderr if args.diff else sys.stdout) # diff はそのままパッチとして使えるようにする
+    return 1 if errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
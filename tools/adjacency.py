@@ -0,0 +1,281 @@
+import os
+
+import numpy as np
+
+from province_bitmap import ColorLookup, open_bmp, pixel_keys
+
+# プロビンスの隣接グラフ
+# provinces.bmp の上下左右 (東西は地図の端でつながる) の画素の色を NumPy でまとめて比べて隣接するプロビンスの組を求め、
+# map/adjacencies.csv の海峡・海上の渡り・通行不可の設定を重ねて、CSR 形式 (indptr, indices) で持つ。
+# 画像を処理するのは作るときだけで、隣接・連続性・経路の問い合わせはグラフだけを使う。
+
+GRAPH_VERSION = 1
+
+# 辺の種類 (kinds 配列の値は KINDS の位置)
+# border: ビットマップ上で接している、land: adjacencies.csv の陸上の渡り (海峡など)、
+# sea: 海上の渡り (through のプロビンスを通る)、impassable: 接しているが通行できない
+KINDS = ("border", "land", "sea", "impassable")
+PASSABLE_KINDS = ("border", "land", "sea")
+
+
+def parse_adjacencies_csv(filepath):
+    """
+    adjacencies.csv を (From, To, Type, Through) のリストとして読む。
+    Type は空文字列 (陸上の渡り)、"sea"、"impassable" など。
+    """
+    rows = []
+    try:
+        with open(filepath, 'r', encoding='utf-8-sig') as f:
+            next(f) # 見出し
+            for line in f:
+                items = line.strip().split(';')
+                if len(items) < 4:
+                    continue
+                try:
+                    source, target, through = int(items[0]), int(items[1]), int(items[3])
+                except ValueError:
+                    continue
+                if source < 0 or target < 0: # 終端の -1 の行
+                    continue
+                rows.append((source, target, items[2].strip().lower(), through))
+    except Exception as e:
+        print(f"Error loading adjacencies from {filepath}: {e}")
+    return rows
+
+
+def _color_pairs(a, b):
+    """異なる色の組を (小さい方 << 24 | 大きい方) の配列にして重複を除く。"""
+    low = np.minimum(a, b).astype(np.uint64)
+    high = np.maximum(a, b).astype(np.uint64)
+    return np.unique((low << np.uint64(24)) | high)
+
+
+def bitmap_edges(filepath, definition_rows, chunk_rows=256):
+    """
+    provinces.bmp で接しているプロビンスの組を返す。
+
+    Returns:
+        tuple[np.ndarray, np.ndarray]: definition.csv の行の順の番号の組 (a < b、重複なし)
+    """
+    pixels = open_bmp(filepath)
+    height = pixels.shape[0]
+    lookup = ColorLookup(definition_rows)
+    pairs = []
+    previous_row = None
+    for top in range(0, height, chunk_rows):
+        keys = pixel_keys(pixels[top:top + chunk_rows])
+        if previous_row is not None:
+            keys = np.concatenate([previous_row[None], keys]) # 前の塊の最後の行との境目も比べる
+        # 左右 (東西の端もつなぐ)
+        horizontal = keys[:, 1:] != keys[:, :-1]
+        pairs.append(_color_pairs(keys[:, 1:][horizontal], keys[:, :-1][horizontal]))
+        wrap = keys[:, 0] != keys[:, -1]
+        pairs.append(_color_pairs(keys[:, 0][wrap], keys[:, -1][wrap]))
+        # 上下
+        vertical = keys[1:] != keys[:-1]
+        pairs.append(_color_pairs(keys[1:][vertical], keys[:-1][vertical]))
+        previous_row = keys[-1]
+    pairs = np.unique(np.concatenate(pairs)) if pairs else np.zeros(0, dtype=np.uint64)
+
+    a = lookup.lookup((pairs >> np.uint64(24)).astype(np.uint32))
+    b = lookup.lookup((pairs & np.uint64(0xFFFFFF)).astype(np.uint32))
+    known = (a != lookup.unknown) & (b != lookup.unknown) & (a != b) # definition.csv に無い色は除く
+    a, b = np.minimum(a[known], b[known]), np.maximum(a[known], b[known])
+    edges = np.unique(a * lookup.unknown + b)
+    return edges // lookup.unknown, edges % lookup.unknown
+
+
+class ProvinceGraph:
+    """
+    プロビンスの隣接グラフ (CSR 形式)。行の番号は definition.csv の行の順。
+
+    indptr[i]:indptr[i + 1] の範囲の indices が行 i の隣接先、kinds がその辺の種類 (KINDS の位置)、
+    through が海上の渡りで通るプロビンスID (無ければ -1)。
+    """
+
+    def __init__(self, province_ids, indptr, indices, kinds, through):
+        self.province_ids = province_ids
+        self.indptr = indptr
+        self.indices = indices
+        self.kinds = kinds
+        self.through = through
+        self.row_of = {int(province_id): row for row, province_id in enumerate(province_ids.tolist())}
+        self._adjacency = {} # 辺の種類の組 -> 行ごとの隣接先のリスト (経路探索用)
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        state["_adjacency"] = {}
+        return state
+
+    def edge_count(self):
+        return len(self.indices) // 2
+
+    def adjacency(self, kinds=PASSABLE_KINDS):
+        """行ごとの隣接先の行のリストを返す (辺の種類ごとに一度だけ作る)。"""
+        kinds = tuple(kinds)
+        adjacency = self._adjacency.get(kinds)
+        if adjacency is None:
+            codes = [KINDS.index(kind) for kind in kinds]
+            keep = np.isin(self.kinds, codes)
+            indices = self.indices.tolist()
+            keep = keep.tolist()
+            indptr = self.indptr.tolist()
+            adjacency = [[indices[i] for i in range(indptr[row], indptr[row + 1]) if keep[i]] for row in range(len(indptr) - 1)]
+            self._adjacency[kinds] = adjacency
+        return adjacency
+
+    def neighbours(self, province_id, kinds=PASSABLE_KINDS):
+        """隣接するプロビンスIDのリストを返す。"""
+        row = self.row_of.get(int(province_id))
+        if row is None:
+            return []
+        province_ids = self.province_ids
+        return [int(province_ids[i]) for i in self.adjacency(kinds)[row]]
+
+    def edges_of(self, province_id):
+        """隣接先ごとの (プロビンスID, 辺の種類, 通るプロビンスID) のリストを返す。"""
+        row = self.row_of.get(int(province_id))
+        if row is None:
+            return []
+        start, end = int(self.indptr[row]), int(self.indptr[row + 1])
+        return [(int(self.province_ids[i]), KINDS[kind], int(through))
+                for i, kind, through in zip(self.indices[start:end].tolist(), self.kinds[start:end].tolist(), self.through[start:end].tolist())]
+
+    def components(self, province_ids, kinds=PASSABLE_KINDS):
+        """province_ids の中だけを通ってつながっているまとまりに分けて返す。"""
+        adjacency = self.adjacency(kinds)
+        rows = {self.row_of[int(p)] for p in province_ids if int(p) in self.row_of}
+        remaining = set(rows)
+        components = []
+        while remaining:
+            start = remaining.pop()
+            component = [start]
+            queue = [start]
+            while queue:
+                for neighbour in adjacency[queue.pop()]:
+                    if neighbour in remaining:
+                        remaining.discard(neighbour)
+                        component.append(neighbour)
+                        queue.append(neighbour)
+            components.append(sorted(int(self.province_ids[row]) for row in component))
+        components.sort(key=len, reverse=True)
+        return components
+
+    def is_contiguous(self, province_ids, kinds=PASSABLE_KINDS):
+        return len(self.components(province_ids, kinds)) <= 1
+
+    def path(self, source, target, allowed=None, kinds=PASSABLE_KINDS):
+        """
+        source から target までの最短経路 (辺の数) のプロビンスIDのリストを返す。無ければ None。
+
+        Args:
+            allowed (set[int]): 途中で通ってよいプロビンスID (None なら制限なし)
+        """
+        source_row = self.row_of.get(int(source))
+        target_row = self.row_of.get(int(target))
+        if source_row is None or target_row is None:
+            return None
+        if source_row == target_row:
+            return [int(source)]
+        adjacency = self.adjacency(kinds)
+        allowed_rows = None
+        if allowed is not None:
+            allowed_rows = {self.row_of[int(p)] for p in allowed if int(p) in self.row_of}
+            allowed_rows.update((source_row, target_row))
+        # 両端から1段ずつ広げ (小さい方の側から)、出会った段で最も短くなる点を選ぶ
+        parents = ({source_row: None}, {target_row: None})
+        depths = ({source_row: 0}, {target_row: 0})
+        frontiers = ([source_row], [target_row])
+        while frontiers[0] and frontiers[1]:
+            side = 0 if len(frontiers[0]) <= len(frontiers[1]) else 1
+            parent, depth = parents[side], depths[side]
+            other_depth = depths[1 - side]
+            next_frontier = []
+            meeting = None
+            for row in frontiers[side]:
+                next_depth = depth[row] + 1
+                for neighbour in adjacency[row]:
+                    if neighbour in parent or (allowed_rows is not None and neighbour not in allowed_rows):
+                        continue
+                    parent[neighbour] = row
+                    depth[neighbour] = next_depth
+                    next_frontier.append(neighbour)
+                    if neighbour in other_depth and (meeting is None or other_depth[neighbour] < other_depth[meeting]):
+                        meeting = neighbour
+            if meeting is not None:
+                forward = []
+                row = meeting
+                while row is not None:
+                    forward.append(row)
+                    row = parents[0][row]
+                backward = []
+                row = parents[1][meeting]
+                while row is not None:
+                    backward.append(row)
+                    row = parents[1][row]
+                return [int(self.province_ids[row]) for row in forward[::-1] + backward]
+            frontiers = (next_frontier, frontiers[1]) if side == 0 else (frontiers[0], next_frontier)
+        return None
+
+
+def build_province_graph(filepath, definition_rows, adjacency_rows):
+    """
+    provinces.bmp と adjacencies.csv から隣接グラフを作る。
+
+    Args:
+        filepath (str): provinces.bmp のパス
+        definition_rows (list[tuple]): definition.csv をパースした結果
+        adjacency_rows (list[tuple]): parse_adjacencies_csv() の結果
+    """
+    province_ids = np.array([row[0] for row in definition_rows], dtype=np.int64)
+    row_of = {province_id: row for row, province_id in enumerate(province_ids.tolist())}
+    a, b = bitmap_edges(filepath, definition_rows)
+    edges = {} # (小さい行, 大きい行) -> (種類, 通るプロビンスID)
+    border = KINDS.index("border")
+    for low, high in zip(a.tolist(), b.tolist()):
+        edges[(low, high)] = (border, -1)
+    for source, target, adjacency_type, through in adjacency_rows:
+        if source not in row_of or target not in row_of or source == target:
+            continue
+        key = (min(row_of[source], row_of[target]), max(row_of[source], row_of[target]))
+        if adjacency_type == "impassable":
+            edges[key] = (KINDS.index("impassable"), -1)
+        elif key not in edges: # すでに接している組はそのまま
+            edges[key] = (KINDS.index("sea" if adjacency_type == "sea" else "land"), through)
+
+    size = len(province_ids)
+    count = len(edges)
+    low = np.fromiter((key[0] for key in edges), dtype=np.int32, count=count)
+    high = np.fromiter((key[1] for key in edges), dtype=np.int32, count=count)
+    kinds = np.fromiter((value[0] for value in edges.values()), dtype=np.uint8, count=count)
+    through = np.fromiter((value[1] for value in edges.values()), dtype=np.int32, count=count)
+    # 両向きの辺にして行の順に並べる
+    sources = np.concatenate([low, high])
+    targets = np.concatenate([high, low])
+    order = np.lexsort((targets, sources))
+    indptr = np.zeros(size + 1, dtype=np.int32)
+    np.cumsum(np.bincount(sources, minlength=size), out=indptr[1:])
+    return ProvinceGraph(province_ids, indptr, targets[order], np.concatenate([kinds, kinds])[order], np.concatenate([through, through])[order])
+
+
+def load_province_graph(filepath, definition_path, adjacencies_path, definition_rows, cache=None):
+    """
+    隣接グラフをパースキャッシュから返す。provinces.bmp・definition.csv・adjacencies.csv のどれかが変わっていれば作り直す。
+    """
+    stamp = [GRAPH_VERSION]
+    for path in (definition_path, adjacencies_path):
+        try:
+            stat = os.stat(path)
+            stamp.append((stat.st_mtime_ns, stat.st_size))
+        except OSError:
+            stamp.append(None)
+    stamp = tuple(stamp)
+    if cache is not None:
+        record = cache.lookup("province_graph", filepath)
+        if record is not None and record[0][0] == stamp:
+            return record[0][1]
+    adjacency_rows = parse_adjacencies_csv(adjacencies_path) if os.path.exists(adjacencies_path) else []
+    graph = build_province_graph(filepath, definition_rows, adjacency_rows)
+    if cache is not None:
+        cache.store("province_graph", filepath, ((stamp, graph),))
+    return graph
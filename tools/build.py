@@ -0,0 +1,265 @@
+import argparse
+import glob
+import json
+import os
+import shutil
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from parse_cache import file_digest
+
+# 生成ファイルのビルド (make のように、入力が変わったものだけを作り直す)
+# リポジトリ直下で実行する。例:
+#   python tools/build.py              既定のターゲットをビルドする
+#   python tools/build.py states       history/states を 000_state.py で書き換える
+#   python tools/build.py --list       ターゲットの一覧
+# ターゲットごとに入力・出力・コマンド・modへの配置先を宣言し、ファイルの内容のハッシュを .cache/build_state.json に記録する。
+# ハッシュは更新日時とサイズが変わったファイルだけ計算し直すので、何も変わっていなければ数ミリ秒で終わり、ファイルにも触れない。
+# 配置先には最後に配置した内容のハッシュも記録し、その後に手で変更された配置先は上書きしない (--force で上書きする)。
+
+STATE_PATH = os.path.join(".cache", "build_state.json")
+STATE_VERSION = 1
+
+# ターゲットの宣言
+#   inputs: 入力 (glob のパターン可)。変わると作り直す
+#   outputs: コマンドが作るファイル。無ければ作り直す
+#   command: リポジトリ直下で実行するコマンド
+#   install: 出力 -> modの配置先。内容が違えばコピーする
+#   after: 先にビルドするターゲット
+#   default: 引数なしで実行したときにビルドするか。
+#            history の書き換えスクリプトはファイルをその場で書き換えて元に戻せないので、名前を指定したときだけ実行する
+TARGETS = {
+    "cosmetic": {
+        "inputs": ["tools/cosmetic_maker.py", "tools/input/input.tsv"],
+        "outputs": ["tools/output/hoi4_localisation.yml", "tools/output/startup_cosmetic_tag.txt", "tools/output/colors.txt"],
+        "command": [sys.executable, "tools/cosmetic_maker.py"],
+        # common/scripted_effects/01_startup.txt と common/countries/cosmetic.txt は手で管理しているので配置しない
+        # (tools/output の startup_cosmetic_tag.txt と colors.txt と見比べて取り込む)
+        "install": {
+            "tools/output/hoi4_localisation.yml": "localisation/japanese/country_name/00_cosmetic_countries_l_japanese.yml",
+        },
+        "default": True,
+    },
+    "countries": {
+        "inputs": ["history/scripts/000_countries.py", "tools/country_generator.py", "history/scripts/countries.txt",
+                   "history/scripts/templates/*.txt", "history/scripts/countries.tsv", "history/countries/**/*.txt"],
+        "outputs": ["history/countries/**/*.txt"],
+        "command": [sys.executable, "history/scripts/000_countries.py"],
+        "default": False,
+    },
+    "states": {
+        "inputs": ["history/scripts/000_state.py", "history/states/**/*.txt"],
+        "outputs": ["history/states/**/*.txt"],
+        "command": [sys.executable, "history/scripts/000_state.py"],
+        "default": False,
+    },
+}
+
+
+def expand(patterns):
+    """glob のパターンを展開したパスのソートしたリストを返す (パターンでなければそのまま)。"""
+    paths = set()
+    for pattern in patterns:
+        if glob.has_magic(pattern):
+            paths.update(path.replace(os.sep, "/") for path in glob.glob(pattern, recursive=True))
+        else:
+            paths.add(pattern)
+    return sorted(paths)
+
+
+class BuildState:
+    """
+    ファイルのハッシュとターゲットごとの前回のビルドの記録。
+
+    files: パス -> [mtime_ns, size, ハッシュ]、targets: ターゲット名 -> 前回のビルド後の入力と出力のハッシュ、
+    installs: 配置先 -> このスクリプトが最後に配置した内容のハッシュ
+    """
+
+    def __init__(self, path=STATE_PATH):
+        self.path = path
+        self.files = {}
+        self.targets = {}
+        self.installs = {}
+        self.dirty = False
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("version") == STATE_VERSION:
+                self.files = data["files"]
+                self.targets = data["targets"]
+                self.installs = data.get("installs", {})
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError, KeyError) as e:
+            print(f"Discarding build state {path}: {e}")
+
+    def digest(self, path):
+        """ファイルの内容のハッシュを返す。無ければ None。更新日時とサイズが前回と同じなら記録したハッシュを使う。"""
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        entry = self.files.get(path)
+        if entry is not None and entry[0] == stat.st_mtime_ns and entry[1] == stat.st_size:
+            return entry[2]
+        digest = file_digest(path)
+        self.files[path] = [stat.st_mtime_ns, stat.st_size, digest]
+        self.dirty = True
+        return digest
+
+    def signature(self, target):
+        """ターゲットの入力と出力のハッシュ (パス -> ハッシュ)。"""
+        return {path: self.digest(path) for path in expand(target["inputs"] + target["outputs"])}
+
+    def save(self):
+        if not self.dirty:
+            return
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        temp_path = self.path + ".tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump({"version": STATE_VERSION, "files": self.files, "targets": self.targets, "installs": self.installs}, f)
+        os.replace(temp_path, self.path)
+        self.dirty = False
+
+
+def is_stale(state, name, target):
+    """前回のビルドから入力か出力が変わっていれば (または出力が無ければ) True。"""
+    signature = state.signature(target)
+    if any(signature.get(path) is None for path in expand(target["outputs"])):
+        return True
+    return state.targets.get(name) != signature
+
+
+def stale_installs(state, target):
+    """
+    内容が出力と違う (または無い) 配置先の (出力, 配置先, 手で変更されたか) のリストを返す。
+
+    既存の配置先が最後に配置した内容と違えば、手で変更されたとみなす。
+    一度も配置していない既存のファイルも、手で管理されているかもしれないので同じように扱う。
+    """
+    stale = []
+    for source, destination in target.get("install", {}).items():
+        source_digest = state.digest(source)
+        destination_digest = state.digest(destination)
+        if source_digest is None or source_digest == destination_digest:
+            continue
+        modified = destination_digest is not None and state.installs.get(destination) != destination_digest
+        stale.append((source, destination, modified))
+    return stale
+
+
+def run_target(name, target, verbose=False):
+    """コマンドを実行する。成功すれば True。"""
+    started = time.perf_counter()
+    result = subprocess.run(target["command"], capture_output=True, text=True, encoding="utf-8", errors="replace")
+    if verbose or result.returncode != 0:
+        sys.stdout.write(result.stdout)
+        sys.stderr.write(result.stderr)
+    if result.returncode != 0:
+        print(f"エラー: {name} が失敗しました (終了コード {result.returncode})", file=sys.stderr)
+        return False
+    print(f"{name}: ビルドしました ({time.perf_counter() - started:.2f} 秒)")
+    return True
+
+
+def build_order(names):
+    """after を先にした、並列に実行できるターゲットの組のリストを返す。"""
+    required = set()
+    stack = list(names)
+    while stack:
+        name = stack.pop()
+        if name not in required:
+            required.add(name)
+            stack.extend(TARGETS[name].get("after", ()))
+    waves = []
+    done = set()
+    while required - done:
+        wave = sorted(name for name in required - done if set(TARGETS[name].get("after", ())) <= done)
+        if not wave:
+            raise ValueError(f"ターゲットの after が循環しています: {', '.join(sorted(required - done))}")
+        waves.append(wave)
+        done.update(wave)
+    return waves
+
+
+def build(names, force=False, dry_run=False, jobs=None, verbose=False, state=None):
+    """
+    ターゲットをビルドし、modへ配置する。
+
+    Returns:
+        bool: すべて成功すれば True
+    """
+    state = state or BuildState()
+    ok = True
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        for wave in build_order(names):
+            stale = [name for name in wave if force or is_stale(state, name, TARGETS[name])]
+            if dry_run:
+                for name in stale:
+                    print(f"{name}: ビルドします")
+            else:
+                results = dict(zip(stale, executor.map(lambda name: run_target(name, TARGETS[name], verbose), stale)))
+                for name, succeeded in results.items():
+                    if succeeded:
+                        state.targets[name] = state.signature(TARGETS[name])
+                        state.dirty = True
+                    else:
+                        ok = False
+                if not ok:
+                    break # 後のターゲットは失敗したものに依存しているかもしれない
+            for name in wave:
+                for source, destination, modified in stale_installs(state, TARGETS[name]):
+                    if modified and not force:
+                        print(f"エラー: {name}: {destination} はこのスクリプトが最後に配置した内容と違う (手で変更されている) ため上書きしません "
+                              f"({source} と見比べて取り込むか、--force で上書きしてください)", file=sys.stderr)
+                        ok = False
+                        continue
+                    if dry_run:
+                        print(f"{name}: {source} を {destination} に配置します")
+                        continue
+                    os.makedirs(os.path.dirname(destination) or ".", exist_ok=True)
+                    shutil.copyfile(source, destination)
+                    state.installs[destination] = state.digest(destination)
+                    state.dirty = True
+                    print(f"{name}: {source} を {destination} に配置しました")
+    state.save()
+    return ok
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="生成ファイルのビルド (入力が変わったターゲットだけを作り直してmodに配置する)")
+    parser.add_argument("targets", nargs="*", help="ビルドするターゲット (省略時は既定のターゲット)")
+    parser.add_argument("--list", action="store_true", help="ターゲットの一覧と、作り直しが必要かを表示する")
+    parser.add_argument("--force", action="store_true", help="変更が無くても作り直し、手で変更された配置先も上書きする")
+    parser.add_argument("--dry-run", action="store_true", help="実行せずに、作り直すターゲットと配置するファイルを表示する")
+    parser.add_argument("--jobs", type=int, default=None, help="並列に実行するターゲットの数 (省略時はCPUコア数に応じて決まる)")
+    parser.add_argument("--verbose", action="store_true", help="コマンドの出力を表示する")
+    args = parser.parse_args(argv)
+
+    unknown = [name for name in args.targets if name not in TARGETS]
+    if unknown:
+        print(f"エラー: ターゲットがありません: {', '.join(unknown)} (使えるターゲット: {', '.join(TARGETS)})", file=sys.stderr)
+        return 1
+    if args.list:
+        state = BuildState()
+        for name, target in TARGETS.items():
+            installs = stale_installs(state, target)
+            if any(modified for _, _, modified in installs):
+                status = "配置先が変更済み"
+            elif is_stale(state, name, target) or installs:
+                status = "要ビルド"
+            else:
+                status = "最新"
+            print(f"{name}\t{status}\t{'既定' if target.get('default') else ''}")
+        state.save()
+        return 0
+    names = args.targets or [name for name, target in TARGETS.items() if target.get("default")]
+    return 0 if build(names, args.force, args.dry_run, args.jobs, args.verbose) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
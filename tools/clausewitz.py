@@ -0,0 +1,518 @@
+import bisect
+import re
+
+# Clausewitz スクリプト (key = value / { } 形式) のトークナイザとツリービルダー
+# トークン化は1ファイル1パスで行い、その際に括弧の対応も記録しておく。
+# ブロックの中身は最初にアクセスされたときに初めて展開する (遅延展開)。
+
+# パース結果に影響する変更をしたら上げる (キャッシュの無効化に使う)
+PARSER_VERSION = 1
+
+WORD = 0
+STRING = 1
+OPERATOR = 2
+OPEN = 3
+CLOSE = 4
+
+_TOKEN_RE = re.compile(r'''
+    (?P<space>[\s﻿]+)
+  | (?P<comment>\#[^\n]*)
+  | (?P<string>"(?:[^"\\]|\\.)*"?)
+  | (?P<operator><=|>=|!=|==|=|<|>)
+  | (?P<open>\{)
+  | (?P<close>\})
+  | (?P<word>[^\s=<>{}"#]+)
+''', re.VERBOSE)
+
+_KINDS = {"string": STRING, "operator": OPERATOR, "open": OPEN, "close": CLOSE, "word": WORD}
+
+
+class ClausewitzSyntaxError(ValueError):
+    pass
+
+
+class Document:
+    """
+    トークン化済みのスクリプト。
+
+    トークンは種類・文字列・開始位置・終了位置の並列リストで保持する。
+    match[i] は OPEN/CLOSE トークンの対応する括弧のインデックス。
+    """
+    __slots__ = ("text", "kinds", "values", "starts", "ends", "match")
+
+    def __init__(self, text):
+        self.text = text
+        self.kinds = []
+        self.values = []
+        self.starts = []
+        self.ends = []
+        self.match = {}
+        self._tokenize()
+
+    def _tokenize(self):
+        kinds, values, starts, ends, match = self.kinds, self.values, self.starts, self.ends, self.match
+        stack = []
+        for m in _TOKEN_RE.finditer(self.text):
+            group = m.lastgroup
+            if group == "space" or group == "comment":
+                continue
+            kind = _KINDS[group]
+            index = len(kinds)
+            if kind == OPEN:
+                stack.append(index)
+            elif kind == CLOSE:
+                if not stack:
+                    raise ClausewitzSyntaxError(f"unexpected '}}' at line {self.line_of(m.start())}")
+                opening = stack.pop()
+                match[opening] = index
+                match[index] = opening
+            kinds.append(kind)
+            values.append(m.group())
+            starts.append(m.start())
+            ends.append(m.end())
+        if stack:
+            raise ClausewitzSyntaxError(f"unclosed '{{' at line {self.line_of(self.starts[stack[-1]])}")
+
+    def line_of(self, offset):
+        return self.text.count("\n", 0, offset) + 1
+
+    def root(self):
+        return Block(self, 0, len(self.kinds))
+
+
+class Entry:
+    """
+    ブロック内の1要素。
+
+    key = value の文なら key/operator/value が入り、
+    { 1 2 3 } のような値だけの要素なら key と operator は None になる。
+    start/end は元テキスト上の文字オフセット (end は値の直後)。
+    """
+    __slots__ = ("key", "operator", "value", "start", "end")
+
+    def __init__(self, key, operator, value, start, end):
+        self.key = key
+        self.operator = operator
+        self.value = value
+        self.start = start
+        self.end = end
+
+    def __repr__(self):
+        return f"Entry({self.key!r}, {self.operator!r}, {self.value!r})"
+
+
+class Block:
+    """
+    { } で囲まれたブロック (またはファイル全体)。
+
+    中身の Entry は最初のアクセス時に展開され、入れ子のブロックは
+    さらにアクセスされるまで展開されない。
+    color = rgb { 1 2 3 } のような型付きブロックは tag に "rgb" が入る。
+    """
+    __slots__ = ("document", "first", "last", "tag", "_entries")
+
+    def __init__(self, document, first, last, tag=None):
+        self.document = document
+        self.first = first # 最初の中身トークンのインデックス
+        self.last = last # 閉じ括弧のインデックス (ファイル全体ならトークン数)
+        self.tag = tag
+        self._entries = None
+
+    @property
+    def entries(self):
+        if self._entries is None:
+            self._entries = self._materialize()
+        return self._entries
+
+    def _materialize(self):
+        document = self.document
+        kinds, values, starts, ends, match = document.kinds, document.values, document.starts, document.ends, document.match
+        entries = []
+        i = self.first
+        last = self.last
+        while i < last:
+            kind = kinds[i]
+            if kind == OPEN:
+                closing = match[i]
+                entries.append(Entry(None, None, Block(document, i + 1, closing), starts[i], ends[closing]))
+                i = closing + 1
+                continue
+            if kind == OPERATOR:
+                raise ClausewitzSyntaxError(f"unexpected '{values[i]}' at line {document.line_of(starts[i])}")
+            if i + 1 < last and kinds[i + 1] == OPERATOR:
+                if i + 2 >= last:
+                    raise ClausewitzSyntaxError(f"missing value after '{values[i]}' at line {document.line_of(starts[i])}")
+                key = _scalar(kinds[i], values[i])
+                operator = values[i + 1]
+                value, i_next, end = self._read_value(i + 2)
+                entries.append(Entry(key, operator, value, starts[i], end))
+                i = i_next
+                continue
+            entries.append(Entry(None, None, _scalar(kind, values[i]), starts[i], ends[i]))
+            i += 1
+        return entries
+
+    def _read_value(self, i):
+        document = self.document
+        kinds, values, match = document.kinds, document.values, document.match
+        kind = kinds[i]
+        if kind == OPEN:
+            closing = match[i]
+            return Block(document, i + 1, closing), closing + 1, document.ends[closing]
+        if kind == WORD and i + 1 < self.last and kinds[i + 1] == OPEN:
+            closing = match[i + 1]
+            return Block(document, i + 2, closing, tag=values[i]), closing + 1, document.ends[closing]
+        if kind == CLOSE or kind == OPERATOR:
+            raise ClausewitzSyntaxError(f"unexpected '{values[i]}' at line {document.line_of(document.starts[i])}")
+        return _scalar(kind, values[i]), i + 1, document.ends[i]
+
+    def __iter__(self):
+        return iter(self.entries)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, key):
+        return any(entry.key == key for entry in self.entries)
+
+    def find(self, key):
+        for entry in self.entries:
+            if entry.key == key:
+                return entry
+        return None
+
+    def get(self, key, default=None):
+        entry = self.find(key)
+        return entry.value if entry is not None else default
+
+    def get_all(self, key):
+        return [entry.value for entry in self.entries if entry.key == key]
+
+    def keys(self):
+        return [entry.key for entry in self.entries if entry.key is not None]
+
+    def values(self):
+        """値だけの要素 (provinces = { 1 2 3 } の 1 2 3 など) を返す。"""
+        return [entry.value for entry in self.entries if entry.key is None and not isinstance(entry.value, Block)]
+
+    @property
+    def start(self):
+        """開き括弧の直後の文字オフセット。"""
+        if self.first == 0:
+            return 0
+        return self.document.ends[self.first - 1]
+
+    @property
+    def end(self):
+        """閉じ括弧の文字オフセット。"""
+        if self.last >= len(self.document.kinds):
+            return len(self.document.text)
+        return self.document.starts[self.last]
+
+    def __repr__(self):
+        tag = f"{self.tag} " if self.tag else ""
+        return f"Block({tag}{len(self.entries)} entries)"
+
+
+def _scalar(kind, value):
+    if kind == STRING:
+        return value[1:-1] if value.endswith('"') and len(value) > 1 else value[1:]
+    return value
+
+
+def parse_text(text):
+    """
+    スクリプト文字列をパースしてルートブロックを返す。
+
+    Args:
+        text (str): スクリプトの内容
+
+    Returns:
+        Block: ファイル全体を表すブロック
+    """
+    return Document(text).root()
+
+
+def parse_file(filepath, encoding="utf-8-sig"):
+    """
+    スクリプトファイルをパースしてルートブロックを返す。BOM の有無は問わない。
+
+    Args:
+        filepath (str): ファイルのパス
+        encoding (str): 文字コード
+    """
+    with open(filepath, "r", encoding=encoding) as f:
+        return parse_text(f.read())
+
+
+def walk(block):
+    """ブロック以下の全 Entry を深さ優先で列挙する。"""
+    for entry in block:
+        yield entry
+        if isinstance(entry.value, Block):
+            yield from walk(entry.value)
+
+
+def delete_entries(text, entries):
+    """
+    指定した Entry を元テキストから取り除いた文字列を返す。
+    削除後に空白だけになった行は行ごと削除する。
+
+    Args:
+        text (str): パース元のテキスト
+        entries (list[Entry]): 削除する要素 (同じテキストからパースしたもの)
+    """
+    spans = sorted((entry.start, entry.end) for entry in entries)
+    pieces = []
+    position = 0
+    for start, end in spans:
+        if start < position: # 親ごと削除済みの要素は無視
+            continue
+        line_start = text.rfind("\n", 0, start) + 1
+        line_end = text.find("\n", end)
+        line_end = len(text) if line_end == -1 else line_end
+        rest = text[end:line_end].strip()
+        if not text[line_start:start].strip() and (not rest or rest.startswith("#")):
+            # 行全体が削除対象なら改行 (と行末コメント) ごと消す
+            start = max(line_start, position)
+            end = min(line_end + 1, len(text))
+        pieces.append(text[position:start])
+        position = end
+    pieces.append(text[position:])
+    return "".join(pieces)
+
+
+# ---- 元テキストを保ったままの編集 ----
+# 編集は (開始オフセット, 終了オフセット, 置き換える文字列) のタプルで表し、apply_edits() で元テキストに適用する。
+# 編集しない部分 (コメント・空白・改行コード・手で整えた書式) は1文字も変えないので、変更の無いファイルは元と完全に一致する。
+# 挿入する文のインデントと改行コードは、近くの行とファイルの書き方に合わせる。
+
+
+def apply_edits(text, edits):
+    """
+    編集を元テキストに適用した文字列を返す。編集が無ければ text をそのまま返す。
+
+    Args:
+        text (str): パース元のテキスト
+        edits (list[tuple[int, int, str]]): (開始, 終了, 置き換える文字列)。挿入は開始と終了が同じ
+
+    Raises:
+        ValueError: 編集の範囲が重なっている場合
+    """
+    if not edits:
+        return text
+    pieces = []
+    position = 0
+    for start, end, replacement in sorted(edits, key=lambda edit: (edit[0], edit[1])):
+        if start < position:
+            raise ValueError(f"編集の範囲が重なっています (line {text.count(chr(10), 0, start) + 1})")
+        pieces.append(text[position:start])
+        pieces.append(replacement)
+        position = end
+    pieces.append(text[position:])
+    return "".join(pieces)
+
+
+def newline_of(text):
+    """テキストの改行コード (CRLF のファイルなら "\\r\\n")。"""
+    return "\r\n" if "\r\n" in text else "\n"
+
+
+def _line_start(text, offset):
+    return text.rfind("\n", 0, offset) + 1
+
+
+def _line_end(text, offset):
+    """offset を含む行の改行コードの直前のオフセット。"""
+    end = text.find("\n", offset)
+    if end == -1:
+        return len(text)
+    return end - 1 if end > 0 and text[end - 1] == "\r" else end
+
+
+def _indent_before(text, offset):
+    """offset が行の最初のトークンならその行のインデント、そうでなければ None。"""
+    line_start = _line_start(text, offset)
+    prefix = text[line_start:offset]
+    return prefix if not prefix.strip() else None
+
+
+def _line_span(text, start, end):
+    """start から end がコメントを除いて行全体なら、改行 (と行末コメント) を含む行の範囲を返す。そうでなければ None。"""
+    line_start = _line_start(text, start)
+    line_end = text.find("\n", end)
+    line_end = len(text) if line_end == -1 else line_end
+    rest = text[end:line_end].strip()
+    if text[line_start:start].strip() or (rest and not rest.startswith("#")):
+        return None
+    return line_start, min(line_end + 1, len(text))
+
+
+def _run_deletion(text, start, end):
+    """
+    同じ行で続けて取り除く値 (start から end) を削除する範囲。
+    行に他に何も無ければ行ごと、行頭から始まれば後ろの空白ごと、そうでなければ前の空白ごと削除する。
+    """
+    span = _line_span(text, start, end)
+    if span is not None:
+        return span
+    if _indent_before(text, start) is not None:
+        after = end
+        while after < len(text) and text[after] in " \t":
+            after += 1
+        return start, after
+    before = start
+    while before > 0 and text[before - 1] in " \t":
+        before -= 1
+    return before, end
+
+
+def _opening_indent(text, block):
+    """ブロックの開き括弧がある行のインデント。"""
+    line = text[_line_start(text, block.start):block.start]
+    return line[:len(line) - len(line.lstrip(" \t"))]
+
+
+def _child_indent(text, block):
+    """ブロックの中に新しい行を挿入するときのインデント。既存の文の行に合わせる。"""
+    for entry in block.entries:
+        indent = _indent_before(text, entry.start)
+        if indent is not None:
+            return indent
+    if block.first == 0: # ファイル全体
+        return ""
+    closing = _indent_before(text, block.end)
+    if closing is None: # 閉じ括弧が行頭に無い ({ 1 2 } など) なら開き括弧の行に合わせる
+        closing = _opening_indent(text, block)
+    return closing + "\t"
+
+
+def _insert_lines(text, block, lines):
+    """ブロックの閉じ括弧の前に行を挿入する編集を返す。"""
+    newline = newline_of(text)
+    body = "".join(_child_indent(text, block) + line + newline for line in lines)
+    end = block.end
+    if block.last >= len(block.document.kinds): # ファイル全体なら末尾に追加する
+        if text and not text.endswith("\n"):
+            body = newline + body
+        return end, end, body
+    if _indent_before(text, end) is not None: # 閉じ括弧が行頭にあればその行の前に入れる
+        line_start = _line_start(text, end)
+        return line_start, line_start, body
+    # 閉じ括弧が行の途中にある ({ id = 1 } や { }) なら、閉じ括弧を次の行に送る
+    start = end
+    while start > block.start and text[start - 1] in " \t":
+        start -= 1
+    return start, end, newline + body + _opening_indent(text, block)
+
+
+def insert_entry(text, block, key, value_lines):
+    """
+    ブロックの最後に key = ... の文を追加する編集を返す。
+
+    Args:
+        text (str): パース元のテキスト
+        block (Block): 追加先のブロック (同じテキストからパースしたもの)
+        key (str): キー
+        value_lines (list[str] | str): 文字列ならそのまま値にする。リストなら { } の中に1行ずつ入れる
+
+    Returns:
+        list[tuple[int, int, str]]: apply_edits() に渡す編集
+    """
+    if isinstance(value_lines, str):
+        return [_insert_lines(text, block, [f"{key} = {value_lines}"])]
+    lines = [f"{key} = {{"] + [f"\t{line}" for line in value_lines] + ["}"]
+    return [_insert_lines(text, block, lines)]
+
+
+def set_block_values(text, block, values):
+    """
+    値だけのブロック (provinces = { 1 2 3 } など) の中身を values にする編集を返す。
+
+    残る値とその間のコメント・空白はそのままにして、無くなる値だけを削除し、増える値だけを挿入する。
+    既存の値が数値の昇順に並んでいれば新しい値も昇順の位置に、そうでなければ最後の値の後ろに入れる。
+    1行に1つずつ書かれたブロックには1行ずつ、1行にまとめて書かれたブロックには空白区切りで入れる。
+    キーのある文や入れ子のブロックには触れない。
+
+    Args:
+        text (str): パース元のテキスト
+        block (Block): 対象のブロック (同じテキストからパースしたもの)
+        values (list[str]): 新しい値
+
+    Returns:
+        list[tuple[int, int, str]]: apply_edits() に渡す編集
+    """
+    tokens = [entry for entry in block.entries if entry.key is None and not isinstance(entry.value, Block)]
+    wanted = list(dict.fromkeys(values))
+    wanted_set = set(wanted)
+    kept = []
+    existing = set()
+    runs = [] # 同じ行で続けて削除する値の [開始, 終了]
+    previous_removed = False
+    for entry in block.entries:
+        if entry.key is None and not isinstance(entry.value, Block):
+            if entry.value in wanted_set and entry.value not in existing: # 重複した値は最初の1つだけ残す
+                kept.append(entry)
+                existing.add(entry.value)
+            else:
+                if previous_removed and "\n" not in text[runs[-1][1]:entry.start]:
+                    runs[-1][1] = entry.end
+                else:
+                    runs.append([entry.start, entry.end])
+                previous_removed = True
+                continue
+        previous_removed = False
+    edits = [_run_deletion(text, start, end) + ("",) for start, end in runs]
+    added = [value for value in wanted if value not in existing]
+    if not added:
+        return edits
+
+    newline = newline_of(text)
+    if len(tokens) >= 2:
+        vertical = all(_line_span(text, entry.start, entry.end) is not None for entry in tokens)
+    elif tokens:
+        vertical = _line_span(text, tokens[0].start, tokens[0].end) is not None
+    else:
+        vertical = "\n" in text[block.start:block.end]
+
+    if not kept:
+        if vertical:
+            edits.append(_insert_lines(text, block, added))
+        elif text[block.start:block.end].strip():
+            position = block.end
+            prefix = "" if text[position - 1] in " \t" else " "
+            edits.append((position, position, prefix + " ".join(added) + " "))
+        else:
+            edits.append((block.start, block.end, " " + " ".join(added) + " "))
+        return edits
+
+    numeric = all(value.isdigit() for value in added) and all(entry.value.isdigit() for entry in kept)
+    ascending = numeric and all(int(a.value) < int(b.value) for a, b in zip(kept, kept[1:]))
+    kept_numbers = [int(entry.value) for entry in kept] if ascending else None
+    before_first = [] # 最初の値より前に入れる値
+    after = {} # id(残る値) -> その後ろに入れる値
+    for value in (sorted(added, key=int) if ascending else added):
+        anchor = kept[-1]
+        if ascending:
+            index = bisect.bisect_left(kept_numbers, int(value))
+            if index == 0:
+                before_first.append(value)
+                continue
+            anchor = kept[index - 1]
+        after.setdefault(id(anchor), (anchor, []))[1].append(value)
+
+    indent = _indent_before(text, kept[0].start) if vertical else None
+    if before_first:
+        first = kept[0]
+        if vertical:
+            line_start = _line_start(text, first.start)
+            edits.append((line_start, line_start, "".join(indent + value + newline for value in before_first)))
+        else:
+            edits.append((first.start, first.start, " ".join(before_first) + " "))
+    for anchor, anchor_values in after.values():
+        if vertical:
+            position = _line_end(text, anchor.end) # 行末コメントの後ろに入れる
+            edits.append((position, position, "".join(newline + _indent_before(text, anchor.start) + value for value in anchor_values)))
+        else:
+            edits.append((anchor.end, anchor.end, "".join(" " + value for value in anchor_values)))
+    return edits
@@ -1,84 +1,98 @@
+import hashlib
 import pandas as pd
 import os  # osモジュールをインポート
 
-def create_hoi4_loc_file(tsv_filepath, output_filepath):
+# input.tsv は1回だけ読み、3つの出力 (ローカライズ・startup_cosmetic_tag・colors.txt) を列ごとの文字列の連結でまとめて作る。
+# 出力は内容のハッシュが変わったときだけ書き込むので、変更の無いファイルは更新日時も変わらない。
+
+# 使う列と型 (すべて文字列として読む。空欄は欠損値)
+COLUMN_TYPES = {
+    'tag': str,
+    'cosmetic_tag': str,
+    'ローカライズ': str,
+    '色': str,
+}
+
+def read_cosmetic_tsv(tsv_filepath):
     """
-    tsvファイルからHoi4のローカライズファイル（.yml）を作成する。
+    tsvファイルから出力に使う列だけを読み込む。
 
     Args:
         tsv_filepath (str): 入力tsvファイルのパス
-        output_filepath (str): 出力ymlファイルのパス
     """
+    return pd.read_csv(tsv_filepath, sep='\t', usecols=list(COLUMN_TYPES), dtype=COLUMN_TYPES)
+
+def build_hoi4_loc_file(df):
+    """Hoi4のローカライズファイル（.yml）の内容を返す。"""
+    rows = df[df['cosmetic_tag'].notna() & df['ローカライズ'].notna()] # cosmetic_tagとローカライズが存在する場合のみ出力
+    tag = rows['cosmetic_tag']
+    text = rows['ローカライズ']
+    lines = ' ' + tag + ': "' + text + '"\n ' + tag + '_DEF: "' + text + '"\n'
+    return 'l_japanese:\n' + ''.join(lines.tolist())
+
+def build_hoi4_startup_script(df):
+    """Hoi4のstartup_cosmetic_tagスクリプト（.txt）の内容を返す。"""
+    rows = df[df['tag'].notna() & df['cosmetic_tag'].notna()] # tagとcosmetic_tagが存在する場合のみ出力
+    blocks = '    ' + rows['tag'] + ' = {\n        set_cosmetic_tag = ' + rows['cosmetic_tag'] + '\n    }\n'
+    return 'startup_cosmetic_tag = {\n' + ''.join(blocks.tolist()) + '}\n'
+
+def build_hoi4_colors_file(df):
+    """Hoi4 の colors.txt の内容を返す。"""
+    rows = df[df['色'].notna()] # 色が存在する場合のみ出力
+    tag = rows['cosmetic_tag'].fillna('nan') # 欠損値は従来どおり nan と書く
+    color = rows['色']
+    blocks = ('#' + rows['ローカライズ'].fillna('nan') + '/' + tag + '\n' +
+              tag + ' = {\n    color = rgb{ ' + color + ' }\n    color_ui = rgb{ ' + color + ' }\n}\n')
+    return ''.join(blocks.tolist())
+
+def write_if_changed(output_filepath, content, encoding):
+    """
+    内容のハッシュが既存のファイルと異なる場合だけ書き込む。
 
-    df = pd.read_csv(tsv_filepath, sep='\t')
-
-    with open(output_filepath, 'w', encoding='utf-8-sig') as f:
-        f.write('l_japanese:\n') # BOM付きUTF-8で出力
-
-        for index, row in df.iterrows():
-            cosmetic_tag = row['cosmetic_tag']
-            localization_text = row['ローカライズ']
-
-            if pd.notna(cosmetic_tag) and pd.notna(localization_text): # cosmetic_tagとローカライズが存在する場合のみ出力
-                f.write(f' {cosmetic_tag}: "{localization_text}"\n')
-                f.write(f' {cosmetic_tag}_DEF: "{localization_text}"\n')
-
-def create_hoi4_startup_script(tsv_filepath, output_filepath):
+    Returns:
+        bool: 書き込んだ場合は True
+    """
+    data = content.replace('\n', os.linesep).encode(encoding) # テキストモードで書く場合と同じ改行にする
+    try:
+        with open(output_filepath, 'rb') as f:
+            if hashlib.sha256(f.read()).digest() == hashlib.sha256(data).digest():
+                return False
+    except FileNotFoundError:
+        pass
+    with open(output_filepath, 'wb') as f:
+        f.write(data)
+    return True
+
+def create_cosmetic_files(tsv_filepath, output_dir):
     """
-    tsvファイルからHoi4のstartup_cosmetic_tagスクリプト（.txt）を作成する。
+    tsvファイルを1回だけ読み、ローカライズ・startup_cosmetic_tag・colors.txt を出力する。
 
     Args:
         tsv_filepath (str): 入力tsvファイルのパス
-        output_filepath (str): 出力txtファイルのパス
-    """
-
-    df = pd.read_csv(tsv_filepath, sep='\t')
+        output_dir (str): 出力先のディレクトリ
 
-    with open(output_filepath, 'w', encoding='utf-8') as f:
-        f.write('startup_cosmetic_tag = {\n') # 変更: startup_cosmetic_tag 形式に変更
-
-        for index, row in df.iterrows():
-            tag = row['tag']
-            cosmetic_tag = row['cosmetic_tag']
-
-            if pd.notna(tag) and pd.notna(cosmetic_tag): # tagとcosmetic_tagが存在する場合のみ出力
-                f.write(f'    {tag} = {{\n') # インデントを調整
-                f.write(f'        set_cosmetic_tag = {cosmetic_tag}\n') # インデントを調整
-                f.write(f'    }}\n') # インデントを調整
-
-        f.write('}\n') # 変更: startup_cosmetic_tag 形式の閉じ括弧
-
-def create_hoi4_colors_file(tsv_file, output_file):
-    """
-    tsvファイルから Hoi4 の colors.txt ファイルを作成する。
+    Returns:
+        list[tuple[str, bool]]: (出力ファイルのパス, 書き込んだかどうか) のリスト
     """
-    df = pd.read_csv(tsv_file, sep='\t')
-    with open(output_file, 'w', encoding='utf-8') as f:
-        for index, row in df.iterrows():
-            color_value = row['色']
-            if pd.notna(color_value):
-                tag = row['cosmetic_tag']
-                loc = row['ローカライズ']
-                f.write(f'#{loc}/{tag}\n')
-                f.write(f'{tag} = {{\n')
-                f.write(f'    color = rgb{{ {color_value} }}\n')
-                f.write(f'    color_ui = rgb{{ {color_value} }}\n')
-                f.write(f'}}\n')
+    df = read_cosmetic_tsv(tsv_filepath)
+    outputs = [
+        ('hoi4_localisation.yml', build_hoi4_loc_file(df), 'utf-8-sig'), # BOM付きUTF-8で出力
+        ('startup_cosmetic_tag.txt', build_hoi4_startup_script(df), 'utf-8'),
+        ('colors.txt', build_hoi4_colors_file(df), 'utf-8'),
+    ]
+    results = []
+    for filename, content, encoding in outputs:
+        output_filepath = os.path.join(output_dir, filename)
+        results.append((output_filepath, write_if_changed(output_filepath, content, encoding)))
+    return results
 
 if __name__ == "__main__":
     script_dir = os.path.dirname(os.path.abspath(__file__)) # スクリプトのディレクトリを取得
     tsv_file = os.path.join(script_dir, 'input', 'input.tsv') # 入力tsvファイルパスを相対パスで指定
-    loc_output_file = os.path.join(script_dir, 'output', 'hoi4_localisation.yml') # ローカライズ出力ymlファイルパスを相対パスで指定
-    startup_output_file = os.path.join(script_dir, 'output', 'startup_cosmetic_tag.txt') # startup_cosmetic_tag出力txtファイルパスを相対パスで指定
-
-    create_hoi4_loc_file(tsv_file, loc_output_file)
-    print(f"{loc_output_file} を作成しました。")
-
-    create_hoi4_startup_script(tsv_file, startup_output_file)
-    print(f"{startup_output_file} を作成しました。")
-
-    # colors.txt を作成
-    create_hoi4_colors_file(tsv_file, os.path.join(script_dir, 'output', 'colors.txt'))
-    print(f"output/colors.txt を作成しました。")
-
+    output_dir = os.path.join(script_dir, 'output') # 出力先のディレクトリを相対パスで指定
 
+    for output_filepath, written in create_cosmetic_files(tsv_file, output_dir):
+        if written:
+            print(f"{output_filepath} を作成しました。")
+        else:
+            print(f"{output_filepath} は変更がないため書き込みませんでした。")
@@ -0,0 +1,136 @@
+import csv
+import difflib
+import os
+import re
+from string import Template
+
+# 国の履歴ファイル (history/countries/*.txt) をテンプレートから作る
+# 各ファイルは「capital = N」の行とテンプレートを変数で置き換えた内容からなる。
+# テンプレートは history/scripts/templates/<タグ>.txt があればそれを、無ければ history/scripts/countries.txt を使う
+# (TSV の template 列でファイル名を指定することもできる)。テンプレートの中の $変数 は次の値で置き換える。
+#   tag (タグ)、name (ファイル名のタグより後ろ。無ければタグ)、capital (ファイルの1行目の首都)、TSV のその国の行の列 (空欄以外)
+# 内容が変わらないファイルには書き込まず、書き込みは一時ファイルからの置き換えで行う。
+# history/scripts/000_countries.py から state_loader.parse_files() でプロセスプールに渡して使う。
+
+DEFAULT_TEMPLATE = "history/scripts/countries.txt"
+TEMPLATE_DIR = "history/scripts/templates"
+OVERRIDES_TSV = "history/scripts/countries.tsv"
+
+_CAPITAL = re.compile(r'\s*capital\s*=\s*(\d+)')
+_FILENAME = re.compile(r'([A-Z0-9]{3})(?:\s*-\s*(.+))?\.txt$')
+
+
+def read_overrides(tsv_filepath):
+    """
+    国ごとの変数を TSV から読む。1行目は見出しで、tag 列が必要。空欄は指定なしとして扱う。
+
+    Returns:
+        dict: タグ -> (列名 -> 値)
+    """
+    overrides = {}
+    if not os.path.exists(tsv_filepath):
+        return overrides
+    with open(tsv_filepath, 'r', encoding='utf-8-sig', newline='') as f:
+        reader = csv.DictReader(f, delimiter='\t')
+        if 'tag' not in (reader.fieldnames or ()):
+            raise ValueError(f"{tsv_filepath} に tag 列がありません")
+        for row in reader:
+            tag = (row.get('tag') or '').strip()
+            if tag:
+                overrides.setdefault(tag, {}).update({key: value.strip() for key, value in row.items()
+                                                      if key and value is not None and value.strip()})
+    return overrides
+
+
+def read_templates(default_template=DEFAULT_TEMPLATE, template_dir=TEMPLATE_DIR):
+    """
+    テンプレートを読む。
+
+    Returns:
+        dict: ファイル名 (template_dir の中) -> 内容。既定のテンプレートはキー None
+    """
+    with open(default_template, 'r', encoding='utf-8') as f:
+        templates = {None: f.read()}
+    if os.path.isdir(template_dir):
+        for filename in sorted(os.listdir(template_dir)):
+            if filename.endswith(".txt"):
+                with open(os.path.join(template_dir, filename), 'r', encoding='utf-8') as f:
+                    templates[filename] = f.read()
+    return templates
+
+
+def render_country(tag, variables, templates):
+    """
+    1つの国の履歴ファイルの内容を返す。
+
+    Args:
+        tag (str): タグ
+        variables (dict): テンプレートの変数 (capital を含む)
+        templates (dict): read_templates() の結果
+    """
+    template_name = variables.get('template')
+    if template_name:
+        if template_name not in templates:
+            raise ValueError(f"テンプレートがありません: {os.path.join(TEMPLATE_DIR, template_name)}")
+        template = templates[template_name]
+    else:
+        template = templates.get(f"{tag}.txt", templates[None])
+    return f"capital = {variables['capital']}\n" + Template(template).substitute(variables)
+
+
+def generate_country_file(filepath, templates, overrides, write=True, diff=False):
+    """
+    1つの国の履歴ファイルをテンプレートから作り直す。
+
+    Args:
+        filepath (str): 国の履歴ファイルのパス
+        templates (dict): read_templates() の結果
+        overrides (dict): read_overrides() の結果
+        write (bool): False なら書き込まない (dry-run)
+        diff (bool): True なら結果に unified diff を含める
+
+    Returns:
+        dict: filepath、tag、changed (内容が変わるか)、diff、error (作れなければそのメッセージ)
+    """
+    result = {"filepath": filepath, "tag": None, "changed": False, "diff": "", "error": None}
+    match = _FILENAME.search(os.path.basename(filepath))
+    if not match:
+        result["error"] = "ファイル名が「タグ - 名前.txt」か「タグ.txt」ではありません"
+        return result
+    tag, name = match.group(1), match.group(2) or match.group(1)
+    result["tag"] = tag
+    try:
+        with open(filepath, 'r', encoding='utf-8', newline='') as f:
+            content = f.read()
+        capital = _CAPITAL.match(content)
+        variables = {"tag": tag, "name": name, "capital": capital.group(1) if capital else None}
+        variables.update(overrides.get(tag, {}))
+        if variables["capital"] is None:
+            raise ValueError("1行目に capital がありません (TSV の capital 列で指定できます)")
+        new_content = render_country(tag, variables, templates)
+    except KeyError as e:
+        result["error"] = f"テンプレートの変数 {e} の値がありません"
+        return result
+    except (OSError, UnicodeDecodeError, ValueError) as e:
+        result["error"] = str(e)
+        return result
+    if "\r\n" in content:
+        new_content = new_content.replace("\n", "\r\n") # 元のファイルの改行コードに合わせる
+    if new_content == content:
+        return result
+    result["changed"] = True
+    if diff:
+        result["diff"] = "".join(difflib.unified_diff(content.splitlines(keepends=True), new_content.splitlines(keepends=True),
+                                                      fromfile=filepath, tofile=filepath))
+    if write:
+        temp_path = filepath + ".tmp"
+        try:
+            with open(temp_path, 'w', encoding='utf-8', newline='') as f:
+                f.write(new_content)
+            os.replace(temp_path, filepath)
+        except OSError as e:
+            result["error"] = str(e)
+            result["changed"] = False
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+    return result
@@ -0,0 +1,185 @@
+import os
+
+# ファイル編集のジャーナル
+# 編集はまずメモリ上に積んでおき (同じファイルへの変更はまとめる)、保存時に一括で書き込む。
+# 書き込みは一時ファイル + rename で行い、途中で失敗したら書き込み済みのファイルを元に戻す。
+# 元に戻す / やり直しはジャーナル上の内容を戻すだけで、ディスクへの反映は次の保存で行う。
+# 読み書きは改行コードを変換しないので、変更していない部分はバイト単位で元のファイルと一致する。
+
+
+class JournalCommitError(OSError):
+    pass
+
+
+def atomic_write(filepath, content, encoding="utf-8"):
+    """
+    一時ファイルに書き込んでから置き換えることで、書きかけのファイルが残らないようにする。
+
+    Args:
+        filepath (str): 書き込み先のパス
+        content (str): 書き込む内容
+        encoding (str): 文字コード
+    """
+    temp_path = _write_temp(filepath, content, encoding)
+    try:
+        os.replace(temp_path, filepath)
+    except OSError:
+        _remove_quietly(temp_path)
+        raise
+
+
+def _write_temp(filepath, content, encoding):
+    temp_path = filepath + ".tmp"
+    try:
+        with open(temp_path, "w", encoding=encoding, newline="") as f: # 改行コードは内容のまま書く
+            f.write(content)
+            f.flush()
+            os.fsync(f.fileno())
+    except OSError:
+        _remove_quietly(temp_path)
+        raise
+    return temp_path
+
+
+def _remove_quietly(filepath):
+    try:
+        os.remove(filepath)
+    except OSError:
+        pass
+
+
+class EditJournal:
+    """
+    複数ファイルにまたがる編集をまとめて扱うジャーナル。
+
+    record() で積んだ変更は commit() までディスクに書き込まない。
+    同じファイルを何度変更しても、commit() で書き込むのは最後の内容の1回だけ。
+
+    Args:
+        encoding (str): 対象ファイルの文字コード
+    """
+
+    def __init__(self, encoding="utf-8"):
+        self.encoding = encoding
+        self.saved = {} # パス -> ディスク上の内容 (最後に読み込んだ・保存した時点)
+        self.current = {} # パス -> ジャーナル上の最新の内容
+        self.undo_stack = [] # (ラベル, {パス: (変更前, 変更後)}) のリスト
+        self.redo_stack = []
+
+    def read(self, filepath):
+        """ジャーナル上の最新の内容を返す。まだ触っていないファイルならディスクから読む。"""
+        if filepath in self.current:
+            return self.current[filepath]
+        with open(filepath, "r", encoding=self.encoding, newline="") as f: # 改行コードを変換せずに読む (書き戻したときに元と一致させる)
+            content = f.read()
+        self.saved[filepath] = content
+        self.current[filepath] = content
+        return content
+
+    def record(self, label, contents):
+        """
+        1回分の編集 (元に戻す単位) を積む。
+
+        Args:
+            label (str): 編集の説明
+            contents (dict[str, str]): パス -> 変更後の内容
+        """
+        changes = {}
+        for filepath, content in contents.items():
+            before = self.read(filepath)
+            if before != content:
+                changes[filepath] = (before, content)
+                self.current[filepath] = content
+        if changes:
+            self.undo_stack.append((label, changes))
+            self.redo_stack = []
+        return changes
+
+    def pending_paths(self):
+        """保存されていない変更があるファイルのパス。"""
+        return [filepath for filepath, content in self.current.items() if content != self.saved.get(filepath)]
+
+    def has_pending(self):
+        return any(content != self.saved.get(filepath) for filepath, content in self.current.items())
+
+    def commit(self):
+        """
+        保存されていない変更をすべて書き込み、書き込んだパスのリストを返す。
+        1つでも失敗した場合は書き込み済みのファイルを元の内容に戻して JournalCommitError を送出する。
+        """
+        paths = self.pending_paths()
+        temp_paths = {}
+        try:
+            # 先に全ファイルを一時ファイルに書き出しておき、失敗したら何も置き換えない
+            for filepath in paths:
+                temp_paths[filepath] = _write_temp(filepath, self.current[filepath], self.encoding)
+        except OSError as e:
+            for temp_path in temp_paths.values():
+                _remove_quietly(temp_path)
+            raise JournalCommitError(f"Failed to write {filepath}: {e}") from e
+
+        replaced = []
+        try:
+            for filepath in paths:
+                os.replace(temp_paths[filepath], filepath)
+                replaced.append(filepath)
+        except OSError as e:
+            for temp_path in temp_paths.values():
+                _remove_quietly(temp_path)
+            for done_path in replaced:
+                try:
+                    atomic_write(done_path, self.saved[done_path], self.encoding)
+                except OSError as restore_error:
+                    print(f"Error restoring {done_path}: {restore_error}")
+            raise JournalCommitError(f"Failed to replace {filepath}: {e}") from e
+
+        for filepath in paths:
+            self.saved[filepath] = self.current[filepath]
+        return paths
+
+    def discard(self):
+        """保存されていない変更を捨て、変更のあったパスのリストを返す。元に戻す履歴も捨てる。"""
+        paths = self.pending_paths()
+        for filepath in paths:
+            self.current[filepath] = self.saved[filepath]
+        self.undo_stack = []
+        self.redo_stack = []
+        return paths
+
+    def can_undo(self):
+        return bool(self.undo_stack)
+
+    def can_redo(self):
+        return bool(self.redo_stack)
+
+    def undo(self):
+        """直前の編集を取り消し、(ラベル, 変更されたパスのリスト) を返す。"""
+        if not self.undo_stack:
+            return None
+        label, changes = self.undo_stack.pop()
+        for filepath, (before, _) in changes.items():
+            self.current[filepath] = before
+        self.redo_stack.append((label, changes))
+        return label, list(changes)
+
+    def redo(self):
+        """取り消した編集をやり直し、(ラベル, 変更されたパスのリスト) を返す。"""
+        if not self.redo_stack:
+            return None
+        label, changes = self.redo_stack.pop()
+        for filepath, (_, after) in changes.items():
+            self.current[filepath] = after
+        self.undo_stack.append((label, changes))
+        return label, list(changes)
+
+    def forget(self, filepaths):
+        """
+        ディスクから読み直したファイルの記録を消す (次の read() でディスクから読む)。
+        そのファイルを含む元に戻す履歴も使えなくなるので捨てる。
+        """
+        filepaths = set(filepaths)
+        for filepath in filepaths:
+            self.saved.pop(filepath, None)
+            self.current.pop(filepath, None)
+        self.undo_stack = [entry for entry in self.undo_stack if not filepaths.intersection(entry[1])]
+        self.redo_stack = [entry for entry in self.redo_stack if not filepaths.intersection(entry[1])]
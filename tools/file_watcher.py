@@ -0,0 +1,176 @@
+import ctypes
+import ctypes.util
+import os
+import struct
+import sys
+
+# 外部エディタなどによるファイルの変更を検出するモジュール
+# Linux では inotify を使い、使えない環境では更新日時とサイズのポーリングで代用する。
+# どちらも poll() で「前回から変わったファイルのパス」の集合を返すだけで、GUI には依存しない。
+
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_Q_OVERFLOW = 0x00004000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+_WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+_EVENT = struct.Struct("iIII") # wd, mask, cookie, len
+
+
+class PollingWatcher:
+    """
+    更新日時とサイズを定期的に比較して変更を検出する。どの環境でも動く。
+    """
+
+    def __init__(self):
+        self.directories = {} # ディレクトリ -> 拡張子
+        self.files = set()
+        self.snapshot = {} # パス -> (mtime_ns, size)
+
+    def add_directory(self, directory, suffix):
+        self.directories[directory] = suffix
+        self.snapshot.update(self._scan_directory(directory, suffix))
+
+    def add_file(self, filepath):
+        self.files.add(filepath)
+        stat = self._stat(filepath)
+        if stat is not None:
+            self.snapshot[filepath] = stat
+
+    def _stat(self, filepath):
+        try:
+            stat = os.stat(filepath)
+        except OSError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def _scan_directory(self, directory, suffix):
+        result = {}
+        try:
+            entries = os.scandir(directory)
+        except OSError:
+            return result
+        with entries:
+            for entry in entries:
+                if entry.name.endswith(suffix):
+                    try:
+                        stat = entry.stat()
+                    except OSError:
+                        continue
+                    result[os.path.join(directory, entry.name)] = (stat.st_mtime_ns, stat.st_size)
+        return result
+
+    def poll(self):
+        """前回の poll() から追加・変更・削除されたファイルのパスを返す。"""
+        snapshot = {}
+        for directory, suffix in self.directories.items():
+            snapshot.update(self._scan_directory(directory, suffix))
+        for filepath in self.files:
+            stat = self._stat(filepath)
+            if stat is not None:
+                snapshot[filepath] = stat
+        changed = {filepath for filepath, stat in snapshot.items() if self.snapshot.get(filepath) != stat}
+        changed.update(filepath for filepath in self.snapshot if filepath not in snapshot)
+        self.snapshot = snapshot
+        return changed
+
+    def close(self):
+        pass
+
+
+class InotifyWatcher:
+    """
+    inotify でディレクトリを監視して変更を検出する (Linux のみ)。
+    単独のファイルは親ディレクトリを監視してファイル名で絞り込む。
+    """
+
+    def __init__(self):
+        libc_name = ctypes.util.find_library("c") or "libc.so.6"
+        self.libc = ctypes.CDLL(libc_name, use_errno=True)
+        self.fd = self.libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            error = ctypes.get_errno()
+            raise OSError(error, os.strerror(error))
+        self.watches = {} # wd -> ディレクトリ
+        self.filters = {} # ディレクトリ -> (拡張子, ファイル名の集合)
+
+    def _watch(self, directory):
+        if directory in self.filters:
+            return
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(directory or "."), _WATCH_MASK)
+        if wd < 0:
+            error = ctypes.get_errno()
+            raise OSError(error, f"{os.strerror(error)}: {directory}")
+        self.watches[wd] = directory
+        self.filters[directory] = (None, set())
+
+    def add_directory(self, directory, suffix):
+        self._watch(directory)
+        self.filters[directory] = (suffix, self.filters[directory][1])
+
+    def add_file(self, filepath):
+        directory, name = os.path.split(filepath)
+        self._watch(directory)
+        self.filters[directory][1].add(name)
+
+    def _matches(self, directory, name):
+        suffix, names = self.filters[directory]
+        return name in names or (suffix is not None and name.endswith(suffix))
+
+    def _all_files(self):
+        # キューが溢れてイベントを取りこぼした場合は、監視対象すべてを変更ありとみなす
+        result = set()
+        for directory in self.filters:
+            try:
+                names = os.listdir(directory or ".")
+            except OSError:
+                continue
+            result.update(os.path.join(directory, name) for name in names if self._matches(directory, name))
+        return result
+
+    def poll(self):
+        """前回の poll() から追加・変更・削除されたファイルのパスを返す。"""
+        changed = set()
+        while True:
+            try:
+                data = os.read(self.fd, 65536)
+            except BlockingIOError:
+                break
+            if not data:
+                break
+            offset = 0
+            while offset < len(data):
+                wd, mask, _, length = _EVENT.unpack_from(data, offset)
+                name = os.fsdecode(data[offset + _EVENT.size:offset + _EVENT.size + length].rstrip(b"\0"))
+                offset += _EVENT.size + length
+                if mask & IN_Q_OVERFLOW:
+                    changed.update(self._all_files())
+                    continue
+                directory = self.watches.get(wd)
+                if directory is not None and name and self._matches(directory, name):
+                    changed.add(os.path.join(directory, name))
+        return changed
+
+    def close(self):
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+
+def create_watcher(backend="auto"):
+    """
+    監視方式を選んでウォッチャーを作る。
+
+    Args:
+        backend (str): "auto" (inotify が使えれば inotify)、"inotify"、"polling" のいずれか
+    """
+    if backend in ("auto", "inotify") and sys.platform.startswith("linux"):
+        try:
+            return InotifyWatcher()
+        except (OSError, AttributeError) as e:
+            print(f"inotify is not available, falling back to polling: {e}")
+    return PollingWatcher()
@@ -0,0 +1,149 @@
+import os
+import re
+
+# ローカライズ (localisation/<言語>/**/*.yml) の読み込みと索引
+# ファイルは1行ずつ読み、「キー:版 "値" # コメント」の書式を解釈する (版の数字・引用符・行末のコメントは値に含めない)。
+# 言語ごとに配下のすべての .yml を一つの表にまとめ、初めて使われたときに読み込む。
+# ファイルごとのパース結果はパースキャッシュ (更新日時とサイズで判定) に、言語ごとの表はメモリに持つ。
+
+LOCALISATION_VERSION = 1
+
+_HEADER = re.compile(r'l_(\w+)\s*:\s*$')
+_ENTRY = re.compile(r'([^\s:#"]+)\s*:\s*(\d*)\s*')
+
+
+def _parse_value(text):
+    """
+    キーの後ろから値を取り出す。
+    引用符で囲まれていれば、後ろに空白かコメントしか無い最初の引用符までを値とする (値の中の引用符はそのまま残す)。
+    """
+    if not text.startswith('"'):
+        return text.split('#', 1)[0].strip()
+    end = 0
+    while True:
+        end = text.find('"', end + 1)
+        if end < 0:
+            return text[1:].strip() # 閉じる引用符が無い
+        if text[end - 1] == '\\':
+            continue # \" は値の中の引用符
+        tail = text[end + 1:].lstrip()
+        if not tail or tail.startswith('#'):
+            return text[1:end].replace('\\"', '"')
+
+
+def parse_localisation_file(filepath):
+    """
+    ローカライズのファイルを読む。
+
+    Returns:
+        dict: language (見出しの l_<言語> の言語。無ければ None)、strings (キー -> 値)
+    """
+    language = None
+    strings = {}
+    try:
+        with open(filepath, 'r', encoding='utf-8-sig') as f:
+            for line in f:
+                line = line.strip()
+                if not line or line.startswith('#'):
+                    continue
+                if language is None:
+                    header = _HEADER.match(line)
+                    if header:
+                        language = header.group(1)
+                        continue
+                match = _ENTRY.match(line)
+                if match:
+                    strings[match.group(1)] = _parse_value(line[match.end():])
+    except Exception as e:
+        print(f"Error loading localisation file {filepath}: {e}")
+    return {"language": language, "strings": strings}
+
+
+class LocalisationIndex:
+    """
+    言語ごとのローカライズの表。localisation/<言語> の配下のすべての .yml を、使われたときに読み込む。
+
+    Args:
+        root (str): ローカライズのディレクトリ (言語ごとのディレクトリを含む)
+        cache (ParseCache): パースキャッシュ (None ならキャッシュしない)
+    """
+
+    def __init__(self, root="localisation", cache=None):
+        self.root = root
+        self.cache = cache
+        self.tables = {} # 言語 -> (ファイルの更新日時とサイズ, キー -> 値, キー -> ファイル)
+
+    def languages(self):
+        """ディレクトリのある言語のリストを返す。"""
+        try:
+            return sorted(entry.name for entry in os.scandir(self.root) if entry.is_dir())
+        except OSError:
+            return []
+
+    def files(self, language):
+        """言語の .yml ファイルのパスをすべて (サブディレクトリも) 返す。"""
+        filepaths = []
+        for directory, _, filenames in os.walk(os.path.join(self.root, language)):
+            filepaths.extend(os.path.join(directory, filename) for filename in filenames if filename.endswith(".yml"))
+        return sorted(filepaths)
+
+    def load(self, language):
+        """言語の表を読み込んで返す。前回からファイルが変わっていなければ読み直さない。"""
+        filepaths = self.files(language)
+        stamp = []
+        for filepath in filepaths:
+            try:
+                stat = os.stat(filepath)
+                stamp.append((filepath, stat.st_mtime_ns, stat.st_size))
+            except OSError:
+                stamp.append((filepath, None, None))
+        stamp = tuple(stamp)
+        table = self.tables.get(language)
+        if table is not None and table[0] == stamp:
+            return table
+        strings = {}
+        sources = {}
+        for filepath in filepaths:
+            if self.cache is None:
+                record = parse_localisation_file(filepath)
+            else:
+                record = self.cache.get("localisation", filepath, parse_localisation_file)
+            if record["language"] not in (None, language):
+                print(f"警告: {filepath} の言語は l_{record['language']} です ({language} のディレクトリにあります)")
+            strings.update(record["strings"])
+            sources.update(dict.fromkeys(record["strings"], filepath))
+        table = (stamp, strings, sources)
+        self.tables[language] = table
+        return table
+
+    def table(self, language):
+        """言語の表を返す。まだ読み込んでいなければ読み込む (ファイルの変更を確かめるには load() を呼ぶ)。"""
+        table = self.tables.get(language)
+        return table if table is not None else self.load(language)
+
+    def strings(self, language):
+        """キー -> 値 の辞書を返す。"""
+        return self.table(language)[1]
+
+    def sources(self, language):
+        """キー -> 書かれているファイル の辞書を返す。"""
+        return self.table(language)[2]
+
+    def get(self, key, language, default=None):
+        return self.strings(language).get(key, default)
+
+    def missing_keys(self, languages=None, required=()):
+        """
+        ほかの言語にあるキーと required のキーのうち、その言語に無いものを言語ごとに返す。
+
+        Args:
+            languages (list[str]): 比べる言語 (None ならディレクトリのあるすべての言語)
+            required (iterable[str]): どの言語にも必要なキー (ステートのローカライズキーなど)
+
+        Returns:
+            dict: 言語 -> 無いキーのソートしたリスト
+        """
+        languages = self.languages() if languages is None else languages
+        keys = {language: self.strings(language).keys() for language in languages}
+        all_keys = set(required).union(*keys.values())
+        return {language: sorted(all_keys - language_keys) for language, language_keys in keys.items()}
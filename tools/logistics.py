@@ -0,0 +1,151 @@
+from collections import deque
+
+# 補給と鉄道のネットワーク
+# map/railways.txt (レベル 個数 プロビンスID...) と map/supply_nodes.txt (レベル プロビンスID) を読み、
+# 補給拠点を起点にした多始点の幅優先探索で、プロビンスごとに最も近い補給拠点までの距離 (隣接の段数) を求める。
+# 隣接グラフ (adjacency.ProvinceGraph) があれば陸の隣接と海峡をたどり、無ければ鉄道だけをたどる。
+#
+# 距離はプロビンスごとの値でステートの所属には依存しないので、プロビンスをステート間で移したときは
+# update_states() で変わったステートの集計だけをやり直せばよい。
+
+# 補給がたどれる辺の種類 (海上の渡りは含めない)
+SUPPLY_KINDS = ("border", "land")
+
+
+def parse_railways(filepath):
+    """railways.txt を (レベル, [プロビンスID, ...]) のリストとして読む。プロビンスIDは整数。"""
+    railways = []
+    try:
+        with open(filepath, 'r', encoding='utf-8') as f:
+            for line in f:
+                items = line.split()
+                if len(items) < 2:
+                    continue
+                try:
+                    level, count = int(items[0]), int(items[1])
+                    provinces = [int(item) for item in items[2:2 + count]]
+                except ValueError:
+                    continue
+                if len(provinces) >= 2:
+                    railways.append((level, provinces))
+    except Exception as e:
+        print(f"Error loading railways from {filepath}: {e}")
+    return railways
+
+
+def parse_supply_nodes(filepath):
+    """supply_nodes.txt を (レベル, プロビンスID) のリストとして読む。"""
+    supply_nodes = []
+    try:
+        with open(filepath, 'r', encoding='utf-8') as f:
+            for line in f:
+                items = line.split()
+                if len(items) < 2:
+                    continue
+                try:
+                    supply_nodes.append((int(items[0]), int(items[1])))
+                except ValueError:
+                    continue
+    except Exception as e:
+        print(f"Error loading supply nodes from {filepath}: {e}")
+    return supply_nodes
+
+
+class LogisticsNetwork:
+    """
+    鉄道と補給拠点のネットワーク。
+
+    Args:
+        railways (list[tuple]): parse_railways() の結果
+        supply_nodes (list[tuple]): parse_supply_nodes() の結果
+        graph (adjacency.ProvinceGraph): プロビンスの隣接グラフ (None なら鉄道だけをたどる)
+        land_provinces (set[int]): 補給がたどれる (陸の) プロビンスID。None なら制限しない
+    """
+
+    def __init__(self, railways, supply_nodes, graph=None, land_provinces=None):
+        self.railways = railways
+        self.supply_nodes = {} # プロビンスID -> 補給拠点のレベル
+        for level, province_id in supply_nodes:
+            self.supply_nodes[province_id] = max(level, self.supply_nodes.get(province_id, 0))
+        self.rail_level = {} # プロビンスID -> そのプロビンスを通る鉄道の最大レベル
+        self.rail_neighbours = {} # プロビンスID -> 鉄道でつながるプロビンスIDの集合
+        for level, provinces in railways:
+            for province_id in provinces:
+                self.rail_level[province_id] = max(level, self.rail_level.get(province_id, 0))
+            for a, b in zip(provinces, provinces[1:]):
+                self.rail_neighbours.setdefault(a, set()).add(b)
+                self.rail_neighbours.setdefault(b, set()).add(a)
+        self.graph = graph
+        self.land_provinces = land_provinces
+        self.distance = self.supply_distances()
+
+    def neighbours(self):
+        """プロビンスID -> 補給がたどれる隣接プロビンスIDのリスト を返す関数。"""
+        rail_neighbours = self.rail_neighbours
+        if self.graph is None:
+            return lambda province_id: rail_neighbours.get(province_id, ())
+        graph = self.graph
+        adjacency = graph.adjacency(SUPPLY_KINDS)
+        province_ids = graph.province_ids.tolist()
+        row_of = graph.row_of
+
+        def neighbours(province_id):
+            row = row_of.get(province_id)
+            result = [province_ids[i] for i in adjacency[row]] if row is not None else []
+            result.extend(rail_neighbours.get(province_id, ()))
+            return result
+        return neighbours
+
+    def supply_distances(self):
+        """補給拠点を起点にした多始点の幅優先探索で、プロビンスID -> 最も近い補給拠点までの段数 を返す。"""
+        neighbours = self.neighbours()
+        land_provinces = self.land_provinces
+        distance = {province_id: 0 for province_id in self.supply_nodes}
+        queue = deque(distance)
+        while queue:
+            province_id = queue.popleft()
+            next_distance = distance[province_id] + 1
+            for neighbour in neighbours(province_id):
+                if neighbour in distance or (land_provinces is not None and neighbour not in land_provinces):
+                    continue
+                distance[neighbour] = next_distance
+                queue.append(neighbour)
+        return distance
+
+    def rail_fragments(self):
+        """
+        鉄道がつながっているまとまりを大きい順に返す。最も大きいもの以外は本線から切れた鉄道。
+
+        Returns:
+            list[dict]: provinces (プロビンスIDのリスト)、supply_nodes (含まれる補給拠点の数)
+        """
+        remaining = set(self.rail_neighbours)
+        fragments = []
+        while remaining:
+            start = remaining.pop()
+            component = [start]
+            queue = [start]
+            while queue:
+                for neighbour in self.rail_neighbours[queue.pop()]:
+                    if neighbour in remaining:
+                        remaining.discard(neighbour)
+                        component.append(neighbour)
+                        queue.append(neighbour)
+            component.sort()
+            fragments.append({"provinces": component, "supply_nodes": sum(1 for p in component if p in self.supply_nodes)})
+        fragments.sort(key=lambda fragment: len(fragment["provinces"]), reverse=True)
+        return fragments
+
+    def update_states(self, states):
+        """
+        ステートのレコードに補給の集計を書き込む。
+        supply_distance (最も近い補給拠点までの段数。たどれなければ None)、
+        railway_level (ステート内の鉄道の最大レベル。無ければ 0)、supply_nodes (ステート内の補給拠点の数)。
+        """
+        distance = self.distance
+        for state_info in states:
+            province_ids = [int(province_id) for province_id in state_info["provinces"]]
+            distances = [distance[p] for p in province_ids if p in distance]
+            state_info["supply_distance"] = min(distances) if distances else None
+            state_info["railway_level"] = max((self.rail_level.get(p, 0) for p in province_ids), default=0)
+            state_info["supply_nodes"] = sum(1 for p in province_ids if p in self.supply_nodes)
@@ -0,0 +1,191 @@
+import numpy as np
+
+from province_bitmap import ColorLookup, open_bmp, pixel_keys
+
+# map/buildings.txt (建物の配置) の読み込みと集計
+# 1行は「ステートID;建物の種類;x;y;z;向き;隣接する海のプロビンスID」。ゲームは (x, z) の画素のプロビンスに建物を置く。
+# ファイル全体を NumPy の loadtxt で列ごとの配列として一度に読み、ステートID・建物の種類の索引と
+# ステートごとの建物の数の集計は配列の演算 (argsort / bincount) で行う。
+# provinces.bmp があれば (x, z) からプロビンスを求め、プロビンスを別のステートへ移したときに
+# 元のステートのまま残った配置を見つけられる。
+
+BUILDINGS_VERSION = 1
+
+_DTYPE = [("state", "i4"), ("type", "U64"), ("x", "f8"), ("y", "f8"), ("z", "f8"), ("rotation", "f8"), ("sea", "i4")]
+
+
+def _parse_lines(filepath):
+    """1行ずつ読む (loadtxt で読めない行がある場合)。読めない行は表示して飛ばす。"""
+    rows = []
+    with open(filepath, 'r', encoding='utf-8-sig') as f:
+        for line_number, line in enumerate(f, 1):
+            items = line.strip().split(';')
+            if not items[0]:
+                continue
+            try:
+                rows.append((int(items[0]), items[1], float(items[2]), float(items[3]), float(items[4]), float(items[5]), int(items[6])))
+            except (ValueError, IndexError):
+                print(f"Error parsing {filepath}:{line_number}: {line.strip()}")
+    return np.array(rows, dtype=_DTYPE)
+
+
+def parse_buildings_file(filepath):
+    """
+    buildings.txt を読み、BuildingTable を返す。
+
+    Args:
+        filepath (str): buildings.txt のパス
+
+    Returns:
+        BuildingTable: 建物の配置 (読めなければ空)
+    """
+    try:
+        try:
+            rows = np.loadtxt(filepath, delimiter=';', dtype=_DTYPE, encoding='utf-8-sig', comments=None, ndmin=1)
+        except ValueError:
+            rows = _parse_lines(filepath)
+    except Exception as e:
+        print(f"Error loading buildings from {filepath}: {e}")
+        rows = np.zeros(0, dtype=_DTYPE)
+    types, type_codes = np.unique(rows["type"], return_inverse=True)
+    return BuildingTable(rows["state"].astype(np.int64), types.tolist(), type_codes.astype(np.int64),
+                         rows["x"], rows["y"], rows["z"], rows["rotation"], rows["sea"].astype(np.int64))
+
+
+class BuildingTable:
+    """
+    建物の配置の列ごとの配列。
+
+    state はファイルに書かれたステートID、type_codes は types の位置、
+    provinces は (x, z) の画素から求めたプロビンスID (resolve_provinces() を呼ぶまでは None。画素が definition.csv に無ければ -1)。
+    """
+
+    def __init__(self, state, types, type_codes, x, y, z, rotation, sea):
+        self.state = state
+        self.types = types
+        self.type_codes = type_codes
+        self.x = x
+        self.y = y
+        self.z = z
+        self.rotation = rotation
+        self.sea = sea
+        self.provinces = None
+        # ステートIDの順に並べた行の番号 (ステートごとの行は state_order[start:end])
+        self.state_order = np.argsort(state, kind="stable")
+        self.sorted_state = state[self.state_order]
+        # 種類ごとの行の番号
+        self.type_order = np.argsort(type_codes, kind="stable")
+        self.type_starts = np.searchsorted(type_codes[self.type_order], np.arange(len(types) + 1))
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        state["provinces"] = None # provinces.bmp によるので保存しない
+        return state
+
+    def __len__(self):
+        return len(self.state)
+
+    def rows_for_state(self, state_id):
+        """ステートに書かれた配置の行の番号を返す。"""
+        start, end = np.searchsorted(self.sorted_state, [state_id, state_id + 1])
+        return self.state_order[start:end]
+
+    def rows_for_type(self, building_type):
+        """建物の種類の配置の行の番号を返す。"""
+        if building_type not in self.types:
+            return np.zeros(0, dtype=np.int64)
+        code = self.types.index(building_type)
+        return self.type_order[self.type_starts[code]:self.type_starts[code + 1]]
+
+    def rows_for_provinces(self, province_ids):
+        """(x, z) がプロビンスにある配置の行の番号を返す。resolve_provinces() の後で使う。"""
+        if self.provinces is None:
+            return np.zeros(0, dtype=np.int64)
+        return np.flatnonzero(np.isin(self.provinces, np.array([int(p) for p in province_ids], dtype=np.int64)))
+
+    def entry(self, row):
+        """1行を辞書で返す (表示用)。"""
+        return {
+            "state": int(self.state[row]),
+            "type": self.types[self.type_codes[row]],
+            "x": float(self.x[row]),
+            "y": float(self.y[row]),
+            "z": float(self.z[row]),
+            "rotation": float(self.rotation[row]),
+            "sea": int(self.sea[row]),
+            "province": None if self.provinces is None else int(self.provinces[row]),
+        }
+
+    def resolve_provinces(self, bmp_path, definition_rows):
+        """provinces.bmp の (x, z) の画素の色から、配置ごとのプロビンスIDを求める。"""
+        pixels = open_bmp(bmp_path)
+        height, width = pixels.shape[:2]
+        columns = np.clip(self.x.astype(np.int64), 0, width - 1)
+        rows = np.clip(height - 1 - self.z.astype(np.int64), 0, height - 1) # z は下から数える
+        lookup = ColorLookup(definition_rows)
+        indices = lookup.lookup(pixel_keys(pixels[rows, columns]))
+        known = indices != lookup.unknown
+        provinces = np.full(len(indices), -1, dtype=np.int64)
+        provinces[known] = lookup.province_ids[indices[known]]
+        self.provinces = provinces
+        return provinces
+
+    def state_counts(self, state_ids):
+        """
+        ステートごと・建物の種類ごとの配置の数を1回の bincount で数える。
+
+        Args:
+            state_ids (list[int]): 数えるステートID (行の順)
+
+        Returns:
+            np.ndarray: (len(state_ids), len(types)) の配列
+        """
+        state_ids = np.asarray(state_ids, dtype=np.int64)
+        size = len(self.types)
+        if not len(state_ids) or not len(self.state):
+            return np.zeros((len(state_ids), size), dtype=np.int64)
+        order = np.argsort(state_ids, kind="stable")
+        sorted_ids = state_ids[order]
+        positions = np.minimum(np.searchsorted(sorted_ids, self.state), len(sorted_ids) - 1)
+        known = sorted_ids[positions] == self.state # ステートファイルの無いステートIDの行は数えない
+        rows = order[positions[known]]
+        counts = np.bincount(rows * size + self.type_codes[known], minlength=len(state_ids) * size)
+        return counts.reshape(len(state_ids), size)
+
+    def misplaced(self, province_to_state, rows=None):
+        """
+        (x, z) のプロビンスが、書かれたステートとは別のステートに属している配置の行の番号を返す。
+        プロビンスを移譲すると、移したプロビンスにある配置は元のステートのまま残るので、ここで見つかる。
+
+        Args:
+            province_to_state (dict): プロビンスID (文字列) -> ステートID
+            rows (np.ndarray): 確かめる行の番号 (None ならすべて)
+        """
+        if self.provinces is None:
+            return np.zeros(0, dtype=np.int64)
+        if rows is None:
+            rows = np.arange(len(self.state))
+        # プロビンスID -> ステートID の表を配列にして、まとめて引く
+        keys = np.array([int(p) for p in province_to_state], dtype=np.int64)
+        values = np.array(list(province_to_state.values()), dtype=np.int64)
+        order = np.argsort(keys)
+        keys, values = keys[order], values[order]
+        provinces = self.provinces[rows]
+        if not len(keys):
+            return np.zeros(0, dtype=np.int64)
+        positions = np.minimum(np.searchsorted(keys, provinces), len(keys) - 1)
+        current = np.where(keys[positions] == provinces, values[positions], -1)
+        wrong = (provinces >= 0) & (current >= 0) & (current != self.state[rows])
+        return rows[wrong]
+
+
+def load_buildings(filepath, cache=None):
+    """buildings.txt をパースキャッシュから返す (ファイルが変わっていれば読み直す)。"""
+    if cache is None:
+        return parse_buildings_file(filepath)
+    record = cache.lookup("map_buildings", filepath)
+    if record is not None and record[0][0] == BUILDINGS_VERSION:
+        return record[0][1]
+    table = parse_buildings_file(filepath)
+    cache.store("map_buildings", filepath, ((BUILDINGS_VERSION, table),))
+    return table
@@ -0,0 +1,132 @@
+import hashlib
+import os
+import pickle
+
+# パース結果をディスクにキャッシュし、変更されたファイルだけを再パースするためのモジュール
+# エントリはファイルのパス・更新日時・サイズ (と任意でハッシュ) で検証する。
+
+CACHE_FORMAT_VERSION = 1
+
+
+def file_digest(filepath):
+    with open(filepath, 'rb') as f:
+        return hashlib.blake2b(f.read(), digest_size=16).hexdigest()
+
+
+class ParseCache:
+    """
+    パース結果のディスクキャッシュ。
+
+    Args:
+        cache_path (str): キャッシュファイルのパス
+        version: パーサーやレコード形式のバージョン。保存時と異なればキャッシュ全体を破棄する
+        verify_hash (bool): 更新日時とサイズに加えて内容のハッシュも比較するか
+    """
+
+    def __init__(self, cache_path, version, verify_hash=False):
+        self.cache_path = cache_path
+        self.version = (CACHE_FORMAT_VERSION, version)
+        self.verify_hash = verify_hash
+        self.entries = {} # (namespace, パス) -> (mtime_ns, size, digest, record)
+        self.dirty = False
+        self.hits = 0
+        self.misses = 0
+        self.load()
+
+    def load(self):
+        self.entries = {}
+        if not os.path.exists(self.cache_path):
+            return
+        try:
+            with open(self.cache_path, 'rb') as f:
+                data = pickle.load(f)
+            if data.get("version") == self.version:
+                self.entries = data["entries"]
+        except Exception as e:
+            # 壊れたキャッシュは捨てて作り直す
+            print(f"Discarding parse cache {self.cache_path}: {e}")
+            self.entries = {}
+            self.dirty = True
+
+    def save(self):
+        if not self.dirty:
+            return
+        directory = os.path.dirname(self.cache_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        temp_path = self.cache_path + ".tmp"
+        try:
+            with open(temp_path, 'wb') as f:
+                pickle.dump({"version": self.version, "entries": self.entries}, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(temp_path, self.cache_path)
+            self.dirty = False
+        except Exception as e:
+            print(f"Error saving parse cache {self.cache_path}: {e}")
+
+    def _key(self, namespace, filepath):
+        return (namespace, os.path.normcase(os.path.abspath(filepath)))
+
+    def lookup(self, namespace, filepath, stat=None):
+        """
+        キャッシュが有効ならレコードを返す。無効または未登録なら None を返す。
+        """
+        entry = self.entries.get(self._key(namespace, filepath))
+        if entry is None:
+            return None
+        if stat is None:
+            stat = os.stat(filepath)
+        mtime_ns, size, digest, record = entry
+        if stat.st_mtime_ns == mtime_ns and stat.st_size == size:
+            if not self.verify_hash or digest == file_digest(filepath):
+                return record
+            return None
+        if self.verify_hash and stat.st_size == size and digest == file_digest(filepath):
+            # 更新日時だけが変わった (チェックアウトなど) 場合はそのまま使う
+            self.entries[self._key(namespace, filepath)] = (stat.st_mtime_ns, size, digest, record)
+            self.dirty = True
+            return record
+        return None
+
+    def store(self, namespace, filepath, record, stat=None):
+        if stat is None:
+            stat = os.stat(filepath)
+        digest = file_digest(filepath) if self.verify_hash else None
+        self.entries[self._key(namespace, filepath)] = (stat.st_mtime_ns, stat.st_size, digest, record)
+        self.dirty = True
+
+    def get(self, namespace, filepath, parse_func):
+        """
+        キャッシュが有効ならそのレコードを、そうでなければ parse_func(filepath) の結果を返す。
+        parse_func が None を返した場合も「パース不可」としてキャッシュする。
+        """
+        try:
+            stat = os.stat(filepath)
+        except OSError:
+            return parse_func(filepath)
+        record = self.lookup(namespace, filepath, stat)
+        if record is not None:
+            self.hits += 1
+            return record[0]
+        self.misses += 1
+        result = parse_func(filepath)
+        self.store(namespace, filepath, (result,), stat)
+        return result
+
+    def is_fresh(self, namespace, filepath):
+        try:
+            return self.lookup(namespace, filepath) is not None
+        except OSError:
+            return False
+
+    def discard(self, namespace, filepath):
+        if self.entries.pop(self._key(namespace, filepath), None) is not None:
+            self.dirty = True
+
+    def prune(self, namespace, filepaths):
+        """namespace 内で filepaths に含まれないエントリ (削除されたファイル) を取り除く。"""
+        keep = {self._key(namespace, filepath) for filepath in filepaths}
+        stale = [key for key in self.entries if key[0] == namespace and key not in keep]
+        for key in stale:
+            del self.entries[key]
+        if stale:
+            self.dirty = True
@@ -0,0 +1,214 @@
+import os
+import struct
+
+import numpy as np
+
+# provinces.bmp の読み込みとプロビンスごとの統計 (面積・外接矩形・重心)
+# 画像はメモリマップで開き、数百行ずつ NumPy 配列のまま処理するので、5616x2160 の画像全体を読み込むことはない。
+# 行ごとに同じ色が続く区間 (ラン) にまとめてから definition.csv の色の表を引くので、
+# 色の照合は画素数ではなくランの数だけで済む。
+
+STATS_VERSION = 1
+
+# バニラのインストール先の候補 (設定ファイルの [Directories] game_dir が優先)
+DEFAULT_GAME_DIRS = [
+    r"C:\Program Files (x86)\Steam\steamapps\common\Hearts of Iron IV",
+    os.path.expanduser("~/.local/share/Steam/steamapps/common/Hearts of Iron IV"),
+    os.path.expanduser("~/Library/Application Support/Steam/steamapps/common/Hearts of Iron IV"),
+]
+
+
+def find_provinces_bmp(config):
+    """
+    provinces.bmp のパスを返す。見つからなければ None。
+    設定ファイルの [Map] provinces_bmp、mod の map/provinces.bmp、バニラの map/provinces.bmp の順に探す。
+    """
+    candidates = []
+    if config.has_option('Map', 'provinces_bmp'):
+        candidates.append(config.get('Map', 'provinces_bmp'))
+    candidates.append(os.path.join("map", "provinces.bmp"))
+    game_dirs = [config.get('Directories', 'game_dir')] if config.has_option('Directories', 'game_dir') else DEFAULT_GAME_DIRS
+    candidates.extend(os.path.join(game_dir, "map", "provinces.bmp") for game_dir in game_dirs)
+    for path in candidates:
+        if os.path.isfile(path):
+            return path
+    return None
+
+
+def open_bmp(filepath):
+    """
+    24ビットの BMP をメモリマップで開き、(高さ, 幅, 3) の BGR 配列 (上の行から) を返す。
+    配列はファイルのビューなので、スライスした部分だけがディスクから読まれる。
+    """
+    with open(filepath, 'rb') as f:
+        header = f.read(54)
+    if len(header) < 54 or header[:2] != b'BM':
+        raise ValueError(f"BMP ファイルではありません: {filepath}")
+    pixel_offset = struct.unpack_from('<I', header, 10)[0]
+    width, height = struct.unpack_from('<ii', header, 18)
+    bits_per_pixel, compression = struct.unpack_from('<HI', header, 28)
+    if bits_per_pixel != 24 or compression != 0:
+        raise ValueError(f"24ビット無圧縮の BMP のみ対応しています ({bits_per_pixel}ビット, 圧縮形式 {compression}): {filepath}")
+    row_size = (width * 3 + 3) // 4 * 4 # 各行は4バイト境界まで埋められている
+    rows = np.memmap(filepath, dtype=np.uint8, mode='r', offset=pixel_offset, shape=(abs(height), row_size))
+    pixels = rows[:, :width * 3].reshape(abs(height), width, 3)
+    # 高さが正なら下の行から格納されている
+    return pixels[::-1] if height > 0 else pixels
+
+
+class ColorLookup:
+    """
+    RGB の値 (r << 16 | g << 8 | b) からプロビンスの番号 (definition.csv の行の順) を引く表。
+    一致しない色は len(province_ids) を返す。
+    """
+
+    def __init__(self, definition_rows):
+        keys = np.array([(r << 16) | (g << 8) | b for _, r, g, b, _, _ in definition_rows], dtype=np.uint32)
+        ids = np.array([row[0] for row in definition_rows], dtype=np.int64)
+        order = np.argsort(keys, kind="stable")
+        self.keys = keys[order]
+        self.indices = order # ソートした色の位置 -> definition.csv の行の順
+        self.province_ids = ids
+        self.unknown = len(ids)
+
+    def lookup(self, keys):
+        if not len(self.keys):
+            return np.full(len(keys), self.unknown, dtype=np.int64)
+        positions = np.minimum(np.searchsorted(self.keys, keys), len(self.keys) - 1)
+        return np.where(self.keys[positions] == keys, self.indices[positions], self.unknown)
+
+
+def pixel_keys(block):
+    """BGR の画素の配列を r << 16 | g << 8 | b の配列にする。"""
+    return (block[..., 2].astype(np.uint32) << 16) | (block[..., 1].astype(np.uint32) << 8) | block[..., 0]
+
+
+class ProvinceStats:
+    """
+    プロビンスごとの画素の統計。配列は definition.csv の行の順に並ぶ。
+
+    area は画素数、x0 / y0 / x1 / y1 は外接矩形 (両端を含む。画素が無ければ -1)、cx / cy は重心。
+    """
+
+    def __init__(self, province_ids, area, x0, y0, x1, y1, cx, cy, width, height, unknown_pixels):
+        self.province_ids = province_ids
+        self.area = area
+        self.x0 = x0
+        self.y0 = y0
+        self.x1 = x1
+        self.y1 = y1
+        self.cx = cx
+        self.cy = cy
+        self.width = width
+        self.height = height
+        self.unknown_pixels = unknown_pixels # definition.csv に無い色の画素数
+        self.row_of = {int(province_id): row for row, province_id in enumerate(province_ids.tolist())}
+
+    def for_province(self, province_id):
+        """1つのプロビンスの統計を辞書で返す。画素が無ければ None。"""
+        row = self.row_of.get(int(province_id))
+        if row is None or not self.area[row]:
+            return None
+        return {
+            "area": int(self.area[row]),
+            "bbox": (int(self.x0[row]), int(self.y0[row]), int(self.x1[row]), int(self.y1[row])),
+            "centroid": (float(self.cx[row]), float(self.cy[row])),
+        }
+
+    def aggregate(self, province_ids):
+        """
+        複数のプロビンス (ステート・戦略地域など) をまとめた統計を返す。重心は面積で重み付けする。
+        画素が1つも無ければ None。
+        """
+        rows = np.array([self.row_of[int(p)] for p in province_ids if int(p) in self.row_of], dtype=np.int64)
+        if not len(rows):
+            return None
+        area = self.area[rows]
+        rows = rows[area > 0]
+        area = area[area > 0]
+        total = int(area.sum())
+        if not total:
+            return None
+        return {
+            "area": total,
+            "bbox": (int(self.x0[rows].min()), int(self.y0[rows].min()), int(self.x1[rows].max()), int(self.y1[rows].max())),
+            "centroid": (float((self.cx[rows] * area).sum() / total), float((self.cy[rows] * area).sum() / total)),
+        }
+
+
+def compute_province_stats(filepath, definition_rows, chunk_rows=256):
+    """
+    provinces.bmp を1回だけ走査して、プロビンスごとの面積・外接矩形・重心を求める。
+
+    Args:
+        filepath (str): provinces.bmp のパス
+        definition_rows (list[tuple]): state_loader.parse_definition_csv() の結果
+        chunk_rows (int): 一度に処理する行数
+
+    Returns:
+        ProvinceStats: プロビンスごとの統計
+    """
+    pixels = open_bmp(filepath)
+    height, width = pixels.shape[:2]
+    lookup = ColorLookup(definition_rows)
+    size = lookup.unknown + 1 # 最後は一致しない色の分
+    area = np.zeros(size, dtype=np.int64)
+    sum_x = np.zeros(size, dtype=np.float64)
+    sum_y = np.zeros(size, dtype=np.float64)
+    x0 = np.full(size, width, dtype=np.int64)
+    y0 = np.full(size, height, dtype=np.int64)
+    x1 = np.full(size, -1, dtype=np.int64)
+    y1 = np.full(size, -1, dtype=np.int64)
+
+    for top in range(0, height, chunk_rows):
+        keys = pixel_keys(pixels[top:top + chunk_rows]).ravel()
+        # 行の先頭と色が変わる位置でランを区切る
+        change = np.empty(len(keys), dtype=bool)
+        change[0] = True
+        np.not_equal(keys[1:], keys[:-1], out=change[1:])
+        change[::width] = True
+        starts = np.flatnonzero(change)
+        lengths = np.diff(np.append(starts, len(keys)))
+        rows = starts // width + top
+        run_x0 = starts % width
+        run_x1 = run_x0 + lengths - 1
+        indices = lookup.lookup(keys[starts])
+
+        area += np.bincount(indices, weights=lengths, minlength=size).astype(np.int64)
+        sum_x += np.bincount(indices, weights=lengths * (run_x0 + run_x1) / 2, minlength=size)
+        sum_y += np.bincount(indices, weights=lengths * rows, minlength=size)
+        np.minimum.at(x0, indices, run_x0)
+        np.maximum.at(x1, indices, run_x1)
+        np.minimum.at(y0, indices, rows)
+        np.maximum.at(y1, indices, rows)
+
+    present = area > 0
+    x0[~present] = y0[~present] = -1
+    with np.errstate(invalid="ignore", divide="ignore"):
+        cx = np.where(present, sum_x / np.maximum(area, 1), np.nan)
+        cy = np.where(present, sum_y / np.maximum(area, 1), np.nan)
+    n = lookup.unknown
+    return ProvinceStats(lookup.province_ids, area[:n], x0[:n], y0[:n], x1[:n], y1[:n], cx[:n], cy[:n],
+                         width, height, int(area[n]))
+
+
+def load_province_stats(filepath, definition_path, definition_rows, cache=None):
+    """
+    プロビンスの統計をパースキャッシュから返す。provinces.bmp か definition.csv が変わっていれば計算し直す。
+
+    Args:
+        filepath (str): provinces.bmp のパス
+        definition_path (str): definition.csv のパス
+        definition_rows (list[tuple]): definition.csv をパースした結果
+        cache (ParseCache): パースキャッシュ (None ならキャッシュしない)
+    """
+    stat = os.stat(definition_path)
+    stamp = (STATS_VERSION, stat.st_mtime_ns, stat.st_size) # 色の表が変われば統計も変わる
+    if cache is not None:
+        record = cache.lookup("province_stats", filepath)
+        if record is not None and record[0][0] == stamp:
+            return record[0][1]
+    stats = compute_province_stats(filepath, definition_rows)
+    if cache is not None:
+        cache.store("province_stats", filepath, ((stamp, stats),))
+    return stats
@@ -0,0 +1,178 @@
+# 検索用の索引
+# レコードごとに検索キーを一度だけ正規化しておき、
+# 完全一致はキー -> レコードのハッシュ索引、部分一致は n-gram -> キーの索引で引く。
+# 結果はレコードを追加した順 (一覧の元の並び) で返す。
+# 項目ごとの索引はその項目で最初に検索したときに作り、それ以降はレコードの追加・変更に合わせて更新する。
+
+GRAM_SIZE = 3
+
+
+def normalize(value):
+    return str(value).strip().casefold()
+
+
+def _grams(key):
+    """長さ 1 ~ GRAM_SIZE の部分文字列をすべて返す。"""
+    grams = set()
+    for size in range(1, GRAM_SIZE + 1):
+        for start in range(len(key) - size + 1):
+            grams.add(key[start:start + size])
+    return grams
+
+
+class _FieldIndex:
+    """
+    1つの検索項目の索引。
+
+    postings はキー -> レコードIDの集合、grams は n-gram -> そのn-gramを含むキーの集合。
+    n-gram はレコードではなく重複を除いたキーについて作るので、
+    地形のように値の種類が少ない項目はレコード数が増えても索引が大きくならない。
+    """
+
+    def __init__(self, getter, numeric):
+        self.getter = getter
+        self.numeric = numeric
+        self.keys_of = {} # レコードID -> キーのタプル
+        self.postings = {}
+        self.grams = {}
+
+    def add(self, record_id, record):
+        value = self.getter(record)
+        values = value if isinstance(value, (list, tuple, set)) else (value,)
+        keys = tuple({normalize(v) for v in values})
+        self.keys_of[record_id] = keys
+        for key in keys:
+            record_ids = self.postings.get(key)
+            if record_ids is None:
+                record_ids = self.postings[key] = set()
+                for gram in _grams(key):
+                    self.grams.setdefault(gram, set()).add(key)
+            record_ids.add(record_id)
+
+    def remove(self, record_id):
+        for key in self.keys_of.pop(record_id, ()):
+            record_ids = self.postings[key]
+            record_ids.discard(record_id)
+            if not record_ids:
+                del self.postings[key]
+                for gram in _grams(key):
+                    keys = self.grams[gram]
+                    keys.discard(key)
+                    if not keys:
+                        del self.grams[gram]
+
+    def exact(self, text):
+        if self.numeric and text.isdigit():
+            text = str(int(text)) # "007" と "7" を同じ値として扱う
+        return self.postings.get(text, set())
+
+    def partial(self, text):
+        if len(text) <= GRAM_SIZE:
+            keys = self.grams.get(text, ())
+        else:
+            # クエリの n-gram をすべて含むキーを候補にして、最後に実際に含むか確認する
+            candidate_sets = []
+            for start in range(len(text) - GRAM_SIZE + 1):
+                keys = self.grams.get(text[start:start + GRAM_SIZE])
+                if not keys:
+                    return set()
+                candidate_sets.append(keys)
+            candidate_sets.sort(key=len)
+            keys = set(candidate_sets[0]).intersection(*candidate_sets[1:])
+            keys = [key for key in keys if text in key]
+        record_ids = set()
+        for key in keys:
+            record_ids.update(self.postings[key])
+        return record_ids
+
+
+class SearchIndex:
+    """
+    レコード (辞書) の一覧に対する検索索引。
+
+    Args:
+        fields (list[tuple[str, callable]]): (項目名, レコードから値またはそのリストを返す関数) のリスト
+        numeric_fields (iterable[str]): 数値として完全一致させる項目名
+    """
+
+    def __init__(self, fields, numeric_fields=()):
+        numeric_fields = set(numeric_fields)
+        self.fields = {name: _FieldIndex(getter, name in numeric_fields) for name, getter in fields}
+        self.records = {} # レコードID -> レコード
+        self.sequence = {} # レコードID -> 追加した順番
+        self.next_sequence = 0
+        self.built = set() # 索引を作った項目名
+
+    def field_names(self):
+        return list(self.fields)
+
+    def clear(self):
+        for name, field in self.fields.items():
+            self.fields[name] = _FieldIndex(field.getter, field.numeric)
+        self.records = {}
+        self.sequence = {}
+        self.next_sequence = 0
+        self.built = set()
+
+    def _built_fields(self):
+        return [self.fields[name] for name in self.built]
+
+    def _build(self, field_name):
+        field = self.fields[field_name]
+        for record_id, record in self.records.items():
+            field.add(record_id, record)
+        self.built.add(field_name)
+
+    def add(self, records):
+        for record in records:
+            record_id = id(record)
+            if record_id in self.records:
+                continue
+            self.records[record_id] = record
+            self.sequence[record_id] = self.next_sequence
+            self.next_sequence += 1
+            for field in self._built_fields():
+                field.add(record_id, record)
+
+    def remove(self, records):
+        for record in records:
+            record_id = id(record)
+            if self.records.pop(record_id, None) is None:
+                continue
+            del self.sequence[record_id]
+            for field in self._built_fields():
+                field.remove(record_id)
+
+    def update(self, records, field_names=None):
+        """
+        値が変わったレコードのキーを作り直す。
+
+        Args:
+            records (list[dict]): 変更されたレコード
+            field_names (list[str]): 変更された項目 (None ならすべて)
+        """
+        # 索引をまだ作っていない項目は、作るときに最新の値が使われる
+        fields = [self.fields[name] for name in (field_names or self.fields) if name in self.built]
+        if not fields:
+            return
+        for record in records:
+            record_id = id(record)
+            if record_id not in self.records:
+                continue
+            for field in fields:
+                field.remove(record_id)
+                field.add(record_id, record)
+
+    def search(self, field_name, text, exact=False):
+        """
+        項目が text と一致する (exact=False なら text を含む) レコードを追加順に返す。
+        大文字と小文字は区別しない。
+        """
+        field = self.fields.get(field_name)
+        text = normalize(text)
+        if field is None or not text:
+            return []
+        if field_name not in self.built:
+            self._build(field_name)
+        record_ids = field.exact(text) if exact else field.partial(text)
+        return [self.records[record_id] for record_id in sorted(record_ids, key=self.sequence.__getitem__)]
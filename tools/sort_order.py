@@ -0,0 +1,58 @@
+# 一覧のソート順のキャッシュ
+# (ビュー, 列) ごとに全レコードの安定ソート順を一度だけ計算して保存しておき、
+# 昇順・降順の切り替えや検索結果の並べ替えはその順序を使い回す (O(n))。
+# レコードの値が変わったら invalidate() で捨てる。
+
+
+class SortOrderCache:
+    """
+    ソート順のキャッシュ。
+
+    昇順の並びと、同じキーが続く区間の開始位置を保存しておく。
+    降順は区間の順番だけを逆にすることで、同じキーの中では元の並びを保つ (reverse=True の sort と同じ結果)。
+    """
+
+    def __init__(self):
+        self.entries = {} # (ビュー, 列のタプル) -> {昇順か: 並び}
+
+    def invalidate(self, view=None):
+        if view is None:
+            self.entries = {}
+        else:
+            self.entries = {key: value for key, value in self.entries.items() if key[0] != view}
+
+    def _orders(self, view, records, columns, key_funcs):
+        orders = self.entries.get((view, columns))
+        if orders is None:
+            if len(key_funcs) == 1:
+                keys = list(map(key_funcs[0], records))
+            else:
+                keys = [tuple(key_func(record) for key_func in key_funcs) for record in records]
+            indices = sorted(range(len(records)), key=keys.__getitem__)
+            ascending = [records[i] for i in indices]
+            run_starts = [position for position in range(len(indices)) if position == 0 or keys[indices[position]] != keys[indices[position - 1]]]
+            bounds = run_starts + [len(indices)]
+            descending = []
+            for run in range(len(run_starts) - 1, -1, -1):
+                descending.extend(ascending[bounds[run]:bounds[run + 1]])
+            orders = self.entries[(view, columns)] = {True: ascending, False: descending}
+        return orders
+
+    def sort(self, view, records, subset, columns, key_funcs, ascending=True):
+        """
+        subset (records の一部) を columns の順に並べたリストを返す。
+
+        Args:
+            view: ビューの識別子
+            records (list): ビューの全レコード
+            subset (list): 並べ替えるレコード (検索結果など)
+            columns (tuple[str]): ソートする列名 (複数なら先頭から優先)
+            key_funcs (list[callable]): 各列のキー関数
+            ascending (bool): 昇順か
+        """
+        order = self._orders(view, records, columns, key_funcs)[ascending]
+        if len(subset) == len(records):
+            return list(order)
+        # 検索結果はキャッシュした順序から拾う
+        subset_ids = set(map(id, subset))
+        return [record for record in order if id(record) in subset_ids]
@@ -0,0 +1,306 @@
+import os
+import re
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+import clausewitz
+
+# ステート・戦略地域・プロビンス定義のパースと並列ロード
+# GUI に依存しないので、プロセスプールのワーカーからも呼び出せる。
+
+# キャッシュするレコードの形式を変えたら上げる
+RECORD_VERSION = 3
+
+# これより少ないファイル数ならプールを起動せずにその場でパースする
+MIN_FILES_FOR_POOL = 32
+
+
+class ProvinceRecord:
+    """
+    プロビンス1件分のデータ。
+
+    1万件以上あるので辞書ではなく __slots__ で持ち、値はパース時に一度だけ数値・真偽値に変換する。
+    地形の文字列は sys.intern で共有する。
+    province_info["state_id"] のように辞書と同じ書き方でも読み書きできる。
+    """
+    __slots__ = ("province_id", "r", "g", "b", "terrain_type", "is_coastal", "state_id")
+
+    def __init__(self, province_id, r, g, b, terrain_type, is_coastal, state_id=-1):
+        self.province_id = province_id
+        self.r = r
+        self.g = g
+        self.b = b
+        self.terrain_type = terrain_type
+        self.is_coastal = is_coastal
+        self.state_id = state_id
+
+    def __getitem__(self, key):
+        return getattr(self, key)
+
+    def __setitem__(self, key, value):
+        setattr(self, key, value)
+
+    def __repr__(self):
+        return f"ProvinceRecord({self.province_id}, state_id={self.state_id})"
+
+
+class LoadTimer:
+    """ロード処理の各フェーズの所要時間を記録する。"""
+
+    def __init__(self, name):
+        self.name = name
+        self.phases = [] # (フェーズ名, 秒)
+        self.notes = []
+        self._started = time.perf_counter()
+        self._last = self._started
+
+    def mark(self, phase):
+        now = time.perf_counter()
+        self.phases.append((phase, now - self._last))
+        self._last = now
+
+    def note(self, text):
+        self.notes.append(text)
+
+    @property
+    def total(self):
+        return self._last - self._started
+
+    def report(self):
+        phases = ", ".join(f"{phase} {seconds * 1000:.1f}ms" for phase, seconds in self.phases)
+        notes = f" ({'; '.join(self.notes)})" if self.notes else ""
+        return f"[load] {self.name}: {phases}, total {self.total * 1000:.1f}ms{notes}"
+
+
+def resolve_workers(workers):
+    """0 以下ならCPUコア数を使う。"""
+    if workers and workers > 0:
+        return workers
+    return os.cpu_count() or 1
+
+
+def list_script_files(directory):
+    """ディレクトリ内の .txt ファイルを名前順 (決定的な順序) で返す。"""
+    return [os.path.join(directory, filename) for filename in sorted(os.listdir(directory)) if filename.endswith(".txt")]
+
+
+def parse_files(filepaths, parse_func, workers=0, executor="process"):
+    """
+    ファイルを並列にパースし、入力と同じ順序で結果を返す。
+
+    Args:
+        filepaths (list[str]): パースするファイル
+        parse_func: モジュールレベルの関数 (プロセスプールに渡すため)
+        workers (int): ワーカー数 (0 ならCPUコア数)
+        executor (str): "process" または "thread"
+    """
+    results = [None] * len(filepaths)
+    for indices, batch in iter_parsed(filepaths, parse_func, workers, executor):
+        for index, record in zip(indices, batch):
+            results[index] = record
+    return results
+
+
+def _parse_chunk(parse_func, filepaths):
+    return [parse_func(filepath) for filepath in filepaths]
+
+
+def iter_parsed(filepaths, parse_func, workers=0, executor="process", batch_size=64, cancelled=None):
+    """
+    ファイルを並列にパースし、終わったチャンクから (インデックスのリスト, 結果のリスト) を返す。
+    cancelled が True を返したら残りのチャンクを破棄して終了する。
+    """
+    workers = min(resolve_workers(workers), len(filepaths))
+    chunks = [list(range(start, min(start + batch_size, len(filepaths)))) for start in range(0, len(filepaths), batch_size)]
+    if workers <= 1 or len(filepaths) < MIN_FILES_FOR_POOL:
+        for indices in chunks:
+            if cancelled and cancelled():
+                return
+            yield indices, _parse_chunk(parse_func, [filepaths[index] for index in indices])
+        return
+    pool_class = ThreadPoolExecutor if executor == "thread" else ProcessPoolExecutor
+    pool = pool_class(max_workers=workers)
+    try:
+        futures = {pool.submit(_parse_chunk, parse_func, [filepaths[index] for index in indices]): indices for indices in chunks}
+        for future in as_completed(futures):
+            if cancelled and cancelled():
+                return
+            yield futures[future], future.result()
+    finally:
+        pool.shutdown(wait=True, cancel_futures=True)
+
+
+def load_records(namespace, filepaths, parse_func, cache=None, workers=0, executor="process", timer=None):
+    """
+    キャッシュに無いファイルだけを並列にパースし、filepaths の順にレコードを返す。
+    パースできなかったファイルの位置には None が入る。
+
+    Args:
+        namespace (str): キャッシュの名前空間
+        filepaths (list[str]): 対象ファイル
+        parse_func: filepath を受け取ってレコードを返す関数
+        cache (ParseCache): パースキャッシュ (None ならキャッシュしない)
+        timer (LoadTimer): 各フェーズの時間を記録するタイマー
+    """
+    records = [None] * len(filepaths)
+    for indices, batch in iter_records(namespace, filepaths, parse_func, cache, workers, executor, timer):
+        for index, record in zip(indices, batch):
+            records[index] = record
+    return records
+
+
+def iter_records(namespace, filepaths, parse_func, cache=None, workers=0, executor="process", timer=None, batch_size=64, cancelled=None):
+    """
+    load_records の逐次版。キャッシュ済みのレコードを先に、続いてパースが終わった順に
+    (インデックスのリスト, レコードのリスト) を返す。並べ替えは呼び出し側で行う。
+    """
+    misses = []
+    stats = {}
+    cached_indices = []
+    cached_records = []
+    for index, filepath in enumerate(filepaths):
+        if cache is None:
+            misses.append(index)
+            continue
+        try:
+            stat = os.stat(filepath)
+        except OSError:
+            misses.append(index)
+            continue
+        cached = cache.lookup(namespace, filepath, stat)
+        if cached is None:
+            stats[index] = stat
+            misses.append(index)
+        else:
+            cached_indices.append(index)
+            cached_records.append(cached[0])
+    if timer:
+        timer.mark(f"{namespace} cache")
+    for start in range(0, len(cached_indices), batch_size * 4):
+        yield cached_indices[start:start + batch_size * 4], cached_records[start:start + batch_size * 4]
+
+    miss_paths = [filepaths[index] for index in misses]
+    for chunk_indices, batch in iter_parsed(miss_paths, parse_func, workers, executor, batch_size, cancelled):
+        indices = [misses[chunk_index] for chunk_index in chunk_indices]
+        if cache is not None:
+            for index, record in zip(indices, batch):
+                if index in stats:
+                    cache.store(namespace, filepaths[index], (record,), stats[index])
+        yield indices, batch
+    if cancelled and cancelled():
+        return
+    if timer:
+        timer.mark(f"{namespace} parse")
+        timer.note(f"{namespace}: {len(filepaths) - len(misses)} cached, {len(misses)} parsed")
+    if cache is not None:
+        cache.prune(namespace, filepaths)
+
+
+def parse_state_file(filepath, text=None):
+    # text を渡した場合はファイルを読まずにその内容をパースする (未保存の編集内容など)
+    filename = os.path.basename(filepath)
+    state_id_match = re.match(r"(\d+)-(.+)\.txt", filename)
+    if not state_id_match:
+        return None
+    state_id = int(state_id_match.group(1))
+    state_name_from_file = state_id_match.group(2)
+    state_name_from_file = state_name_from_file.replace("_", " ").title()
+
+    owner = "N/A"
+    manpower = None # 人口 (整数)。書かれていなければ None
+    provinces = [] # プロビンスリストを初期化
+    localisation_key = None
+    building_provinces = [] # buildings 内でプロビンスごとに建物を置いているプロビンスID
+    victory_point_provinces = [] # 勝利点のあるプロビンスID
+
+    try:
+        root = clausewitz.parse_file(filepath) if text is None else clausewitz.parse_text(text)
+        state = root.get("state")
+        if state is None:
+            print(f"Error parsing {filepath}: state block not found")
+            return None
+        history = state.get("history")
+        if isinstance(history, clausewitz.Block):
+            owner = history.get("owner", owner) # 日付ブロック内の owner は対象外
+            for buildings in history.get_all("buildings"):
+                if isinstance(buildings, clausewitz.Block):
+                    building_provinces.extend(key for key in buildings.keys() if key.isdigit())
+            for victory_points in history.get_all("victory_points"):
+                if isinstance(victory_points, clausewitz.Block):
+                    victory_point_provinces.extend(victory_points.values()[0::2]) # { プロビンスID 点数 }
+        owner = sys.intern(owner) # 同じ国タグの文字列を共有する
+        manpower_value = state.get("manpower")
+        if isinstance(manpower_value, str) and manpower_value.isdigit():
+            manpower = int(manpower_value)
+        localisation_key = state.get("name")
+
+        # プロビンスIDのリストを抽出
+        provinces_block = state.get("provinces")
+        if isinstance(provinces_block, clausewitz.Block):
+            provinces = provinces_block.values()
+        if not provinces:
+            provinces = state.get_all("add_province")
+
+    except Exception as e:
+        print(f"Error parsing {filepath}: {e}")
+        return None
+
+    return {"state_id": state_id, "filename": filename, "state_name": state_name_from_file, "localisation_key": localisation_key, "localized_name": "N/A", "owner": owner, "manpower": manpower, "provinces": provinces,
+            "building_provinces": building_provinces, "victory_point_provinces": victory_point_provinces}
+
+
+def parse_definition_csv(filepath):
+    rows = []
+    try:
+        with open(filepath, 'r', encoding='utf-8') as f:
+            # CSVファイルをパース (ヘッダー行はスキップ)
+            next(f)  # 1行目をスキップ
+            for line in f:
+                items = line.strip().split(';')
+                if len(items) < 6: # データが足りない場合はスキップ
+                    continue
+                province_id, r, g, b, terrain_type, is_coastal = items[:6]
+                # 7列目が "true" または "false" の場合のみ処理
+                if is_coastal == "true" or is_coastal == "false":
+                    try:
+                        rows.append((int(province_id), int(r), int(g), int(b), sys.intern(terrain_type), is_coastal == "true"))
+                    except ValueError:
+                        continue # 数値でない行はスキップ
+    except Exception as e:
+        print(f"Error loading province data from {filepath}: {e}")
+    return rows
+
+
+def parse_strategic_region_file(filepath, text=None):
+    filename = os.path.basename(filepath)
+    strategic_region_name_match = re.match(r"(.+)\.txt", filename) # ファイル名から拡張子を除いた部分を取得
+    if not strategic_region_name_match:
+        return None
+
+    strategic_region_name = strategic_region_name_match.group(1)
+    strategic_region_id = -1 # IDはファイル名から取得できないため、-1 で初期化
+    provinces = []
+
+    try:
+        root = clausewitz.parse_file(filepath) if text is None else clausewitz.parse_text(text)
+        region = root.get("strategic_region")
+        if region is None:
+            print(f"Error parsing strategic region file {filepath}: strategic_region block not found")
+            return None
+        strategic_region_id_value = region.get("id")
+        if strategic_region_id_value and strategic_region_id_value.isdigit():
+            strategic_region_id = int(strategic_region_id_value)
+        provinces_block = region.get("provinces") # provinces を抽出
+        if isinstance(provinces_block, clausewitz.Block):
+            provinces = provinces_block.values()
+
+    except Exception as e:
+        print(f"Error parsing strategic region file {filepath}: {e}")
+        return None
+
+    return {
+        "strategic_region_id": strategic_region_id,
+        "strategic_region_name": strategic_region_name, # ファイル名 (拡張子なし) を戦略地域名とする
+        "localized_name": "N/A",
+        "provinces": provinces, # プロビンスリストを追加
+    }
@@ -0,0 +1,374 @@
+import re
+
+import numpy as np
+
+# 検索バーで使う複合条件のクエリ言語
+# 例: owner=GER and manpower>1000000 and region~baltic
+#
+# クエリは一度だけ構文解析して条件の木にしておき (compile_query)、
+# ステート・プロビンス・戦略地域の列 (NumPy 配列) に対してまとめて真偽値のマスクを計算する。
+# 別の表の項目を使った条件 (プロビンスビューで owner=GER など) は、
+# プロビンス -> ステート / 戦略地域の行番号の配列を使ってマスクを移し替えるだけで求める。
+#
+# 演算子: =  !=  >  >=  <  <=  ~ (部分一致)。文字列の比較は大文字と小文字を区別しない。
+# 条件は and / or / not と括弧で組み合わせる。空白を含む値は "..." で囲む。
+
+TABLES = ("state", "province", "region")
+
+# テーブル名を付けずに書ける別名
+ALIASES = {
+    "state": ("state", "id"),
+    "province": ("province", "id"),
+    "provinces": ("province", "id"),
+    "region": ("region", "name"),
+}
+
+_TOKEN_RE = re.compile(r'''
+    (?P<space>\s+)
+  | (?P<open>\()
+  | (?P<close>\))
+  | (?P<operator>!=|>=|<=|=|<|>|~)
+  | (?P<string>"[^"]*")
+  | (?P<word>[^\s()=!<>~"]+)
+''', re.VERBOSE)
+
+_KEYWORDS = {"and", "or", "not"}
+
+
+class QueryError(ValueError):
+    pass
+
+
+def _normalize(value):
+    return str(value).strip().casefold()
+
+
+def _parse_int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class CategoricalColumn:
+    """
+    文字列の列。値の種類 (categories) とその番号 (codes) で持ち、
+    条件は種類ごとに一度だけ評価してから codes で全行に広げる。
+    """
+
+    def __init__(self, values):
+        normalized = np.array([_normalize(value) for value in values] or [""], dtype=object)
+        self.categories, codes = np.unique(normalized, return_inverse=True)
+        self.codes = codes[:len(values)]
+
+    def compare(self, operator, value):
+        value = _normalize(value)
+        categories = self.categories
+        if operator == "=":
+            matched = categories == value
+        elif operator == "!=":
+            matched = categories != value
+        elif operator == "~":
+            matched = np.array([value in category for category in categories], dtype=bool)
+        else:
+            matched = _compare_array(categories, operator, value)
+        return matched[self.codes]
+
+
+class IntColumn:
+    """整数の列。数値にできない値 (N/A など) は比較の対象外にする。"""
+
+    def __init__(self, values):
+        parsed = [_parse_int(value) for value in values]
+        self.present = np.array([value is not None for value in parsed], dtype=bool)
+        self.values = np.array([value if value is not None else 0 for value in parsed], dtype=np.int64)
+        self._text = None
+
+    def compare(self, operator, value):
+        if operator == "~":
+            if self._text is None:
+                self._text = CategoricalColumn([str(value) if present else "" for value, present in zip(self.values.tolist(), self.present.tolist())])
+            return self._text.compare(operator, value) & self.present
+        number = _parse_int(value)
+        if number is None:
+            raise QueryError(f"数値ではありません: {value}")
+        if operator == "!=":
+            return (self.values != number) | ~self.present
+        return _compare_array(self.values, operator, number) & self.present
+
+
+def _compare_array(values, operator, value):
+    if operator == "=":
+        return values == value
+    if operator == ">":
+        return values > value
+    if operator == ">=":
+        return values >= value
+    if operator == "<":
+        return values < value
+    if operator == "<=":
+        return values <= value
+    raise QueryError(f"不明な演算子です: {operator}")
+
+
+class QueryStore:
+    """
+    ステート・プロビンス・戦略地域の列データと、表どうしの対応 (プロビンス -> ステート / 戦略地域の行番号)。
+
+    Args:
+        states (list[dict]): ステートのレコード
+        provinces (list[dict]): プロビンスのレコード
+        regions (list[dict]): 戦略地域のレコード
+    """
+
+    def __init__(self, states, provinces, regions):
+        self.records = {"state": states, "province": provinces, "region": regions}
+        self.columns = {
+            "state": {
+                "id": IntColumn([x["state_id"] for x in states]),
+                "name": CategoricalColumn([x["state_name"] for x in states]),
+                "localized": CategoricalColumn([x["localized_name"] for x in states]),
+                "owner": CategoricalColumn([x["owner"] for x in states]),
+                "manpower": IntColumn([x["manpower"] for x in states]),
+            },
+            "province": {
+                "id": IntColumn([x["province_id"] for x in provinces]),
+                "terrain": CategoricalColumn([x["terrain_type"] for x in provinces]),
+                "coastal": CategoricalColumn([x["is_coastal"] for x in provinces]),
+                "r": IntColumn([x["r"] for x in provinces]),
+                "g": IntColumn([x["g"] for x in provinces]),
+                "b": IntColumn([x["b"] for x in provinces]),
+                "state": IntColumn([x["state_id"] for x in provinces]),
+            },
+            "region": {
+                "id": IntColumn([x["strategic_region_id"] for x in regions]),
+                "name": CategoricalColumn([x["strategic_region_name"] for x in regions]),
+                "localized": CategoricalColumn([x["localized_name"] for x in regions]),
+            },
+        }
+
+        # プロビンスごとの所属ステート・戦略地域の行番号 (所属なしは -1)
+        state_row = {x["state_id"]: row for row, x in enumerate(states)}
+        region_row = {}
+        for row, region_info in enumerate(regions):
+            for province_id in region_info["provinces"]:
+                region_row[str(province_id)] = row
+        self.province_state_row = np.array([state_row.get(x["state_id"], -1) for x in provinces], dtype=np.int64)
+        self.province_region_row = np.array([region_row.get(str(x["province_id"]), -1) for x in provinces], dtype=np.int64)
+
+    def size(self, table):
+        return len(self.records[table])
+
+    def _rows_of(self, table):
+        return self.province_state_row if table == "state" else self.province_region_row
+
+    def project(self, mask, source, target):
+        """source の表のマスクを target の表のマスクに移し替える。"""
+        if source == target:
+            return mask
+        if source == "province":
+            # プロビンスが1つでも条件を満たすステート / 戦略地域
+            rows = self._rows_of(target)[mask]
+            result = np.zeros(self.size(target), dtype=bool)
+            result[rows[rows >= 0]] = True
+            return result
+        if target == "province":
+            # 所属するステート / 戦略地域が条件を満たすプロビンス
+            return np.append(mask, False)[self._rows_of(source)]
+        return self.project(self.project(mask, source, "province"), "province", target)
+
+    def select(self, query, table):
+        """クエリに一致するレコードを元の並び順で返す。"""
+        mask = query.evaluate(self, table)
+        records = self.records[table]
+        return [records[row] for row in np.flatnonzero(mask).tolist()]
+
+
+class _Comparison:
+    __slots__ = ("table", "column", "operator", "value")
+
+    def __init__(self, table, column, operator, value):
+        self.table = table
+        self.column = column
+        self.operator = operator
+        self.value = value
+
+    def evaluate(self, store, table):
+        mask = store.columns[self.table][self.column].compare(self.operator, self.value)
+        return store.project(mask, self.table, table)
+
+
+class _And:
+    __slots__ = ("left", "right")
+
+    def __init__(self, left, right):
+        self.left = left
+        self.right = right
+
+    def evaluate(self, store, table):
+        return self.left.evaluate(store, table) & self.right.evaluate(store, table)
+
+
+class _Or:
+    __slots__ = ("left", "right")
+
+    def __init__(self, left, right):
+        self.left = left
+        self.right = right
+
+    def evaluate(self, store, table):
+        return self.left.evaluate(store, table) | self.right.evaluate(store, table)
+
+
+class _Not:
+    __slots__ = ("operand",)
+
+    def __init__(self, operand):
+        self.operand = operand
+
+    def evaluate(self, store, table):
+        return ~self.operand.evaluate(store, table)
+
+
+class Query:
+    """compile_query() で構文解析済みのクエリ。"""
+
+    def __init__(self, text, table, root):
+        self.text = text
+        self.table = table
+        self.root = root
+
+    def evaluate(self, store, table=None):
+        return self.root.evaluate(store, table or self.table)
+
+
+# 各表で使える項目名 (QueryStore.columns と同じ)
+FIELDS = {
+    "state": ("id", "name", "localized", "owner", "manpower"),
+    "province": ("id", "terrain", "coastal", "r", "g", "b", "state"),
+    "region": ("id", "name", "localized"),
+}
+INT_COLUMNS = {"id", "manpower", "r", "g", "b", "state"}
+
+
+def resolve_field(name, table):
+    """
+    項目名を (表, 列) にする。"state.owner" のように表を指定でき、
+    指定しなければ table の項目、別名、他の表の項目の順に探す。
+    """
+    name = name.casefold()
+    if "." in name:
+        table_name, column = name.split(".", 1)
+        if table_name in FIELDS and column in FIELDS[table_name]:
+            return table_name, column
+    elif name in FIELDS[table]:
+        return table, name
+    elif name in ALIASES:
+        return ALIASES[name]
+    else:
+        for other in TABLES:
+            if name in FIELDS[other]:
+                return other, name
+    raise QueryError(f"不明な項目です: {name} (使える項目: " + ", ".join(f"{t}.{c}" for t in TABLES for c in FIELDS[t]) + ")")
+
+
+def _tokenize(text):
+    tokens = []
+    position = 0
+    while position < len(text):
+        match = _TOKEN_RE.match(text, position)
+        if match is None:
+            raise QueryError(f"解釈できない文字があります: {text[position:]}")
+        position = match.end()
+        kind = match.lastgroup
+        if kind == "space":
+            continue
+        value = match.group()
+        if kind == "string":
+            kind, value = "value", value[1:-1]
+        elif kind == "word" and value.casefold() in _KEYWORDS:
+            kind, value = "keyword", value.casefold()
+        tokens.append((kind, value))
+    return tokens
+
+
+class _Parser:
+    def __init__(self, tokens, table):
+        self.tokens = tokens
+        self.position = 0
+        self.table = table
+
+    def peek(self):
+        return self.tokens[self.position] if self.position < len(self.tokens) else (None, None)
+
+    def take(self):
+        token = self.peek()
+        self.position += 1
+        return token
+
+    def parse(self):
+        node = self.parse_or()
+        if self.position < len(self.tokens):
+            raise QueryError(f"余分な語があります: {self.peek()[1]}")
+        return node
+
+    def parse_or(self):
+        node = self.parse_and()
+        while self.peek() == ("keyword", "or"):
+            self.take()
+            node = _Or(node, self.parse_and())
+        return node
+
+    def parse_and(self):
+        node = self.parse_not()
+        while True:
+            kind, value = self.peek()
+            if (kind, value) == ("keyword", "and"):
+                self.take()
+            elif kind not in ("word", "open") and (kind, value) != ("keyword", "not"):
+                return node
+            # and は省略できる (owner=GER manpower>100 も可)
+            node = _And(node, self.parse_not())
+
+    def parse_not(self):
+        if self.peek() == ("keyword", "not"):
+            self.take()
+            return _Not(self.parse_not())
+        return self.parse_primary()
+
+    def parse_primary(self):
+        kind, value = self.take()
+        if kind == "open":
+            node = self.parse_or()
+            if self.take()[0] != "close":
+                raise QueryError("')' がありません")
+            return node
+        if kind != "word":
+            raise QueryError(f"項目名が必要です: {value if value is not None else '(クエリの終わり)'}")
+        table, column = resolve_field(value, self.table)
+        operator_kind, operator = self.take()
+        if operator_kind != "operator":
+            raise QueryError(f"{value} の後に演算子 (= != > >= < <= ~) が必要です")
+        value_kind, operand = self.take()
+        if value_kind not in ("word", "value"):
+            raise QueryError(f"{value} {operator} の後に値が必要です")
+        if column in INT_COLUMNS and operator != "~" and _parse_int(operand) is None:
+            raise QueryError(f"{table}.{column} は数値で比較してください: {operand}")
+        return _Comparison(table, column, operator, operand)
+
+
+def compile_query(text, table):
+    """
+    クエリ文字列を構文解析する。
+
+    Args:
+        text (str): クエリ
+        table (str): 結果を返す表 ("state", "province", "region")
+
+    Returns:
+        Query: 評価できるクエリ
+    """
+    tokens = _tokenize(text)
+    if not tokens:
+        raise QueryError("クエリが空です")
+    return Query(text, table, _Parser(tokens, table).parse())
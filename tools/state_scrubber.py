@@ -0,0 +1,68 @@
+import difflib
+import os
+
+import clausewitz
+
+# ステートの履歴のリセット (所有者・中核・請求などの文をブロックごと取り除く)
+# 各ファイルを1回だけ読んで構文としてパースし、キーが一致する文だけを元のテキストから削除する。
+# 内容が変わらないファイルには書き込まず、書き込みは一時ファイルからの置き換えで行う (途中で失敗しても元のファイルは壊れない)。
+# history/scripts/000_state.py から state_loader.parse_files() でプロセスプールに渡して使う。
+
+# 削除する文のキー (ブロックごと削除する)
+REMOVE_KEYS = frozenset({'owner', 'add_core_of', 'add_claim_by', 'add_to_array', 'add_dynamic_modifier', 'set_demilitarized_zone'})
+
+
+def scrub_text(text, remove_keys=REMOVE_KEYS):
+    """
+    キーが remove_keys の文をすべて (入れ子のブロックの中も) 取り除いたテキストを返す。
+
+    Returns:
+        tuple[str, dict]: 新しいテキストと、キー -> 削除した数
+    """
+    root = clausewitz.parse_text(text)
+    entries = [entry for entry in clausewitz.walk(root) if entry.key in remove_keys]
+    removed = {}
+    for entry in entries:
+        removed[entry.key] = removed.get(entry.key, 0) + 1
+    return clausewitz.delete_entries(text, entries), removed
+
+
+def scrub_file(filepath, remove_keys=REMOVE_KEYS, write=True, diff=False):
+    """
+    1つのステートファイルをリセットする。
+
+    Args:
+        filepath (str): ステートファイルのパス
+        remove_keys (set[str]): 削除する文のキー
+        write (bool): False なら書き込まない (dry-run)
+        diff (bool): True なら結果に unified diff を含める
+
+    Returns:
+        dict: filepath、changed (内容が変わるか)、removed (キー -> 削除した数)、diff、error (パースできなければそのメッセージ)
+    """
+    result = {"filepath": filepath, "changed": False, "removed": {}, "diff": "", "error": None}
+    try:
+        with open(filepath, 'r', encoding='utf-8', newline='') as f: # 改行コードはそのまま残す
+            content = f.read()
+        new_content, result["removed"] = scrub_text(content, remove_keys)
+    except (OSError, UnicodeDecodeError, clausewitz.ClausewitzSyntaxError) as e:
+        result["error"] = str(e)
+        return result
+    if new_content == content:
+        return result
+    result["changed"] = True
+    if diff:
+        result["diff"] = "".join(difflib.unified_diff(content.splitlines(keepends=True), new_content.splitlines(keepends=True),
+                                                      fromfile=filepath, tofile=filepath))
+    if write:
+        temp_path = filepath + ".tmp"
+        try:
+            with open(temp_path, 'w', encoding='utf-8', newline='') as f:
+                f.write(new_content)
+            os.replace(temp_path, filepath)
+        except OSError as e:
+            result["error"] = str(e)
+            result["changed"] = False
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+    return result
@@ -2,6 +2,7 @@ import tkinter as tk
 from tkinter import ttk
 import os
 import re
+import clausewitz
 
 class StateFileLister(tk.Frame):
     def __init__(self, master=None, state_dir="history/states", localisation_dir="localisation/japanese"):
@@ -136,23 +137,22 @@ class StateFileLister(tk.Frame):
         localisation_key = None # ローカライズキーを初期化
 
         try:
-            with open(filepath, 'r', encoding='utf-8') as f:
-                content = f.read()
-                owner_match = re.search(r"owner\s*=\s*([A-Z]{3})", content)
-                if owner_match:
-                    owner = owner_match.group(1)
-                manpower_match = re.search(r"manpower\s*=\s*(\d+)", content)
-                if manpower_match:
-                    manpower = manpower_match.group(1)
-                name_match = re.search(r"name\s*=\s*\"(.*?)\"", content) # ローカライズキーを抽出
-                if name_match:
-                    localisation_key = name_match.group(1)
-                    if localisation_key in self.localisation_strings: # ローカライズ名を取得
-                        localized_name = self.localisation_strings[localisation_key]
-                    else:
-                        localized_name = f"<{localisation_key} not found>" # 見つからない場合はキーを表示
+            state = clausewitz.parse_file(filepath).get("state")
+            if state is None:
+                print(f"Error parsing {filepath}: state block not found")
+                return None
+            history = state.get("history")
+            if isinstance(history, clausewitz.Block):
+                owner = history.get("owner", owner) # 日付ブロック内の owner は対象外
+            manpower = state.get("manpower", manpower)
+            localisation_key = state.get("name") # ローカライズキーを抽出
+            if localisation_key:
+                if localisation_key in self.localisation_strings: # ローカライズ名を取得
+                    localized_name = self.localisation_strings[localisation_key]
                 else:
-                    localized_name = state_name_from_file # ローカライズキーがない場合はファイル名から生成した名前を使用
+                    localized_name = f"<{localisation_key} not found>" # 見つからない場合はキーを表示
+            else:
+                localized_name = state_name_from_file # ローカライズキーがない場合はファイル名から生成した名前を使用
 
         except Exception as e:
             print(f"Error parsing {filepath}: {e}")
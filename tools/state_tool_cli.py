@@ -0,0 +1,325 @@
+import argparse
+import csv
+import os
+import sys
+import time
+
+from edit_journal import JournalCommitError
+import state_validator
+from state_query import QueryError
+import state_tool_core
+from state_tool_core import StateToolCore, TransferError, load_config
+
+# ステートツールのコマンドライン版 (Qt を使わない)
+# リポジトリ直下で実行する。例:
+#   python tools/state_tool_cli.py list states --sort manpower --descending
+#   python tools/state_tool_cli.py query provinces "owner=GER and coastal=true"
+#   python tools/state_tool_cli.py transfer --provinces 1 2 3 --to 42
+#   python tools/state_tool_cli.py apply edits.csv
+# 出力はタブ区切り。移譲は読み込み1回・書き込み1回 (変更のあったファイルごとに1回) で行う。
+
+TABLE_NAMES = {
+    "state": "state", "states": "state",
+    "province": "province", "provinces": "province",
+    "region": "region", "regions": "region",
+}
+
+# 表ごとの出力列 (列名は state_query の項目名と同じ)
+COLUMNS = {
+    "state": [
+        ("id", lambda x: x["state_id"]),
+        ("name", lambda x: x["state_name"]),
+        ("localized", lambda x: x["localized_name"]),
+        ("owner", lambda x: x["owner"]),
+        ("manpower", lambda x: x["manpower"]),
+        ("provinces", lambda x: " ".join(x["provinces"])),
+    ],
+    "province": [
+        ("id", lambda x: x.province_id),
+        ("terrain", lambda x: x.terrain_type),
+        ("coastal", lambda x: "true" if x.is_coastal else "false"),
+        ("r", lambda x: x.r),
+        ("g", lambda x: x.g),
+        ("b", lambda x: x.b),
+        ("state", lambda x: x.state_id),
+    ],
+    "region": [
+        ("id", lambda x: x["strategic_region_id"]),
+        ("name", lambda x: x["strategic_region_name"]),
+        ("localized", lambda x: x["localized_name"]),
+        ("provinces", lambda x: " ".join(x["provinces"])),
+    ],
+}
+
+
+def table_name(value):
+    if value not in TABLE_NAMES:
+        raise argparse.ArgumentTypeError(f"表は {', '.join(sorted(TABLE_NAMES))} のいずれかです: {value}")
+    return TABLE_NAMES[value]
+
+
+def sort_key(getter):
+    def key(record):
+        value = getter(record)
+        if value is None:
+            return (0, 0) # 人口が無いステートなどは 0 として扱う
+        if isinstance(value, str):
+            return (1, value.lower())
+        return (0, value)
+    return key
+
+
+def stats_columns(core, table):
+    """--stats で追加する列 (provinces.bmp から求めた画素数と重心)。"""
+    def field(name, index=None):
+        def getter(record):
+            stats = core.record_stats(table, record)
+            if stats is None:
+                return None
+            value = stats[name]
+            return value if index is None else round(value[index], 1)
+        return getter
+    return [("area", field("area")), ("cx", field("centroid", 0)), ("cy", field("centroid", 1))]
+
+
+def logistics_columns():
+    """--logistics で追加するステートの列。"""
+    return [
+        ("supply_distance", lambda x: x.get("supply_distance")),
+        ("railway_level", lambda x: x.get("railway_level")),
+        ("supply_nodes", lambda x: x.get("supply_nodes")),
+    ]
+
+
+def localisation_columns(core, table, languages):
+    """--languages で追加する、言語ごとのローカライズ名の列。"""
+    def getter(language):
+        return lambda record: state_tool_core.localized_name(table, record, core.localisation.strings(language))
+    return [(f"localized_{language}", getter(language)) for language in languages]
+
+
+def write_records(records, table, sort=None, descending=False, out=None, extra_columns=()):
+    out = out or sys.stdout
+    columns = COLUMNS[table] + list(extra_columns)
+    if sort:
+        getters = dict(columns)
+        if sort not in getters:
+            raise QueryError(f"ソートできない列です: {sort} (使える列: {', '.join(name for name, _ in columns)})")
+        records = sorted(records, key=sort_key(getters[sort]), reverse=descending)
+    writer = csv.writer(out, delimiter="\t", lineterminator="\n")
+    writer.writerow([name for name, _ in columns])
+    for record in records:
+        writer.writerow(["" if value is None else value for value in (getter(record) for _, getter in columns)])
+
+
+def read_edits(filepath):
+    """
+    移譲のリストを CSV から読む。1列目がプロビンスID、2列目が移譲先ステートID。
+    1行目が数値でなければ見出しとして読み飛ばす。空行と # で始まる行は無視する。
+
+    Returns:
+        list[tuple[str, int]]: (プロビンスID, 移譲先ステートID) のリスト
+    """
+    edits = []
+    errors = []
+    with open(filepath, "r", encoding="utf-8-sig", newline="") as f:
+        for line_number, row in enumerate(csv.reader(f), 1):
+            row = [cell.strip() for cell in row]
+            if not row or not any(row) or row[0].startswith("#"):
+                continue
+            if len(row) < 2 or not row[0].isdigit() or not row[1].isdigit():
+                if line_number == 1 and not row[0].isdigit():
+                    continue # 見出し
+                errors.append(f"{filepath}:{line_number}: プロビンスIDと移譲先ステートIDが必要です: {','.join(row)}")
+                continue
+            edits.append((str(int(row[0])), int(row[1])))
+    if errors:
+        raise TransferError("\n".join(errors))
+    return edits
+
+
+def write_building_warnings(core):
+    """移譲したプロビンスに、map/buildings.txt では元のステートのままの配置があれば警告する。"""
+    for entry in core.moved_building_positions():
+        print(f"警告: map/buildings.txt の {entry['type']} ({entry['x']:.2f}, {entry['z']:.2f}) はステート {entry['state']} のままですが、"
+              f"プロビンス {entry['province']} はステート {entry['current_state']} に移りました", file=sys.stderr)
+
+
+def run_transfer(core, edits, label, dry_run):
+    moved = core.transfer(edits)
+    write_building_warnings(core)
+    contents = core.pending_contents()
+    if dry_run:
+        for filepath in sorted(contents):
+            print(f"変更予定: {filepath}")
+        print(f"{moved} 個のプロビンスを移譲します ({len(contents)} ファイル、書き込みはしません)。")
+        return
+    written = core.save(label)
+    for filepath in written:
+        print(f"書き込みました: {filepath}")
+    print(f"{moved} 個のプロビンスを移譲しました ({len(written)} ファイル)。")
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="ステートツール (コマンドライン版)")
+    parser.add_argument("--config", default="state_tool_config.ini", help="設定ファイル")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    list_parser = subparsers.add_parser("list", help="レコードを一覧表示する")
+    list_parser.add_argument("table", type=table_name, help="states / provinces / regions")
+    list_parser.add_argument("--sort", help="ソートする列")
+    list_parser.add_argument("--descending", action="store_true", help="降順にする")
+    list_parser.add_argument("--stats", action="store_true", help="provinces.bmp から求めた面積 (画素数) と重心の列を追加する")
+    list_parser.add_argument("--languages", nargs="+", default=[], help="ステートと戦略地域に、指定した言語のローカライズ名の列を追加する (例: english)")
+    list_parser.add_argument("--logistics", action="store_true", help="ステートに補給拠点までの距離・鉄道レベル・補給拠点の数の列を追加する")
+
+    query_parser = subparsers.add_parser("query", help="クエリに一致するレコードを表示する")
+    query_parser.add_argument("table", type=table_name, help="states / provinces / regions")
+    query_parser.add_argument("query", help='クエリ (例: "owner=GER and manpower>1000000")')
+    query_parser.add_argument("--sort", help="ソートする列")
+    query_parser.add_argument("--descending", action="store_true", help="降順にする")
+    query_parser.add_argument("--stats", action="store_true", help="provinces.bmp から求めた面積 (画素数) と重心の列を追加する")
+    query_parser.add_argument("--languages", nargs="+", default=[], help="ステートと戦略地域に、指定した言語のローカライズ名の列を追加する (例: english)")
+    query_parser.add_argument("--logistics", action="store_true", help="ステートに補給拠点までの距離・鉄道レベル・補給拠点の数の列を追加する")
+
+    missing_parser = subparsers.add_parser("missing-localisation", help="言語ごとに、ほかの言語やステートにあってその言語に無いローカライズキーを表示する")
+    missing_parser.add_argument("--languages", nargs="+", help="比べる言語 (省略時は localisation のすべての言語)")
+
+    subparsers.add_parser("rails", help="鉄道のつながっているまとまりを表示する (2番目以降は本線から切れた鉄道)")
+
+    buildings_parser = subparsers.add_parser("buildings", help="map/buildings.txt の建物の配置の数をステートごとに表示する")
+    buildings_parser.add_argument("--types", nargs="+", help="表示する建物の種類 (省略時はすべて)")
+    buildings_parser.add_argument("--misplaced", action="store_true",
+                                  help="数の代わりに、provinces.bmp 上のプロビンスが書かれたステートに属していない配置を表示する")
+
+    transfer_parser = subparsers.add_parser("transfer", help="プロビンスを移譲する")
+    transfer_parser.add_argument("--provinces", nargs="+", required=True, help="移譲するプロビンスID")
+    transfer_parser.add_argument("--to", type=int, required=True, help="移譲先ステートID")
+    transfer_parser.add_argument("--dry-run", action="store_true", help="書き込まずに変更されるファイルを表示する")
+
+    neighbours_parser = subparsers.add_parser("neighbours", help="隣接するプロビンスを表示する")
+    neighbours_parser.add_argument("provinces", nargs="+", help="プロビンスID")
+
+    path_parser = subparsers.add_parser("path", help="2つのプロビンスを結ぶ最短経路を表示する")
+    path_parser.add_argument("source", type=int, help="出発するプロビンスID")
+    path_parser.add_argument("target", type=int, help="到着するプロビンスID")
+    path_parser.add_argument("--land", action="store_true", help="陸のプロビンスだけを通る")
+
+    validate_parser = subparsers.add_parser("validate", help="マップ全体の整合性を確認する (エラーがあれば終了コード 1)")
+    validate_parser.add_argument("--graph", action="store_true", help="provinces.bmp の隣接からステートのつながりも確認する")
+    validate_parser.add_argument("--text", action="store_true", help="JSON ではなく1行に1件の文字列で出力する")
+
+    apply_parser = subparsers.add_parser("apply", help="CSV (プロビンスID,移譲先ステートID) の移譲をまとめて行う")
+    apply_parser.add_argument("edits", help="移譲のリストの CSV ファイル")
+    apply_parser.add_argument("--dry-run", action="store_true", help="書き込まずに変更されるファイルを表示する")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    core = StateToolCore(load_config(args.config))
+    try:
+        # 移譲のリストは読み込みの前に確認する
+        edits = read_edits(args.edits) if args.command == "apply" else None
+        started = time.perf_counter()
+        core.load()
+        if args.command == "validate":
+            if args.graph and core.load_province_graph() is None:
+                return 1
+            issues = core.validate(args.graph)
+            elapsed = time.perf_counter() - started
+            if args.text:
+                for issue in issues:
+                    print(state_validator.format_issue(issue))
+                counts = state_validator.summarize(issues)
+                print(f"エラー {counts['errors']} 件、警告 {counts['warnings']} 件 ({elapsed:.3f} 秒)")
+            else:
+                print(state_validator.report_json(issues, elapsed))
+            return 1 if state_validator.summarize(issues)["errors"] else 0
+        if args.command in ("list", "query"):
+            extra_columns = []
+            if args.stats:
+                if core.load_province_stats() is None:
+                    return 1
+                extra_columns = stats_columns(core, args.table)
+            if args.languages and args.table in ("state", "region"):
+                extra_columns += localisation_columns(core, args.table, args.languages)
+            if args.logistics and args.table == "state":
+                core.load_logistics()
+                extra_columns += logistics_columns()
+            records = core.records(args.table) if args.command == "list" else core.query(args.query, args.table)
+            write_records(records, args.table, args.sort, args.descending, extra_columns=extra_columns)
+        elif args.command == "buildings":
+            writer = csv.writer(sys.stdout, delimiter="\t", lineterminator="\n")
+            buildings = core.load_buildings()
+            if args.misplaced:
+                if buildings.provinces is None:
+                    print("エラー: provinces.bmp が見つからないため、配置のプロビンスが分かりません", file=sys.stderr)
+                    return 1
+                writer.writerow(["state", "type", "x", "z", "province", "current_state"])
+                for row in buildings.misplaced(core.province_to_state).tolist():
+                    entry = buildings.entry(row)
+                    writer.writerow([entry["state"], entry["type"], entry["x"], entry["z"], entry["province"], core.province_to_state[str(entry["province"])]])
+                return 0
+            types, counts = core.building_counts()
+            for building_type in args.types or ():
+                if building_type not in types:
+                    raise QueryError(f"建物の種類がありません: {building_type} (使える種類: {', '.join(types)})")
+            columns = [types.index(building_type) for building_type in args.types] if args.types else range(len(types))
+            writer.writerow(["id", "name"] + [types[i] for i in columns])
+            for state_info in core.states:
+                row = counts[state_info["state_id"]]
+                writer.writerow([state_info["state_id"], state_info["state_name"]] + [row[i] for i in columns])
+        elif args.command == "missing-localisation":
+            writer = csv.writer(sys.stdout, delimiter="\t", lineterminator="\n")
+            writer.writerow(["language", "key", "found_in"])
+            missing = core.missing_localisation(args.languages)
+            for language, keys in missing.items():
+                for key in keys:
+                    found_in = [other for other in missing if other != language and key in core.localisation.strings(other)]
+                    writer.writerow([language, key, " ".join(found_in) if found_in else "state"])
+        elif args.command == "rails":
+            writer = csv.writer(sys.stdout, delimiter="\t", lineterminator="\n")
+            writer.writerow(["fragment", "size", "supply_nodes", "provinces"])
+            for index, fragment in enumerate(core.load_logistics().rail_fragments()):
+                writer.writerow([index, len(fragment["provinces"]), fragment["supply_nodes"], " ".join(map(str, fragment["provinces"]))])
+        elif args.command in ("neighbours", "path"):
+            graph = core.load_province_graph()
+            if graph is None:
+                return 1
+            if args.command == "neighbours":
+                writer = csv.writer(sys.stdout, delimiter="\t", lineterminator="\n")
+                writer.writerow(["province", "neighbour", "kind", "through"])
+                for province_id in args.provinces:
+                    for neighbour, kind, through in graph.edges_of(province_id):
+                        writer.writerow([province_id, neighbour, kind, "" if through < 0 else through])
+            else:
+                path = graph.path(args.source, args.target, core.land_province_ids() if args.land else None)
+                if path is None:
+                    print(f"エラー: {args.source} から {args.target} への経路はありません", file=sys.stderr)
+                    return 1
+                print(" ".join(map(str, path)))
+        elif args.command == "transfer":
+            provinces = [province_id for value in args.provinces for province_id in value.split(",") if province_id]
+            run_transfer(core, [(province_id, args.to) for province_id in provinces],
+                         f"プロビンス {', '.join(provinces)} を {args.to} へ移譲", args.dry_run)
+        elif args.command == "apply":
+            run_transfer(core, edits, f"{args.edits} の移譲", args.dry_run)
+    except (TransferError, QueryError) as e:
+        print(f"エラー: {e}", file=sys.stderr)
+        return 1
+    except JournalCommitError as e:
+        print(f"エラー: 保存に失敗したため、すべてのファイルを元に戻しました: {e}", file=sys.stderr)
+        return 1
+    except BrokenPipeError:
+        # head などで出力の途中で読むのをやめられた
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+        return 1
+    except OSError as e:
+        print(f"エラー: {e}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
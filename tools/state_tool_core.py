@@ -0,0 +1,513 @@
+import configparser
+import os
+
+import adjacency
+import clausewitz
+import localisation
+import logistics
+import map_buildings
+import province_bitmap
+import state_loader
+import state_validator
+from edit_journal import EditJournal
+from parse_cache import ParseCache
+from state_query import QueryStore, compile_query
+
+# GUI を使わないステートツールの中核
+# ファイルの読み込み・インデックスの構築・プロビンスの移譲とファイル内容の書き換えを行う。
+# state_tool_pyqt.py (GUI) と state_tool_cli.py (コマンドライン) の両方から使う。
+
+
+class TransferError(ValueError):
+    pass
+
+
+def load_config(config_path='state_tool_config.ini'):
+    config = configparser.ConfigParser()
+    config.read(config_path)
+    return config
+
+
+def create_parse_cache(config):
+    """設定ファイルの [Cache] に従ってパースキャッシュを作る。無効なら None。"""
+    if not config.getboolean('Cache', 'enabled', fallback=True):
+        return None
+    return ParseCache(
+        config.get('Cache', 'path', fallback='.cache/state_tool_cache.pickle'),
+        (clausewitz.PARSER_VERSION, state_loader.RECORD_VERSION, localisation.LOCALISATION_VERSION),
+        verify_hash=config.getboolean('Cache', 'verify_hash', fallback=False),
+    )
+
+
+def localized_name(table, record, localisation_strings):
+    """ステートか戦略地域のローカライズ名を返す。キーが無ければ <キー not found>。"""
+    if table == "state":
+        localisation_key = record["localisation_key"]
+        if not localisation_key:
+            return record["state_name"]
+    else:
+        localisation_key = record["strategic_region_name"] # 戦略地域名はlocalisation keyと同一と仮定
+    return localisation_strings.get(localisation_key, f"<{localisation_key} not found>")
+
+
+def localize_state(state_info, localisation_strings):
+    # ローカライズ名はキャッシュせず、ロードのたびに現在のローカライズから引く
+    state_info["localized_name"] = localized_name("state", state_info, localisation_strings)
+
+
+def localize_region(region_info, localisation_strings):
+    region_info["localized_name"] = localized_name("region", region_info, localisation_strings)
+
+
+def _render_provinces_block(content, container_key, provinces, insert_if_missing):
+    """
+    container_key = { ... } の中の provinces = { ... } の中身を provinces にした内容を返す。
+    元のテキストのうち、増えた・減ったプロビンスIDの部分だけを書き換える (コメント・書式・並び順・改行コードはそのまま残す)。
+    プロビンスが変わらなければ content をそのまま返す。
+    """
+    root = clausewitz.parse_text(content)
+    container = root.get(container_key)
+    if not isinstance(container, clausewitz.Block):
+        raise ValueError(f"{container_key} ブロックがありません")
+    entry = next((entry for entry in container if entry.key == "provinces" and isinstance(entry.value, clausewitz.Block)), None)
+    if entry is not None:
+        edits = clausewitz.set_block_values(content, entry.value, provinces)
+    elif insert_if_missing and provinces:
+        # provinces = {} がない場合は container_key のブロックの最後に追加する
+        edits = clausewitz.insert_entry(content, container, "provinces", sorted(provinces, key=_province_sort_key))
+    else:
+        return content
+    return clausewitz.apply_edits(content, edits)
+
+
+def _province_sort_key(province_id):
+    return (0, int(province_id), "") if province_id.isdigit() else (1, 0, province_id)
+
+
+def render_state_provinces(content, provinces):
+    """ステートファイルの内容の provinces を書き換えた内容を返す。"""
+    return _render_provinces_block(content, "state", provinces, True)
+
+
+def render_region_provinces(content, provinces):
+    """戦略地域ファイルの内容の provinces を書き換えた内容を返す。"""
+    return _render_provinces_block(content, "strategic_region", provinces, False)
+
+
+def plan_province_move(state_by_id, province_to_region, province_ids, source_state_id, target_state_id):
+    """
+    プロビンスをステート間で移したときの、ステートと戦略地域の新しい provinces を求める。
+    レコードにもインデックスにも触らないので、ファイルの書き換えを確かめてから apply_province_move() で反映できる。
+
+    Args:
+        state_by_id (dict): ステートID -> ステート情報
+        province_to_region (dict): プロビンスID -> 戦略地域情報
+        province_ids (list[str]): 移すプロビンスID
+        source_state_id (int): 移譲元ステートID
+        target_state_id (int): 移譲先ステートID
+
+    Returns:
+        dict: province_ids、target_state_id、states ((ステート情報, 新しいリスト) の 移譲元・移譲先の順のリスト)、
+        regions ((戦略地域情報, 新しいリスト) のリスト)、region_moves (プロビンスID -> 移す先の戦略地域情報)。
+        ステートが見つからなければ None
+    """
+    source_state_info = state_by_id.get(source_state_id)
+    target_state_info = state_by_id.get(target_state_id)
+    if not source_state_info or not target_state_info:
+        return None
+    selected = set(province_ids)
+
+    # 戦略地域の更新 (地域ごとに削除・追加をまとめて1回だけリストを作り直す)
+    # 移譲先ステートの最初のプロビンスが属する戦略地域に移す
+    target_region_info = None
+    if target_state_info["provinces"]:
+        target_region_info = province_to_region.get(target_state_info["provinces"][0])
+    removed = {} # id(戦略地域) -> (戦略地域, 外すプロビンスID)
+    region_moves = {}
+    regions = [] # プロビンスが出入りした戦略地域と新しいリスト
+    if target_region_info is not None:
+        for province_id in province_ids:
+            source_region_info = province_to_region.get(province_id)
+            if source_region_info is None or source_region_info is target_region_info: # 異なる戦略地域に移動する場合のみ更新
+                continue
+            if id(source_region_info) not in removed:
+                removed[id(source_region_info)] = (source_region_info, set())
+            removed[id(source_region_info)][1].add(province_id)
+            region_moves[province_id] = target_region_info
+        if removed:
+            moved = set()
+            for region_info, region_province_ids in removed.values():
+                regions.append((region_info, [p for p in region_info["provinces"] if p not in region_province_ids]))
+                moved.update(region_province_ids)
+            regions.append((target_region_info, sorted(set(target_region_info["provinces"]) | moved))) # 重複削除とソート
+
+    # ステートの provinces リスト
+    states = [(source_state_info, [p for p in source_state_info["provinces"] if p not in selected]),
+              (target_state_info, sorted(set(target_state_info["provinces"]) | selected))] # 重複削除とソート
+    return {"province_ids": list(province_ids), "target_state_id": target_state_id, "states": states,
+            "regions": regions, "region_moves": region_moves}
+
+
+def apply_province_move(plan, province_to_state, province_to_region, province_by_id):
+    """
+    plan_province_move() の結果をレコードとインデックスに反映する。ファイルには触らない。
+
+    Returns:
+        tuple: (移譲元ステート, 移譲先ステート, 変更された戦略地域のリスト, 変更されたプロビンスのリスト)
+    """
+    for state_info, provinces in plan["states"]:
+        state_info["provinces"] = provinces
+    for region_info, provinces in plan["regions"]:
+        region_info["provinces"] = provinces
+    province_to_region.update(plan["region_moves"])
+    target_state_id = plan["target_state_id"]
+    changed_provinces = []
+    for province_id in plan["province_ids"]:
+        province_to_state[province_id] = target_state_id
+        province_info = province_by_id.get(province_id)
+        if province_info:
+            province_info["state_id"] = target_state_id
+            changed_provinces.append(province_info)
+    (source_state_info, _), (target_state_info, _) = plan["states"]
+    return source_state_info, target_state_info, [region_info for region_info, _ in plan["regions"]], changed_provinces
+
+
+def move_provinces(state_by_id, province_to_state, province_to_region, province_by_id, province_ids, source_state_id, target_state_id):
+    """
+    プロビンスをステート間で移し、ステート・戦略地域・プロビンスのレコードとインデックスを更新する。
+    ファイルには触らない。
+
+    Args:
+        state_by_id (dict): ステートID -> ステート情報
+        province_to_state (dict): プロビンスID -> ステートID
+        province_to_region (dict): プロビンスID -> 戦略地域情報
+        province_by_id (dict): プロビンスID -> プロビンス情報
+        province_ids (list[str]): 移すプロビンスID
+        source_state_id (int): 移譲元ステートID
+        target_state_id (int): 移譲先ステートID
+
+    Returns:
+        tuple: (移譲元ステート, 移譲先ステート, 変更された戦略地域のリスト, 変更されたプロビンスのリスト)。
+        ステートが見つからなければ None
+    """
+    plan = plan_province_move(state_by_id, province_to_region, province_ids, source_state_id, target_state_id)
+    if plan is None:
+        return None
+    return apply_province_move(plan, province_to_state, province_to_region, province_by_id)
+
+
+class StateToolCore:
+    """
+    ステート・プロビンス・戦略地域のデータ。設定ファイルの読み込みからファイルの保存までを GUI なしで行う。
+
+    移譲はメモリ上のレコードだけを更新し、save() で変更のあったファイルを1回ずつまとめて書き込む。
+
+    Args:
+        config: load_config() で読み込んだ設定 (None なら state_tool_config.ini)
+    """
+
+    def __init__(self, config=None):
+        self.config = config if config is not None else load_config()
+        self.state_dir = self.config.get('Directories', 'state_dir', fallback='history/states')
+        self.localisation_dir = self.config.get('Directories', 'localisation_dir', fallback='localisation/japanese')
+        self.language = os.path.basename(os.path.normpath(self.localisation_dir)) # ローカライズ名に使う言語
+        self.strategic_regions_dir = "map/strategicregions"
+        self.definition_csv_path = "map/definition.csv"
+        self.adjacencies_path = "map/adjacencies.csv"
+        self.railways_path = "map/railways.txt"
+        self.supply_nodes_path = "map/supply_nodes.txt"
+        self.buildings_path = "map/buildings.txt"
+        self.parse_cache = create_parse_cache(self.config)
+        self.localisation = localisation.LocalisationIndex(os.path.dirname(os.path.normpath(self.localisation_dir)), self.parse_cache)
+        self.load_workers = self.config.getint('Loading', 'workers', fallback=0)
+        self.load_executor = self.config.get('Loading', 'executor', fallback='process')
+
+        self.localisation_strings = {}
+        self.states = []
+        self.provinces = []
+        self.regions = []
+        self.state_by_id = {} # ステートID -> ステート情報
+        self.province_to_state = {} # プロビンスID -> ステートID
+        self.region_by_id = {} # 戦略地域ID -> 戦略地域情報
+        self.province_to_region = {} # プロビンスID -> 戦略地域情報
+        self.province_by_id = {} # プロビンスID -> プロビンス情報
+        self.definition_rows = []
+        self.query_store = None
+        self.province_stats = None # provinces.bmp から求めた面積など (load_province_stats() で読み込む)
+        self.province_graph = None # プロビンスの隣接グラフ (load_province_graph() で読み込む)
+        self.logistics = None # 鉄道と補給拠点 (load_logistics() で読み込む)
+        self.buildings = None # map/buildings.txt の建物の配置 (load_buildings() で読み込む)
+        self.moved_provinces = set() # 読み込んでから移譲したプロビンスID
+
+        self.journal = EditJournal()
+        self.dirty_states = {} # 移譲で変わったステート (ステートID -> ステート情報)
+        self.dirty_regions = {} # 移譲で変わった戦略地域 (戦略地域ID -> 戦略地域情報)
+
+    def cached_parse(self, namespace, filepath, parse_func):
+        if self.parse_cache is None:
+            return parse_func(filepath)
+        return self.parse_cache.get(namespace, filepath, parse_func)
+
+    def load_script_records(self, namespace, directory, parse_func, timer):
+        if not os.path.exists(directory):
+            print(f"エラー：ディレクトリが見つかりません: {directory}")
+            return []
+        filepaths = state_loader.list_script_files(directory)
+        timer.mark("listdir")
+        records = state_loader.load_records(namespace, filepaths, parse_func, self.parse_cache, self.load_workers, self.load_executor, timer)
+        # キャッシュ上のレコードを編集で書き換えないようにコピーする
+        return [dict(record, provinces=list(record["provinces"])) for record in records if record]
+
+    def load(self):
+        """ローカライズ・ステート・プロビンス・戦略地域を読み込み、インデックスを作る。"""
+        timer = state_loader.LoadTimer("core")
+        self.localisation_strings = self.localisation.load(self.language)[1]
+        timer.mark("localisation")
+
+        self.states = self.load_script_records("state", self.state_dir, state_loader.parse_state_file, timer)
+        self.state_by_id = {}
+        self.province_to_state = {}
+        for state_info in self.states:
+            localize_state(state_info, self.localisation_strings)
+            self.state_by_id[state_info["state_id"]] = state_info
+            for province_id in state_info["provinces"]:
+                self.province_to_state[province_id] = state_info["state_id"]
+
+        self.regions = self.load_script_records("strategic_region", self.strategic_regions_dir, state_loader.parse_strategic_region_file, timer)
+        self.regions.sort(key=lambda x: x["strategic_region_name"])
+        self.region_by_id = {}
+        self.province_to_region = {}
+        for region_info in self.regions:
+            localize_region(region_info, self.localisation_strings)
+            self.region_by_id[region_info["strategic_region_id"]] = region_info
+            for province_id in region_info["provinces"]:
+                self.province_to_region[province_id] = region_info
+
+        self.provinces = []
+        self.province_by_id = {}
+        self.definition_rows = self.cached_parse("definition", self.definition_csv_path, state_loader.parse_definition_csv)
+        for row in self.definition_rows:
+            province_info = state_loader.ProvinceRecord(*row)
+            province_info.state_id = self.province_to_state.get(str(province_info.province_id), -1)
+            self.provinces.append(province_info)
+            self.province_by_id[str(province_info.province_id)] = province_info # ステートの provinces と同じ文字列のIDで引く
+        timer.mark("index")
+
+        self.query_store = None
+        self.province_stats = None
+        self.province_graph = None
+        self.logistics = None
+        self.buildings = None
+        self.moved_provinces = set()
+        self.journal = EditJournal()
+        self.dirty_states = {}
+        self.dirty_regions = {}
+        if self.parse_cache is not None:
+            self.parse_cache.save()
+        return timer
+
+    def records(self, table):
+        return {"state": self.states, "province": self.provinces, "region": self.regions}[table]
+
+    def missing_localisation(self, languages=None):
+        """
+        言語ごとに、ほかの言語にあるキーとステートのローカライズキーのうち無いものを返す。
+
+        Returns:
+            dict: 言語 -> 無いキーのソートしたリスト
+        """
+        required = [state_info["localisation_key"] for state_info in self.states if state_info["localisation_key"]]
+        return self.localisation.missing_keys(languages, required)
+
+    def load_province_stats(self):
+        """
+        provinces.bmp からプロビンスごとの面積・外接矩形・重心を求める (パースキャッシュに保存する)。
+        ビットマップが見つからなければ None。
+        """
+        if self.province_stats is None:
+            filepath = province_bitmap.find_provinces_bmp(self.config)
+            if filepath is None:
+                print("provinces.bmp が見つかりません。設定ファイルの [Map] provinces_bmp か [Directories] game_dir を指定してください。")
+                return None
+            self.province_stats = province_bitmap.load_province_stats(filepath, self.definition_csv_path, self.definition_rows, self.parse_cache)
+            if self.province_stats.unknown_pixels:
+                print(f"{filepath}: definition.csv に無い色の画素が {self.province_stats.unknown_pixels} 個あります。")
+            if self.parse_cache is not None:
+                self.parse_cache.save()
+        return self.province_stats
+
+    def load_province_graph(self):
+        """
+        provinces.bmp と adjacencies.csv からプロビンスの隣接グラフを作る (パースキャッシュに保存する)。
+        ビットマップが見つからなければ None。
+        """
+        if self.province_graph is None:
+            filepath = province_bitmap.find_provinces_bmp(self.config)
+            if filepath is None:
+                print("provinces.bmp が見つかりません。設定ファイルの [Map] provinces_bmp か [Directories] game_dir を指定してください。")
+                return None
+            self.province_graph = adjacency.load_province_graph(filepath, self.definition_csv_path, self.adjacencies_path, self.definition_rows, self.parse_cache)
+            if self.parse_cache is not None:
+                self.parse_cache.save()
+        return self.province_graph
+
+    def load_logistics(self):
+        """
+        鉄道と補給拠点を読み、ステートのレコードに補給の集計 (supply_distance, railway_level, supply_nodes) を書き込む。
+        provinces.bmp があれば陸の隣接もたどり、無ければ鉄道だけをたどる。
+        """
+        if self.logistics is None:
+            graph = self.load_province_graph() if province_bitmap.find_provinces_bmp(self.config) else None
+            self.logistics = logistics.LogisticsNetwork(
+                self.cached_parse("railways", self.railways_path, logistics.parse_railways),
+                self.cached_parse("supply_nodes", self.supply_nodes_path, logistics.parse_supply_nodes),
+                graph, self.land_province_ids())
+            self.logistics.update_states(self.states)
+        return self.logistics
+
+    def load_buildings(self):
+        """map/buildings.txt を読む。provinces.bmp があれば配置ごとのプロビンスも求める。"""
+        if self.buildings is None:
+            self.buildings = map_buildings.load_buildings(self.buildings_path, self.parse_cache)
+            bmp_path = province_bitmap.find_provinces_bmp(self.config)
+            if bmp_path is not None:
+                self.buildings.resolve_provinces(bmp_path, self.definition_rows)
+        return self.buildings
+
+    def building_counts(self, states=None):
+        """
+        ステートごと・建物の種類ごとの配置の数を返す。
+
+        Returns:
+            tuple[list[str], dict]: 建物の種類のリストと、ステートID -> 種類の順の数のリスト
+        """
+        buildings = self.load_buildings()
+        states = self.states if states is None else states
+        counts = buildings.state_counts([state_info["state_id"] for state_info in states])
+        return buildings.types, {state_info["state_id"]: row for state_info, row in zip(states, counts.tolist())}
+
+    def moved_building_positions(self):
+        """
+        移譲したプロビンスにあり、map/buildings.txt では元のステートのままの配置を返す。
+        provinces.bmp が無ければ配置のプロビンスが分からないので空のリスト。
+
+        Returns:
+            list[dict]: 配置 (state, type, x, y, z, rotation, sea, province) と、プロビンスの今のステート (current_state)
+        """
+        if not self.moved_provinces:
+            return []
+        buildings = self.load_buildings()
+        rows = buildings.misplaced(self.province_to_state, buildings.rows_for_provinces(self.moved_provinces))
+        entries = [buildings.entry(row) for row in rows.tolist()]
+        for entry in entries:
+            entry["current_state"] = self.province_to_state[str(entry["province"])]
+        return entries
+
+    def land_province_ids(self):
+        """陸のプロビンスIDの集合 (経路を陸上に限るときに使う)。"""
+        return {province_info.province_id for province_info in self.provinces if province_info.terrain_type == "land"}
+
+    def record_stats(self, table, record):
+        """レコード (プロビンス・ステート・戦略地域) の面積などを返す。求められなければ None。"""
+        stats = self.load_province_stats()
+        if stats is None:
+            return None
+        if table == "province":
+            return stats.for_province(record.province_id)
+        return stats.aggregate(record["provinces"])
+
+    def validate(self, use_graph=False):
+        """
+        マップ全体の整合性を確認し、問題のリストを返す (state_validator.validate() を参照)。
+
+        Args:
+            use_graph (bool): 隣接グラフを使ってステートのつながりも確認する (provinces.bmp が必要)
+        """
+        graph = self.load_province_graph() if use_graph else None
+        return state_validator.validate(self.states, self.provinces, self.regions, graph)
+
+    def query(self, text, table):
+        """クエリ (state_query の構文) に一致するレコードを返す。"""
+        if self.query_store is None:
+            self.query_store = QueryStore(self.states, self.provinces, self.regions)
+        return self.query_store.select(compile_query(text, table), table)
+
+    def transfer(self, edits):
+        """
+        プロビンスを移譲する。すべての移譲を確認してから、メモリ上のレコードだけを更新する。
+
+        Args:
+            edits (list[tuple[str, int]]): (プロビンスID, 移譲先ステートID) のリスト。同じプロビンスは最後の指定が有効
+
+        Returns:
+            int: 移したプロビンスの数 (すでに移譲先にあるものは数えない)
+        """
+        targets = {}
+        errors = []
+        for province_id, target_state_id in edits:
+            province_id = str(province_id).strip()
+            if province_id.isdigit():
+                province_id = str(int(province_id)) # "007" と "7" を同じプロビンスとして扱う
+            if province_id not in self.province_to_state:
+                errors.append(f"プロビンス {province_id} はどのステートにも属していません")
+            elif target_state_id not in self.state_by_id:
+                errors.append(f"移譲先のステート {target_state_id} が見つかりません")
+            else:
+                targets[province_id] = target_state_id
+        if errors:
+            raise TransferError("\n".join(errors))
+
+        # (移譲元, 移譲先) の組ごとにまとめて移す
+        groups = {}
+        for province_id, target_state_id in targets.items():
+            source_state_id = self.province_to_state[province_id]
+            if source_state_id != target_state_id:
+                groups.setdefault((source_state_id, target_state_id), []).append(province_id)
+        moved = 0
+        for (source_state_id, target_state_id), province_ids in groups.items():
+            source_state_info, target_state_info, changed_regions, _ = move_provinces(
+                self.state_by_id, self.province_to_state, self.province_to_region, self.province_by_id,
+                province_ids, source_state_id, target_state_id)
+            for state_info in (source_state_info, target_state_info):
+                self.dirty_states[state_info["state_id"]] = state_info
+            if self.logistics is not None:
+                self.logistics.update_states([source_state_info, target_state_info]) # 補給の集計は変わったステートだけやり直す
+            for region_info in changed_regions:
+                self.dirty_regions[region_info["strategic_region_id"]] = region_info
+            self.moved_provinces.update(province_ids)
+            moved += len(province_ids)
+        if groups:
+            self.query_store = None
+        return moved
+
+    def state_filepath(self, state_info):
+        return os.path.join(self.state_dir, state_info["filename"])
+
+    def region_filepath(self, region_info):
+        return os.path.join(self.strategic_regions_dir, region_info["strategic_region_name"] + ".txt")
+
+    def pending_contents(self):
+        """移譲で変わったファイルの新しい内容 (パス -> 内容) を返す。内容が変わらないファイルは含めない。"""
+        contents = {}
+        for state_info in self.dirty_states.values():
+            filepath = self.state_filepath(state_info)
+            contents[filepath] = render_state_provinces(self.journal.read(filepath), state_info["provinces"])
+        for region_info in self.dirty_regions.values():
+            filepath = self.region_filepath(region_info)
+            contents[filepath] = render_region_provinces(self.journal.read(filepath), region_info["provinces"])
+        return {filepath: content for filepath, content in contents.items() if content != self.journal.read(filepath)}
+
+    def save(self, label="移譲"):
+        """
+        移譲で変わったファイルをまとめて書き込む。失敗したらすべてのファイルを元に戻して JournalCommitError を送出する。
+
+        Returns:
+            list[str]: 書き込んだファイルのパス
+        """
+        contents = self.pending_contents()
+        if contents:
+            self.journal.record(label, contents)
+        written = self.journal.commit()
+        self.dirty_states = {}
+        self.dirty_regions = {}
+        return written
@@ -0,0 +1,78 @@
+from PyQt5.QtCore import Qt, QAbstractTableModel, QModelIndex
+
+# ステート・プロビンス・戦略地域ビュー用のテーブルモデル
+
+
+class RecordTableModel(QAbstractTableModel):
+    """
+    レコード (辞書) のリストを表示するテーブルモデル。
+
+    モデルが持つのは表示する行の並び (検索・ソートの結果) とレコードへの参照だけで、
+    セルの文字列はビューが描画する行についてのみ data() で作る。
+    検索やソートでは行の並びを差し替えるだけで、ウィジェットは作り直さない。
+
+    Args:
+        columns (list[tuple[str, callable]]): (見出し, レコードから表示文字列を返す関数) のリスト
+    """
+
+    def __init__(self, columns, parent=None):
+        super().__init__(parent)
+        self.headers = [header for header, _ in columns]
+        self.getters = [getter for _, getter in columns]
+        self.rows = []
+        self._row_of = None # id(レコード) -> 行番号 (必要になったときに作る)
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.rows)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.headers)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if role != Qt.DisplayRole or not index.isValid():
+            return None
+        return self.getters[index.column()](self.rows[index.row()])
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and orientation == Qt.Horizontal:
+            return self.headers[section]
+        return None
+
+    def set_rows(self, rows):
+        """表示する行を丸ごと差し替える。rows はコピーして保持する。"""
+        self.beginResetModel()
+        self.rows = list(rows)
+        self._row_of = None
+        self.endResetModel()
+
+    def append_rows(self, rows):
+        if not rows:
+            return
+        first = len(self.rows)
+        self.beginInsertRows(QModelIndex(), first, first + len(rows) - 1)
+        self.rows.extend(rows)
+        self._row_of = None
+        self.endInsertRows()
+
+    def record(self, row):
+        if 0 <= row < len(self.rows):
+            return self.rows[row]
+        return None
+
+    def row_of(self, record):
+        if self._row_of is None:
+            self._row_of = {id(row_record): row for row, row_record in enumerate(self.rows)}
+        return self._row_of.get(id(record))
+
+    def refresh_records(self, records):
+        """指定したレコードの行だけを再描画させる。"""
+        last_column = len(self.headers) - 1
+        for record in records:
+            row = self.row_of(record)
+            if row is not None:
+                self.dataChanged.emit(self.index(row, 0), self.index(row, last_column))
+
+    def refresh_all(self):
+        """すべての行を再描画させる (ローカライズの変更など)。"""
+        if self.rows:
+            self.dataChanged.emit(self.index(0, 0), self.index(len(self.rows) - 1, len(self.headers) - 1))
@@ -1,13 +1,32 @@
 import os
-import re
 import sys
-import configparser
+import threading
+from operator import attrgetter, itemgetter
+import adjacency
+import file_watcher
+import localisation
+import logistics
+import province_bitmap
+import state_loader
+import state_tool_core
+import state_validator
+from search_index import SearchIndex
+from sort_order import SortOrderCache
+from state_query import QueryStore, QueryError, compile_query
+from state_tool_models import RecordTableModel
+from edit_journal import EditJournal, JournalCommitError
 from PyQt5.QtWidgets import (QApplication, QWidget, QVBoxLayout, QHBoxLayout,
-                             QLabel, QComboBox, QPushButton, QTreeWidget, QTreeWidgetItem,
+                             QLabel, QComboBox, QPushButton, QTreeView,
                              QLineEdit, QScrollArea, QFrame, QMenu, QAction,
                              QDialog, QListWidget, QVBoxLayout as QVBoxLayoutDialog, QPushButton as QPushButtonDialog,
-                             QStackedWidget)
-from PyQt5.QtCore import Qt, QPoint
+                             QStackedWidget, QProgressBar, QMessageBox)
+from PyQt5.QtCore import Qt, QPoint, QObject, QThread, QTimer, pyqtSignal
+from PyQt5.QtGui import QKeySequence
+
+# プロビンス定義を画面へ流し込むときの1バッチの行数
+PROVINCE_BATCH_SIZE = 2000
+# 整合性チェックのツールチップに表示する問題の件数
+VALIDATION_TOOLTIP_LINES = 20
 
 class ProvinceListDialog(QDialog):
     def __init__(self, province_list, parent=None):
@@ -119,25 +138,111 @@ class TargetStateDialog(QDialog):
             return int(target_state_id_text)
         return None
 
+class LoadWorker(QObject):
+    """
+    ワーカースレッドでファイルを読み込み、バッチごとにシグナルで結果を渡す。
+    ウィジェットには触らないので、画面の更新は受け取った側 (GUIスレッド) で行う。
+    """
+    kind_started = pyqtSignal(str, int) # 種類, 件数
+    batch_ready = pyqtSignal(str, object) # 種類, レコードのリスト (ステートと戦略地域は (ファイルの順番, レコード) のリスト、ローカライズは辞書)
+    progress = pyqtSignal(str, int, int) # 種類, 完了数, 件数
+    kind_finished = pyqtSignal(str)
+    finished = pyqtSignal(bool) # 中止されたかどうか
+
+    def __init__(self, kinds, paths, parse_cache, workers, executor):
+        super().__init__()
+        self.kinds = kinds
+        self.paths = paths
+        self.parse_cache = parse_cache
+        self.workers = workers
+        self.executor = executor
+        self.cancel_event = threading.Event()
+
+    def cancel(self):
+        self.cancel_event.set()
+
+    def cached_parse(self, namespace, filepath, parse_func):
+        if self.parse_cache is None:
+            return parse_func(filepath)
+        return self.parse_cache.get(namespace, filepath, parse_func)
+
+    def run(self):
+        cancelled = self.cancel_event.is_set
+        try:
+            for kind in self.kinds:
+                if cancelled():
+                    break
+                timer = state_loader.LoadTimer(kind)
+                if kind == "localisation":
+                    # 表示する言語だけを読み込む (paths["localisation"] は LocalisationIndex)
+                    languages = self.paths["languages"]
+                    self.kind_started.emit(kind, len(languages))
+                    for done, language in enumerate(languages, 1):
+                        self.paths["localisation"].load(language)
+                        self.progress.emit(kind, done, len(languages))
+                    timer.mark("parse")
+                    self.batch_ready.emit(kind, {language: self.paths["localisation"].strings(language) for language in languages})
+                elif kind == "provinces":
+                    rows = self.cached_parse("definition", self.paths["provinces"], state_loader.parse_definition_csv)
+                    timer.mark("definition")
+                    self.kind_started.emit(kind, len(rows))
+                    for start in range(0, len(rows), PROVINCE_BATCH_SIZE):
+                        if cancelled():
+                            break
+                        self.batch_ready.emit(kind, rows[start:start + PROVINCE_BATCH_SIZE])
+                        self.progress.emit(kind, min(start + PROVINCE_BATCH_SIZE, len(rows)), len(rows))
+                else:
+                    if kind == "states":
+                        namespace, directory, parse_func = "state", self.paths["states"], state_loader.parse_state_file
+                    else:
+                        namespace, directory, parse_func = "strategic_region", self.paths["regions"], state_loader.parse_strategic_region_file
+                    if not os.path.exists(directory):
+                        print(f"エラー：ディレクトリが見つかりません: {directory}")
+                        continue
+                    filepaths = state_loader.list_script_files(directory)
+                    timer.mark("listdir")
+                    self.kind_started.emit(kind, len(filepaths))
+                    done = 0
+                    for indices, batch in state_loader.iter_records(namespace, filepaths, parse_func, self.parse_cache, self.workers, self.executor, timer, cancelled=cancelled):
+                        done += len(batch)
+                        self.batch_ready.emit(kind, [(index, record) for index, record in zip(indices, batch) if record])
+                        self.progress.emit(kind, done, len(filepaths))
+                if not cancelled():
+                    self.kind_finished.emit(kind)
+                    print(timer.report())
+            if self.parse_cache is not None:
+                self.parse_cache.save()
+        except Exception as e:
+            print(f"Error loading files: {e}")
+        self.finished.emit(cancelled())
+
 class StateFileLister(QWidget):
     def __init__(self, state_dir="history/states", localisation_dir="localisation/japanese", localisation_file_name="state_names_l_japanese.yml"):
         super().__init__()
 
-        self.config = configparser.ConfigParser()
-        self.config.read('state_tool_config.ini')
+        self.config = state_tool_core.load_config()
 
         self.state_dir = self.config.get('Directories', 'state_dir', fallback='history/states')
         self.localisation_dir = self.config.get('Directories', 'localisation_dir', fallback='localisation/japanese')
-        self.localisation_file_name = self.config.get('Directories', 'localisation_file_name', fallback='state_names_l_japanese.yml')
+        self.language = os.path.basename(os.path.normpath(self.localisation_dir)) # ローカライズ名に使う言語
+        # ローカライズ名の列を並べて表示するほかの言語 (例: english)
+        self.extra_languages = [language.strip() for language in self.config.get('Localisation', 'languages', fallback='').split(',') if language.strip()]
         self.default_sort_key = self.config.get('UI', 'default_sort_key', fallback='state_id')
         self.default_sort_order_ascending = self.config.getboolean('UI', 'default_sort_order_ascending', fallback=True)
 
+        # パースキャッシュ (変更されたファイルだけを再パースする)
+        self.parse_cache = state_tool_core.create_parse_cache(self.config)
+        self.localisation = localisation.LocalisationIndex(os.path.dirname(os.path.normpath(self.localisation_dir)), self.parse_cache)
+        # 並列ロードの設定 (workers = 0 ならCPUコア数)
+        self.load_workers = self.config.getint('Loading', 'workers', fallback=0)
+        self.load_executor = self.config.get('Loading', 'executor', fallback='process')
+
         self.state_files_info = []
         self.filtered_state_files_info = []
         self.sort_key = self.default_sort_key
         self.sort_order_ascending = self.default_sort_order_ascending
-        self.localisation_strings = self.load_localisation()
-        self.current_item = None
+        self.localisation_strings = {}
+        self.current_record = None # 右クリックされた行のレコード
 
         # プロビンス関連のデータ
         self.strategic_regions_dir = "map/strategicregions" # 戦略地域のディレクトリ (フォルダ名修正)
@@ -145,30 +250,92 @@ class StateFileLister(QWidget):
         self.province_data = []
         self.filtered_province_data = []
         self.definition_csv_path = "map/definition.csv" # パスは適宜変更してください
+        self.adjacencies_path = "map/adjacencies.csv"
+        self.railways_path = "map/railways.txt"
+        self.supply_nodes_path = "map/supply_nodes.txt"
+        self.logistics = None # 鉄道と補給拠点 (ロードが終わったら作る)
+
+        # 検索用インデックス (ロード時に一度だけ構築し、編集のたびに更新する)
+        self.state_by_id = {} # ステートID -> ステート情報
+        self.province_to_state = {} # プロビンスID -> ステートID
+        self.region_by_id = {} # 戦略地域ID -> 戦略地域情報
+        self.province_to_region = {} # プロビンスID -> 戦略地域情報
+        self.province_by_id = {} # プロビンスID -> プロビンス情報
+
+        # 検索の索引 (項目名は検索条件のコンボボックスの表示と同じ)
+        self.state_search = SearchIndex([
+            ("ステートID", lambda x: x["state_id"]),
+            ("ステート名", lambda x: x["state_name"]),
+            ("ローカライズ名", lambda x: x["localized_name"]),
+            ("領有国", lambda x: x["owner"]),
+            ("人口", lambda x: "N/A" if x["manpower"] is None else x["manpower"]),
+            ("プロビンス", lambda x: x["provinces"]),
+        ], numeric_fields=["ステートID", "人口", "プロビンス"])
+        self.province_search = SearchIndex([
+            ("プロビンスID", lambda x: x["province_id"]),
+            ("地形", lambda x: x["terrain_type"]),
+            ("ステートID", lambda x: x["state_id"]),
+        ], numeric_fields=["プロビンスID", "ステートID"])
+        self.strategic_region_search = SearchIndex([
+            ("戦略地域ID", lambda x: x["strategic_region_id"]),
+            ("戦略地域名", lambda x: x["strategic_region_name"]),
+            ("ローカライズ名", lambda x: x["localized_name"]),
+            ("プロビンス", lambda x: x["provinces"]),
+        ], numeric_fields=["戦略地域ID", "プロビンス"])
+
+        # ソートできる列とキー (ビューごと)。項目名はソートのコンボボックスの表示と同じ
+        self.sort_columns = [
+            {
+                "ステートID": itemgetter("state_id"),
+                "ステート名": lambda x: x["state_name"].lower(),
+                "ローカライズ名": lambda x: x["localized_name"].lower(),
+                "領有国": lambda x: x["owner"].lower(),
+                "人口": lambda x: x["manpower"] or 0,
+                "補給距離": lambda x: -1 if x.get("supply_distance") is None else x["supply_distance"],
+                "鉄道": lambda x: x.get("railway_level", 0),
+                "補給拠点": lambda x: x.get("supply_nodes", 0),
+            },
+            {
+                "プロビンスID": attrgetter("province_id"),
+                "地形": attrgetter("terrain_type"),
+                "ステートID": attrgetter("state_id"),
+                "R": attrgetter("r"),
+                "G": attrgetter("g"),
+                "B": attrgetter("b"),
+                "沿岸": attrgetter("is_coastal"),
+            },
+            {
+                "戦略地域ID": itemgetter("strategic_region_id"),
+                "戦略地域名": lambda x: x["strategic_region_name"].lower(),
+                "ローカライズ名": lambda x: x["localized_name"].lower(),
+            },
+        ]
+        # (ビュー, 列) ごとのソート順。データが変わったら作り直す
+        self.sort_orders = SortOrderCache()
+
+        # 複合条件のクエリ (検索方法「クエリ」) 用の列データ。データが変わったら作り直す
+        self.query_store = None
+        self.compiled_queries = {} # (クエリ, 表) -> 構文解析済みのクエリ
+
+        # バックグラウンドロードの状態
+        self.load_thread = None
+        self.load_worker = None
+        self.pending_load_kinds = []
+        self.loaded_kinds = set()
+        self.loaded_records = {} # 読み込み中のステートか戦略地域 (ファイルの順番 -> レコード)
+
+        # 編集内容はジャーナルに積み、保存ボタンでまとめて書き込む
+        self.edit_journal = EditJournal()
 
         self.init_ui()
-        self.load_state_files()
-        self.filtered_state_files_info = list(self.state_files_info)
-        self.display_state_files()
+        # ウィンドウはすぐに表示し、データはワーカースレッドで読み込みながら順次表示する
+        self.start_loading(["localisation", "states", "provinces", "regions"])
 
-    def load_localisation(self):
-        localisation_strings = {}
-        filepath = os.path.join(self.localisation_dir, self.localisation_file_name)
-        try:
-            with open(filepath, 'r', encoding='utf-8-sig') as f:
-                content = f.read()
-                for line in content.splitlines():
-                    line = line.strip()
-                    if line.startswith("l_japanese:"):
-                        continue
-                    if ":" in line and not line.startswith("#"):
-                        key, value = line.split(":", 1)
-                        key = key.strip()
-                        value = value.strip().strip('"')
-                        localisation_strings[key] = value
-        except Exception as e:
-            print(f"Error loading localisation file {filepath}: {e}")
-        return localisation_strings
+        # VSCode など外部での変更を検出して、変更されたファイルだけを反映する
+        self.file_watcher = None
+        self.external_changes = set()
+        if self.config.getboolean('Watcher', 'enabled', fallback=True):
+            self.start_file_watcher()
 
     def init_ui(self):
         layout = QVBoxLayout()
@@ -183,16 +350,54 @@ class StateFileLister(QWidget):
         # ツールバー
         toolbar_layout = QHBoxLayout()
         toolbar_layout.addWidget(self.view_combo) # ビュー切り替えコンボボックスを追加
+
+        # 編集の保存・破棄・元に戻す・やり直し
+        self.undo_button = QPushButton("元に戻す")
+        self.undo_button.setShortcut(QKeySequence.Undo)
+        self.undo_button.clicked.connect(self.undo_edit)
+        self.redo_button = QPushButton("やり直す")
+        self.redo_button.setShortcut(QKeySequence.Redo)
+        self.redo_button.clicked.connect(self.redo_edit)
+        self.save_button = QPushButton("保存")
+        self.save_button.setShortcut(QKeySequence.Save)
+        self.save_button.clicked.connect(self.save_edits)
+        self.discard_button = QPushButton("破棄")
+        self.discard_button.clicked.connect(self.discard_edits)
+        for button in (self.undo_button, self.redo_button, self.save_button, self.discard_button):
+            toolbar_layout.addWidget(button)
+        self.update_edit_buttons()
         toolbar_layout.addStretch()
 
+        # 整合性チェックの結果 (読み込みと編集のたびに更新する)
+        self.validation_label = QLabel()
+        toolbar_layout.addWidget(self.validation_label)
+
+        # ロードの進捗表示と中止ボタン (ロード中のみ表示)
+        self.loading_label = QLabel()
+        self.loading_progress = QProgressBar()
+        self.loading_progress.setMaximumWidth(200)
+        self.cancel_loading_button = QPushButton("中止")
+        self.cancel_loading_button.clicked.connect(self.cancel_loading)
+        for widget in (self.loading_label, self.loading_progress, self.cancel_loading_button):
+            toolbar_layout.addWidget(widget)
+            widget.hide()
+
         # ソート設定
         sort_layout = QHBoxLayout()
         sort_label = QLabel("ソート:")
         sort_layout.addWidget(sort_label)
 
         self.sort_combo = QComboBox()
-        self.sort_combo.addItems(["ステートID", "ステート名", "ローカライズ名", "領有国", "人口", "戦略地域ID", "戦略地域名", "ローカライズ名"])
+        self.sort_combo.addItems(list(self.sort_columns[0])) # ビューを切り替えると入れ替える
         self.sort_combo.setCurrentText(self.sort_key) # 設定からデフォルト値を設定
+        self.sort_combo.currentIndexChanged.connect(self.apply_sort)
+        sort_layout.addWidget(self.sort_combo)
+
+        # 第2キー (第1キーが同じ行の並び。例: 領有国 -> 人口)
+        self.sort_combo2 = QComboBox()
+        self.sort_combo2.addItems(["(なし)"] + list(self.sort_columns[0]))
+        self.sort_combo2.currentIndexChanged.connect(self.apply_sort)
+        sort_layout.addWidget(self.sort_combo2)
 
         self.sort_order_button = QPushButton("昇順" if self.sort_order_ascending else "降順")
         self.sort_order_button.clicked.connect(self.toggle_sort_order)
@@ -208,43 +413,66 @@ class StateFileLister(QWidget):
         search_layout.addWidget(self.search_entry)
 
         self.search_criteria_combo = QComboBox()
-        self.search_criteria_combo.addItems(["ステートID", "ステート名", "ローカライズ名", "領有国", "人口", "プロビンス", "戦略地域ID", "戦略地域名", "ローカライズ名"])
+        self.search_criteria_combo.addItems(self.state_search.field_names()) # ビューを切り替えると入れ替える
         search_layout.addWidget(self.search_criteria_combo)
 
         self.match_type_combo = QComboBox()
-        self.match_type_combo.addItems(["部分一致", "完全一致"])
+        self.match_type_combo.addItems(["部分一致", "完全一致", "クエリ"]) # クエリ: owner=GER and manpower>1000000 など
         search_layout.addWidget(self.match_type_combo)
 
         search_button = QPushButton("検索")
         search_button.clicked.connect(self.search_state_files)
         search_layout.addWidget(search_button)
 
-        # ステートファイルリスト (QTreeWidget)
-        self.tree_widget = QTreeWidget()
-        self.tree_widget.setColumnCount(5)
-        self.tree_widget.setHeaderLabels(["ステートID", "ステート名", "ローカライズ名", "領有国", "人口"])
-        self.tree_widget.setContextMenuPolicy(Qt.CustomContextMenu) # コンテキストメニューを有効化
-        self.tree_widget.customContextMenuRequested.connect(self.show_context_menu) # シグナルを接続
-
-        # プロビンスリスト (QTreeWidget) - 初期状態では非表示
-        self.province_tree_widget = QTreeWidget()
-        self.province_tree_widget.setObjectName("province_tree_widget")
-        self.province_tree_widget.setColumnCount(9)  # 列数を9に設定
-        self.province_tree_widget.setHeaderLabels(["プロビンスID", "R", "G", "B", "地形", "沿岸", "ステートID", "ステート名", "ローカライズ名"])
-        self.province_tree_widget.hide() # 最初は隠しておく
-
-        # 戦略地域リスト (QTreeWidget) - 初期状態では非表示
-        self.strategic_region_tree_widget = QTreeWidget()
-        self.strategic_region_tree_widget.setObjectName("strategic_region_tree_widget")
-        self.strategic_region_tree_widget.setColumnCount(3)
-        self.strategic_region_tree_widget.setHeaderLabels(["戦略地域ID", "戦略地域名", "ローカライズ名"])
-        self.strategic_region_tree_widget.hide() # 最初は隠しておく
+        # ステートファイルリスト (表示する行だけを描画するモデル/ビュー)
+        self.state_model = RecordTableModel([
+            ("ステートID", lambda x: str(x["state_id"])),
+            ("ステート名", lambda x: x["state_name"]),
+            ("ローカライズ名", lambda x: x["localized_name"]),
+            ("領有国", lambda x: x["owner"]),
+            ("人口", lambda x: "N/A" if x["manpower"] is None else str(x["manpower"])),
+        ] + self.localisation_columns("state") + [
+            ("補給距離", lambda x: "N/A" if x.get("supply_distance") is None else str(x["supply_distance"])),
+            ("鉄道", lambda x: str(x.get("railway_level", ""))),
+            ("補給拠点", lambda x: str(x.get("supply_nodes", ""))),
+        ], self)
+        self.state_view = self.create_record_view(self.state_model)
+        self.state_view.setContextMenuPolicy(Qt.CustomContextMenu) # コンテキストメニューを有効化
+        self.state_view.customContextMenuRequested.connect(self.show_context_menu) # シグナルを接続
+
+        # プロビンスリスト - 初期状態では非表示
+        self.province_model = RecordTableModel([
+            ("プロビンスID", lambda x: str(x.province_id)),
+            ("R", lambda x: str(x.r)),
+            ("G", lambda x: str(x.g)),
+            ("B", lambda x: str(x.b)),
+            ("地形", lambda x: x.terrain_type),
+            ("沿岸", lambda x: "true" if x.is_coastal else "false"),
+            ("ステートID", lambda x: str(x["state_id"])),
+            ("ステート名", lambda x: self.province_state_field(x, "localized_name")),
+            ("ローカライズ名", lambda x: self.province_state_field(x, "state_name")),
+        ], self)
+        self.province_view = self.create_record_view(self.province_model)
+        self.province_view.setObjectName("province_view")
+        self.province_view.hide() # 最初は隠しておく
+
+        # 戦略地域リスト - 初期状態では非表示
+        self.strategic_region_model = RecordTableModel([
+            ("戦略地域ID", lambda x: str(x["strategic_region_id"])),
+            ("戦略地域名", lambda x: x["strategic_region_name"]),
+            ("ローカライズ名", lambda x: x["localized_name"]),
+        ] + self.localisation_columns("region"), self)
+        self.strategic_region_view = self.create_record_view(self.strategic_region_model)
+        self.strategic_region_view.setObjectName("strategic_region_view")
+        self.strategic_region_view.setContextMenuPolicy(Qt.CustomContextMenu)
+        self.strategic_region_view.customContextMenuRequested.connect(self.show_context_menu)
+        self.strategic_region_view.hide() # 最初は隠しておく
 
         # QStackedWidget
         self.stacked_widget = QStackedWidget()
-        self.stacked_widget.addWidget(self.tree_widget)
-        self.stacked_widget.addWidget(self.province_tree_widget)
-        self.stacked_widget.addWidget(self.strategic_region_tree_widget) # StackedWidget に戦略地域ビューを追加
+        self.stacked_widget.addWidget(self.state_view)
+        self.stacked_widget.addWidget(self.province_view)
+        self.stacked_widget.addWidget(self.strategic_region_view) # StackedWidget に戦略地域ビューを追加
 
         # メインレイアウト
         main_layout = QVBoxLayout()
@@ -255,148 +483,267 @@ class StateFileLister(QWidget):
 
         self.setLayout(main_layout)
 
+    def create_record_view(self, model):
+        view = QTreeView()
+        view.setModel(model)
+        view.setRootIsDecorated(False)
+        view.setUniformRowHeights(True) # 行の高さを固定して、見えている行だけを計算させる
+        view.setAllColumnsShowFocus(True)
+        return view
+
     def switch_view(self):
         index = self.view_combo.currentIndex()
         self.stacked_widget.setCurrentIndex(index)
+        self.search_criteria_combo.clear()
+        self.search_criteria_combo.addItems([self.state_search, self.province_search, self.strategic_region_search][index].field_names())
+        for combo, items in ((self.sort_combo, list(self.sort_columns[index])), (self.sort_combo2, ["(なし)"] + list(self.sort_columns[index]))):
+            combo.blockSignals(True) # 入れ替え中に並べ替えないようにする
+            combo.clear()
+            combo.addItems(items)
+            combo.blockSignals(False)
+        kind = ["states", "provinces", "regions"][index]
+        if kind not in self.loaded_kinds:
+            # まだ読み込んでいない (または中止された) データはバックグラウンドで読み込む
+            self.start_loading([kind])
+            return
         if index == 1:  # プロビンスビュー
-            self.load_province_data()
-            self.filtered_province_data = list(self.province_data)
             self.display_province_data()
         elif index == 2: # 戦略地域ビュー
-            self.load_strategic_regions()
-            self.filtered_strategic_region_files_info = list(self.strategic_region_files_info) # 検索結果リストを初期化
             self.display_strategic_region_data()
         elif index == 0: # ステートビュー
             self.display_state_files()
 
-    def load_state_files(self):
-        self.state_files_info = []
-        for filename in os.listdir(self.state_dir):
-            if filename.endswith(".txt"):
-                filepath = os.path.join(self.state_dir, filename)
-                state_info = self.parse_state_file(filepath)
-                if state_info:
-                    self.state_files_info.append(state_info)
-        self.filtered_state_files_info = list(self.state_files_info) # 検索結果リストも初期化
-        self.sort_state_files()
-
-    def parse_state_file(self, filepath):
-        filename = os.path.basename(filepath)
-        state_id_match = re.match(r"(\d+)-(.+)\.txt", filename)
-        if not state_id_match:
-            return None
-        state_id = int(state_id_match.group(1))
-        state_name_from_file = state_id_match.group(2)
-        state_name_from_file = state_name_from_file.replace("_", " ").title()
-
-        owner = "N/A"
-        manpower = "N/A"
-        provinces = [] # プロビンスリストを初期化
-        localized_name = "N/A"
-
-        try:
-            with open(filepath, 'r', encoding='utf-8') as f:
-                content = f.read()
-                owner_match = re.search(r"owner\s*=\s*([A-Z]{3})", content)
-                if owner_match:
-                    owner = owner_match.group(1)
-                manpower_match = re.search(r"manpower\s*=\s*(\d+)", content)
-                if manpower_match:
-                    manpower = manpower_match.group(1)
-                name_match = re.search(r"name\s*=\s*\"(.*?)\"", content)
-                if name_match:
-                    localisation_key = name_match.group(1)
-                    if localisation_key in self.localisation_strings:
-                        localized_name = self.localisation_strings[localisation_key]
-                    else:
-                        localized_name = f"<{localisation_key} not found>"
-                else:
-                    localized_name = state_name_from_file
-
-                # プロビンスIDのリストを抽出
-                provinces_match = re.findall(r"add_province\s*=\s*(\d+)", content)
-                provinces = [id for id in provinces_match]
-                if not provinces:
-                    provinces_match = re.findall(r"provinces\s*=\s*{\s*([\d\s]+)\s*}", content)
-                    if provinces_match:
-                        provinces = provinces_match[0].split()
-
-        except Exception as e:
-            print(f"Error parsing {filepath}: {e}")
-            return None
-
-        return {"state_id": state_id, "filename": filename, "state_name": state_name_from_file, "localized_name": localized_name, "owner": owner, "manpower": manpower, "provinces": provinces}
+    def is_loading(self):
+        return self.load_thread is not None
+
+    def start_loading(self, kinds):
+        if self.edit_journal.has_pending() and ("states" in kinds or "regions" in kinds):
+            # 読み込み直すと保存していない編集がメモリ上から消えてしまう
+            print("保存していない編集があるため、ステートと戦略地域は読み込み直しません。先に保存または破棄してください。")
+            kinds = [kind for kind in kinds if kind not in ("states", "regions")]
+            if not kinds:
+                return
+        if self.is_loading():
+            # 実行中のロードが終わってから続けて読み込む
+            for kind in kinds:
+                if kind not in self.pending_load_kinds:
+                    self.pending_load_kinds.append(kind)
+            return
+        paths = {
+            "localisation": self.localisation,
+            "languages": [self.language] + self.extra_languages,
+            "states": self.state_dir,
+            "provinces": self.definition_csv_path,
+            "regions": self.strategic_regions_dir,
+        }
+        self.load_thread = QThread()
+        self.load_worker = LoadWorker(kinds, paths, self.parse_cache, self.load_workers, self.load_executor)
+        self.load_worker.moveToThread(self.load_thread)
+        self.load_thread.started.connect(self.load_worker.run)
+        self.load_worker.kind_started.connect(self.on_load_kind_started)
+        self.load_worker.batch_ready.connect(self.on_load_batch_ready)
+        self.load_worker.progress.connect(self.on_load_progress)
+        self.load_worker.kind_finished.connect(self.on_load_kind_finished)
+        self.load_worker.finished.connect(self.on_loading_finished)
+        for widget in (self.loading_label, self.loading_progress, self.cancel_loading_button):
+            widget.show()
+        self.load_thread.start()
+
+    def cancel_loading(self):
+        self.pending_load_kinds = []
+        if self.load_worker is not None:
+            self.load_worker.cancel()
+
+    def on_load_kind_started(self, kind, total):
+        self.loaded_kinds.discard(kind)
+        self.records_changed()
+        self.loading_label.setText({"localisation": "ローカライズ", "states": "ステート", "provinces": "プロビンス", "regions": "戦略地域"}[kind] + "を読み込み中")
+        self.loading_progress.setRange(0, max(total, 1))
+        self.loading_progress.setValue(0)
+        if kind in ("states", "regions"):
+            # ディスクから読み直すので、ジャーナルが覚えているファイルの内容も読み直させる
+            self.edit_journal.forget(list(self.edit_journal.current))
+            self.update_edit_buttons()
+        if kind in ("states", "regions"):
+            self.loaded_records = {} # ファイルの順番 -> レコード (届いた順ではなく、終わってからこの順に並べる)
+        if kind == "states":
+            self.state_files_info = []
+            self.filtered_state_files_info = []
+            self.state_by_id = {}
+            self.province_to_state = {}
+            self.state_search.clear()
+            self.state_model.set_rows([])
+        elif kind == "provinces":
+            self.province_data = []
+            self.filtered_province_data = []
+            self.province_by_id = {}
+            self.province_search.clear()
+            self.province_model.set_rows([])
+        elif kind == "regions":
+            self.strategic_region_files_info = []
+            self.filtered_strategic_region_files_info = []
+            self.region_by_id = {}
+            self.province_to_region = {}
+            self.strategic_region_search.clear()
+            self.strategic_region_model.set_rows([])
+
+    def records_changed(self):
+        # 列データとソート順のキャッシュは、次に使うときに作り直す
+        self.query_store = None
+        self.sort_orders.invalidate()
+
+    def on_load_batch_ready(self, kind, batch):
+        self.records_changed()
+        if kind == "localisation":
+            self.localisation_strings = batch[self.language]
+        elif kind == "states":
+            # バッチは届いた順 (キャッシュ済み → パースが終わった順) なので、ここでは表に表示するだけにして、
+            # レコードの一覧・インデックス・検索は読み込みが終わってからファイルの順に作る (on_load_kind_finished)
+            records = []
+            for index, state_info in batch:
+                # キャッシュ上のレコードを編集で書き換えないようにコピーする
+                state_info = dict(state_info, provinces=list(state_info["provinces"]))
+                self.localize_state_info(state_info)
+                self.loaded_records[index] = state_info
+                records.append(state_info)
+            self.state_model.append_rows(records)
+        elif kind == "provinces":
+            records = []
+            for row in batch:
+                province_info = state_loader.ProvinceRecord(*row)
+                province_info.state_id = self.get_state_id_for_province(province_info.province_id) # ステートIDを取得
+                self.province_data.append(province_info)
+                self.filtered_province_data.append(province_info)
+                self.province_by_id[str(province_info.province_id)] = province_info # ステートの provinces と同じ文字列のIDで引く
+                records.append(province_info)
+            self.province_search.add(records)
+            self.province_model.append_rows(records)
+        elif kind == "regions":
+            records = []
+            for index, region_info in batch:
+                region_info = dict(region_info, provinces=list(region_info["provinces"]))
+                self.localize_region_info(region_info)
+                self.loaded_records[index] = region_info
+                records.append(region_info)
+            self.strategic_region_model.append_rows(records)
+
+    def on_load_progress(self, kind, done, total):
+        self.loading_progress.setValue(done)
+
+    def on_load_kind_finished(self, kind):
+        self.loaded_kinds.add(kind)
+        if kind in ("states", "regions"):
+            # 届いた順によらず、ファイルの順 (state_tool_core の load と同じ) に並べてからインデックスを作る。
+            # 同じプロビンスが複数のファイルにあれば、後のファイルが優先される
+            records = [self.loaded_records[index] for index in sorted(self.loaded_records)]
+            self.loaded_records = {}
+        if kind == "states":
+            self.state_files_info = records
+            self.state_by_id = {}
+            self.province_to_state = {}
+            for state_info in records:
+                self.state_by_id[state_info["state_id"]] = state_info
+                self.index_state_provinces(state_info)
+            self.state_search.add(records)
+            self.filtered_state_files_info = list(records)
+            self.sort_state_files()
+            self.display_state_files()
+            if "provinces" in self.loaded_kinds:
+                # ステートを読み直したのでプロビンスの所属ステートも更新する
+                for province_info in self.province_data:
+                    province_info["state_id"] = self.get_state_id_for_province(province_info["province_id"])
+                self.province_search.update(self.province_data, ["ステートID"])
+                if self.view_combo.currentIndex() == 1:
+                    self.display_province_data()
+        elif kind == "provinces":
+            self.filtered_province_data = list(self.province_data)
+        elif kind == "regions":
+            records.sort(key=lambda x: x["strategic_region_name"])
+            self.strategic_region_files_info = records
+            self.region_by_id = {}
+            self.province_to_region = {}
+            for region_info in records:
+                self.region_by_id[region_info["strategic_region_id"]] = region_info
+                self.index_region_provinces(region_info)
+            self.strategic_region_search.add(records)
+            self.filtered_strategic_region_files_info = list(records)
+            self.display_strategic_region_data()
 
-    def load_province_data(self):
-        self.province_data = []
-        try:
-            with open(self.definition_csv_path, 'r', encoding='utf-8') as f:
-                # CSVファイルをパース (ヘッダー行はスキップ)
-                next(f)  # 1行目をスキップ
-                for line in f:
-                    items = line.strip().split(';')
-                    if len(items) < 6: # データが足りない場合はスキップ
-                        continue
-                    province_id, r, g, b, terrain_type, is_coastal = items[:6]
-                    # 7列目が "true" または "false" の場合のみ処理
-                    if is_coastal == "true" or is_coastal == "false":
-                      province_info = {
-                          "province_id": province_id,
-                          "r": r,
-                          "g": g,
-                          "b": b,
-                          "terrain_type": terrain_type,
-                          "is_coastal": is_coastal,
-                          "state_id": self.get_state_id_for_province(province_id), # ステートIDを取得
-                      }
-                      self.province_data.append(province_info)
-        except Exception as e:
-            print(f"Error loading province data from {self.definition_csv_path}: {e}")
+    def on_loading_finished(self, cancelled):
+        self.load_thread.quit()
+        self.load_thread.wait()
+        self.load_worker.deleteLater()
+        self.load_thread.deleteLater()
+        self.load_thread = None
+        self.load_worker = None
+        for widget in (self.loading_label, self.loading_progress, self.cancel_loading_button):
+            widget.hide()
+        if cancelled:
+            print("ロードを中止しました。")
+        else:
+            self.load_logistics()
+            self.run_validation()
+        if self.pending_load_kinds:
+            kinds = self.pending_load_kinds
+            self.pending_load_kinds = []
+            self.start_loading(kinds)
+
+    def closeEvent(self, event):
+        if self.edit_journal.has_pending():
+            answer = QMessageBox.question(self, "保存の確認", "保存していない編集があります。保存しますか？",
+                                          QMessageBox.Save | QMessageBox.Discard | QMessageBox.Cancel)
+            if answer == QMessageBox.Cancel or (answer == QMessageBox.Save and not self.save_edits()):
+                event.ignore()
+                return
+        self.stop_file_watcher()
+        self.cancel_loading()
+        if self.load_thread is not None:
+            self.load_thread.quit()
+            self.load_thread.wait()
+        if self.parse_cache is not None:
+            self.parse_cache.save() # 保存後に再パースしたファイルの分
+        super().closeEvent(event)
+
+    def index_state_provinces(self, state_info):
+        for province_id in state_info["provinces"]:
+            self.province_to_state[province_id] = state_info["state_id"]
+
+    def index_region_provinces(self, region_info):
+        for province_id in region_info["provinces"]:
+            self.province_to_region[province_id] = region_info
+
+    def localisation_columns(self, table):
+        """設定ファイルの [Localisation] languages の言語ごとのローカライズ名の列。"""
+        def getter(language):
+            return lambda x: state_tool_core.localized_name(table, x, self.localisation.strings(language))
+        return [(f"ローカライズ名 ({language})", getter(language)) for language in self.extra_languages]
+
+    def localize_state_info(self, state_info):
+        state_tool_core.localize_state(state_info, self.localisation_strings)
 
     def get_state_id_for_province(self, province_id):
-        for state_info in self.state_files_info:
-            if province_id in state_info["provinces"]:
-                return state_info["state_id"]
-        return -1 # 見つからない場合は-1を返す
+        return self.province_to_state.get(str(province_id), -1) # 見つからない場合は-1を返す
 
     def display_province_data(self):
-        self.province_tree_widget.clear()
         display_data = self.filtered_province_data if self.filtered_province_data else self.province_data
-        for province_info in display_data:
-            state_id = province_info["state_id"]
-            state_id_str = str(state_id) if state_id != -1 else "N/A"
-            state_name = "N/A"
-            localized_name = "N/A"
-            if state_id != -1:
-                # ステートIDからステート名を検索
-                for state in self.state_files_info:
-                    if state["state_id"] == state_id:
-                        state_name = state["localized_name"]
-                        localized_name = state["state_name"]
-                        break
-
-            item = QTreeWidgetItem([
-                province_info["province_id"],
-                province_info["r"],
-                province_info["g"],
-                province_info["b"],
-                province_info["terrain_type"],
-                province_info["is_coastal"],
-                str(state_id),
-                state_name,
-                localized_name,
-            ])
-            self.province_tree_widget.addTopLevelItem(item)
+        self.province_model.set_rows(display_data)
+
+    def province_state_field(self, province_info, field):
+        # ステートIDからステート名を検索 (描画される行についてだけ呼ばれる)
+        state = self.state_by_id.get(province_info["state_id"])
+        if state:
+            return state[field]
+        return "N/A"
 
     def display_state_files(self):
-        self.tree_widget.clear()
-        for state_info in self.filtered_state_files_info:
-            item = QTreeWidgetItem([str(state_info["state_id"]), state_info["state_name"], state_info["localized_name"], state_info["owner"], state_info["manpower"]])
-            self.tree_widget.addTopLevelItem(item)
+        self.state_model.set_rows(self.filtered_state_files_info)
 
     def toggle_sort_order(self):
         self.sort_order_ascending = not self.sort_order_ascending
         self.sort_order_button.setText("昇順" if self.sort_order_ascending else "降順")
+        self.apply_sort()
+
+    def apply_sort(self):
         current_view_index = self.view_combo.currentIndex()
         if current_view_index == 0: # ステートビュー
             self.sort_state_files()
@@ -408,164 +755,89 @@ class StateFileLister(QWidget):
             self.sort_strategic_region_data()
             self.display_strategic_region_data()
 
-    def sort_state_files(self):
+    def sorted_records(self, view_index, records, subset):
+        """
+        キャッシュしたソート順で subset を並べたリストを返す。
+        同じ列なら2回目以降はソートせず、昇順・降順の切り替えも並びを反転するだけで済む。
+        """
         self.sort_key = self.sort_combo.currentText()
-        if self.sort_key == "ステートID":
-            self.filtered_state_files_info.sort(key=lambda x: x["state_id"], reverse=not self.sort_order_ascending)
-        elif self.sort_key == "ステート名":
-            self.filtered_state_files_info.sort(key=lambda x: x["state_name"].lower(), reverse=not self.sort_order_ascending)
-        elif self.sort_key == "ローカライズ名":
-            self.filtered_state_files_info.sort(key=lambda x: x["localized_name"].lower(), reverse=not self.sort_order_ascending)
-        elif self.sort_key == "領有国":
-            self.filtered_state_files_info.sort(key=lambda x: x["owner"].lower(), reverse=not self.sort_order_ascending)
-        elif self.sort_key == "人口":
-            self.filtered_state_files_info.sort(key=lambda x: int(x["manpower"]), reverse=not self.sort_order_ascending)
+        columns = [self.sort_key, self.sort_combo2.currentText()]
+        columns = tuple(column for i, column in enumerate(columns) if column in self.sort_columns[view_index] and column not in columns[:i])
+        if not columns:
+            return subset
+        key_funcs = [self.sort_columns[view_index][column] for column in columns]
+        return self.sort_orders.sort(view_index, records, subset, columns, key_funcs, self.sort_order_ascending)
+
+    def sort_state_files(self):
+        self.filtered_state_files_info = self.sorted_records(0, self.state_files_info, self.filtered_state_files_info)
 
     def sort_province_data(self):
-        self.sort_key = self.sort_combo.currentText()
-        if self.sort_key == "プロビンスID":
-            self.filtered_province_data.sort(key=lambda x: int(x["province_id"]), reverse=not self.sort_order_ascending)
-        elif self.sort_key == "地形":
-            self.filtered_province_data.sort(key=lambda x: x["terrain_type"].lower(), reverse=not self.sort_order_ascending)
-        elif self.sort_key == "ステートID":
-            self.filtered_province_data.sort(key=lambda x: int(x["state_id"]) if x["state_id"] != -1 else -1, reverse=not self.sort_order_ascending)
-        elif self.sort_key == "R":
-            self.filtered_province_data.sort(key=lambda x: int(x["r"]), reverse=not self.sort_order_ascending)
-        elif self.sort_key == "G":
-            self.filtered_province_data.sort(key=lambda x: int(x["g"]), reverse=not self.sort_order_ascending)
-        elif self.sort_key == "B":
-            self.filtered_province_data.sort(key=lambda x: int(x["b"]), reverse=not self.sort_order_ascending)
-        elif self.sort_key == "沿岸":
-            self.filtered_province_data.sort(key=lambda x: x["is_coastal"].lower(), reverse=not self.sort_order_ascending)
+        self.filtered_province_data = self.sorted_records(1, self.province_data, self.filtered_province_data)
 
     def search_state_files(self):
         search_text = self.search_entry.text().strip()
         search_criteria = self.search_criteria_combo.currentText()
-        match_type = self.match_type_combo.currentText()
+        exact = self.match_type_combo.currentText() == "完全一致"
         current_view_index = self.view_combo.currentIndex()
 
-        if current_view_index == 0: # ステートビューの検索
-            self.filtered_state_files_info = [] # 検索結果リストをクリア
-            for state_info in self.state_files_info:
-                match = False
-                if search_criteria == "ステートID":
-                    if match_type == "完全一致":
-                        if str(state_info["state_id"]) == search_text:
-                            match = True
-                    elif match_type == "部分一致":
-                        if search_text in str(state_info["state_id"]):
-                            match = True
-                elif search_criteria == "ステート名":
-                    if match_type == "完全一致":
-                        if state_info["state_name"].lower() == search_text.lower():
-                            match = True
-                    elif match_type == "部分一致":
-                        if search_text.lower() in state_info["state_name"].lower():
-                            match = True
-                elif search_criteria == "ローカライズ名":
-                    if match_type == "完全一致":
-                        if state_info["localized_name"].lower() == search_text.lower():
-                            match = True
-                    elif match_type == "部分一致":
-                        if search_text.lower() in state_info["localized_name"].lower():
-                            match = True
-                elif search_criteria == "領有国":
-                    if search_text:
-                        if match_type == "完全一致":
-                            if state_info["owner"].upper() == search_text.upper():
-                                match = True
-                        elif match_type == "部分一致":
-                            if search_text.upper() in state_info["owner"].upper():
-                                match = True
-                elif search_criteria == "人口":
-                    if search_text:
-                        try:
-                            if match_type == "完全一致":
-                                if str(int(search_text)) == state_info["manpower"]:
-                                    match = True
-                            elif match_type == "部分一致":
-                                if search_text in str(state_info["manpower"]):
-                                    match = True
-                        except ValueError:
-                            pass
-                elif search_criteria == "プロビンス":
-                    if search_text:
-                        if match_type == "完全一致":
-                            if search_text in state_info["provinces"]:
-                                match = True
-                        elif match_type == "部分一致":
-                            for province_id in state_info["provinces"]:
-                                if search_text in province_id:
-                                    match = True
-                                    break
-
-                if match:
-                    self.filtered_state_files_info.append(state_info)
+        if search_text and self.match_type_combo.currentText() == "クエリ":
+            self.search_by_query(search_text, current_view_index)
+            return
 
+        # 正規化済みのキーの索引で引く (空欄なら全件を表示する)
+        if current_view_index == 0: # ステートビューの検索
+            if search_text:
+                self.filtered_state_files_info = self.state_search.search(search_criteria, search_text, exact)
+            else:
+                self.filtered_state_files_info = list(self.state_files_info)
             self.display_state_files()
 
         elif current_view_index == 1: # プロビンスビューの検索
-            self.filtered_province_data = [] # 検索結果リストをクリア
-            for province_info in self.province_data:
-                match = False
-                if search_criteria == "プロビンスID":
-                    if match_type == "完全一致":
-                        if str(province_info["province_id"]) == search_text:
-                            match = True
-                    elif match_type == "部分一致":
-                        if search_text in str(province_info["province_id"]):
-                            match = True
-                elif search_criteria == "地形":
-                    if match_type == "完全一致":
-                        if province_info["terrain_type"].lower() == search_text.lower():
-                            match = True
-                    elif match_type == "部分一致":
-                        if search_text.lower() in province_info["terrain_type"].lower():
-                            match = True
-                elif search_criteria == "ステートID":
-                    if search_text:
-                        if match_type == "完全一致":
-                            if str(province_info["state_id"]) == search_text:
-                                match = True
-                        elif match_type == "部分一致":
-                            if search_text in str(province_info["state_id"]):
-                                match = True
-
-                if match:
-                    self.filtered_province_data.append(province_info)
-
+            if search_text:
+                self.filtered_province_data = self.province_search.search(search_criteria, search_text, exact)
+            else:
+                self.filtered_province_data = list(self.province_data)
             self.display_province_data()
 
         elif current_view_index == 2: # 戦略地域ビューの検索
-            self.filtered_strategic_region_files_info = [] # 検索結果リストをクリア
-            for region_info in self.strategic_region_files_info:
-                match = False
-                if search_criteria == "戦略地域ID":
-                    if match_type == "完全一致":
-                        if str(region_info["strategic_region_id"]) == search_text:
-                            match = True
-                    elif match_type == "部分一致":
-                        if search_text in str(region_info["strategic_region_id"]):
-                            match = True
-                elif search_criteria == "戦略地域名":
-                    if match_type == "完全一致":
-                        if region_info["strategic_region_name"].lower() == search_text.lower():
-                            match = True
-                    elif match_type == "部分一致":
-                        if search_text.lower() in region_info["strategic_region_name"].lower():
-                            match = True
-                if match:
-                    self.filtered_strategic_region_files_info.append(region_info)
+            if search_text:
+                self.filtered_strategic_region_files_info = self.strategic_region_search.search(search_criteria, search_text, exact)
+            else:
+                self.filtered_strategic_region_files_info = list(self.strategic_region_files_info)
+            self.display_strategic_region_data()
+
+    def search_by_query(self, query_text, view_index):
+        table = ("state", "province", "region")[view_index]
+        query = self.compiled_queries.get((query_text, table))
+        try:
+            if query is None:
+                query = compile_query(query_text, table)
+                self.compiled_queries[(query_text, table)] = query
+            if self.query_store is None:
+                self.query_store = QueryStore(self.state_files_info, self.province_data, self.strategic_region_files_info)
+            result = self.query_store.select(query, table)
+        except QueryError as e:
+            print(f"Query error: {e}")
+            QMessageBox.warning(self, "クエリのエラー", str(e))
+            return
+        if view_index == 0:
+            self.filtered_state_files_info = result
+            self.display_state_files()
+        elif view_index == 1:
+            self.filtered_province_data = result
+            self.display_province_data()
+        elif view_index == 2:
+            self.filtered_strategic_region_files_info = result
             self.display_strategic_region_data()
 
     def show_context_menu(self, point):
-        item_tree_widget = self.sender() # sender() でイベントを送信したウィジェットを取得
-        item = item_tree_widget.itemAt(point)
+        view = self.sender() # sender() でイベントを送信したビューを取得
+        record = view.model().record(view.indexAt(point).row())
 
-        if item:
-            self.current_item = item
+        if record:
+            self.current_record = record
             menu = QMenu(self)
-            if item_tree_widget == self.tree_widget: # ステートツリーの場合
+            if view == self.state_view: # ステートビューの場合
                 open_vscode_action = QAction("VSCodeで開く", self)
                 open_vscode_action.triggered.connect(self.open_state_file_from_menu)
                 menu.addAction(open_vscode_action)
@@ -578,8 +850,7 @@ class StateFileLister(QWidget):
                 transfer_provinces_action = QAction("プロビンス移譲", self)
                 transfer_provinces_action.triggered.connect(self.show_transfer_province_dialog)
                 menu.addAction(transfer_provinces_action)
-            elif self.strategic_region_tree_widget.itemAt(point):  # strategic_region_tree_widget 上で右クリックされた場合
-                menu = QMenu(self)
+            elif view == self.strategic_region_view:  # 戦略地域ビュー上で右クリックされた場合
                 open_vscode_action = QAction("VSCodeで開く", self)
                 open_vscode_action.triggered.connect(self.open_strategic_region_file_from_menu)
                 menu.addAction(open_vscode_action)
@@ -589,21 +860,15 @@ class StateFileLister(QWidget):
                 show_provinces_action = QAction("プロビンスを表示", self)
                 show_provinces_action.triggered.connect(self.show_province_list_from_menu)
                 menu.addAction(show_provinces_action)
-                transfer_provinces_action = QAction("プロビンス移譲", self)
-                transfer_provinces_action.triggered.connect(self.show_transfer_province_dialog)
-                menu.addAction(transfer_provinces_action)
-            menu.exec_(self.tree_widget.viewport().mapToGlobal(point))
+            menu.exec_(view.viewport().mapToGlobal(point))
         else:
-            self.current_item = None
+            self.current_record = None
 
     def open_state_file_from_menu(self):
-        if self.current_item:
-            self.open_state_file_in_vscode(self.current_item)
+        if self.current_record:
+            self.open_state_file_in_vscode(self.current_record)
 
-    def open_state_file_in_vscode(self, item):
-        state_id_str = item.text(0)
-        state_id = int(state_id_str)
-        state_info = next((info for info in self.filtered_state_files_info if info["state_id"] == state_id), None)
+    def open_state_file_in_vscode(self, state_info):
         if state_info:
             filepath = os.path.join(self.state_dir, state_info["filename"])
             command = f"code \"{filepath}\""
@@ -614,136 +879,62 @@ class StateFileLister(QWidget):
             print("Invalid item index.")
 
     def show_province_list_from_menu(self):
-        if self.current_item:
-            self.show_province_list_popup(self.current_item)
+        if self.current_record:
+            self.show_province_list_popup(self.current_record)
 
-    def show_province_list_popup(self, item):
-        state_id_str = item.text(0)
-        state_id = int(state_id_str)
-        state_info = next((info for info in self.filtered_state_files_info if info["state_id"] == state_id), None)
-        if state_info:
-            province_list = state_info["provinces"]
+    def show_province_list_popup(self, record):
+        # ステートと戦略地域のどちらのレコードにも provinces がある
+        if record:
+            province_list = record["provinces"]
             dialog = ProvinceListDialog(province_list, self)
             dialog.exec_()
         else:
             print("Invalid item index.")
 
-    def load_strategic_regions(self):
-        self.strategic_region_files_info = []
-        if not os.path.exists(self.strategic_regions_dir):
-            print(f"エラー：戦略地域ディレクトリが見つかりません: {self.strategic_regions_dir}")
-            return  # ディレクトリが存在しない場合はここで処理を中断
-
-        for filename in os.listdir(self.strategic_regions_dir):
-            if filename.endswith(".txt"):
-                filepath = os.path.join(self.strategic_regions_dir, filename)
-                region_info = self.parse_strategic_region_file(filepath)
-                if region_info:
-                    self.strategic_region_files_info.append(region_info)
-        self.filtered_strategic_region_files_info = list(self.strategic_region_files_info) # 検索結果リストも初期化
-
-    def parse_strategic_region_file(self, filepath):
-        filename = os.path.basename(filepath)
-        strategic_region_name_match = re.match(r"(.+)\.txt", filename) # ファイル名から拡張子を除いた部分を取得
-        if not strategic_region_name_match:
-            return None
-
-        strategic_region_name = strategic_region_name_match.group(1)
-        strategic_region_id = -1 # IDはファイル名から取得できないため、-1 で初期化
-        provinces = []
-
-        try:
-            with open(filepath, 'r', encoding='utf-8') as f:
-                content = f.read()
-                strategic_region_id_match = re.search(r"id\s*=\s*(\d+)", content)
-                if strategic_region_id_match:
-                    strategic_region_id = int(strategic_region_id_match.group(1))
-                provinces_match = re.search(r"provinces\s*=\s*{(.*?)}", content, re.DOTALL) # provinces を抽出
-                if provinces_match:
-                    provinces_text = provinces_match.group(1)
-                    provinces = [province.strip() for province in provinces_text.split()] # スペース区切りでプロビンスIDを取得
-                localisation_key = strategic_region_name # 戦略地域名はlocalisation keyと同一と仮定
-                if localisation_key in self.localisation_strings:
-                    localized_name = self.localisation_strings[localisation_key]
-                else:
-                    localized_name = f"<{localisation_key} not found>"
-
-        except Exception as e:
-            print(f"Error parsing strategic region file {filepath}: {e}")
-            return None
-
-        return {
-            "strategic_region_id": strategic_region_id,
-            "strategic_region_name": strategic_region_name, # ファイル名 (拡張子なし) を戦略地域名とする
-            "localized_name": localized_name,
-            "provinces": provinces, # プロビンスリストを追加
-        }
+    def localize_region_info(self, region_info):
+        state_tool_core.localize_region(region_info, self.localisation_strings)
 
     def display_strategic_region_data(self):
-        self.strategic_region_tree_widget.clear()
         display_data = self.filtered_strategic_region_files_info if self.filtered_strategic_region_files_info else self.strategic_region_files_info
-        for region_info in display_data:
-            item = QTreeWidgetItem([
-                str(region_info["strategic_region_id"]),
-                region_info["strategic_region_name"],
-                region_info["localized_name"]
-            ])
-            self.strategic_region_tree_widget.addTopLevelItem(item)
+        self.strategic_region_model.set_rows(display_data)
 
     def sort_strategic_region_data(self):
-        self.sort_key = self.sort_combo.currentText()
-        if self.sort_key == "戦略地域ID":
-            self.filtered_strategic_region_files_info.sort(key=lambda x: x["strategic_region_id"], reverse=not self.sort_order_ascending)
-        elif self.sort_key == "戦略地域名":
-            self.filtered_strategic_region_files_info.sort(key=lambda x: x["strategic_region_name"].lower(), reverse=not self.sort_order_ascending)
-        elif self.sort_key == "ローカライズ名":
-            self.filtered_strategic_region_files_info.sort(key=lambda x: x["localized_name"].lower(), reverse=not self.sort_order_ascending)
+        self.filtered_strategic_region_files_info = self.sorted_records(2, self.strategic_region_files_info, self.filtered_strategic_region_files_info)
 
     def show_owner_country_list_from_menu(self):
-        if self.current_item:
-            self.show_owner_country_list_popup(self.current_item)
-
-    def show_owner_country_list_popup(self, item):
-        item_tree_widget = self.sender() # sender() でイベントを送信したウィジェットを取得
-        if item_tree_widget == self.tree_widget: # ステートビューの場合 (既存の処理)
-            state_id_str = item.text(0)
-            state_id = int(state_id_str)
-            state_info = next((info for info in self.filtered_state_files_info if info["state_id"] == state_id), None)
+        if self.current_record:
+            self.show_owner_country_list_popup(self.current_record)
+
+    def show_owner_country_list_popup(self, record):
+        view = self.stacked_widget.currentWidget() # メニューの QAction から呼ばれるため表示中のビューで判定
+        if view == self.state_view: # ステートビューの場合 (既存の処理)
+            state_info = record
             if state_info:
                 owner_country_list = [state_info["owner"]] # owner をリストに
                 dialog = OwnerCountryDialog(owner_country_list, self)
                 dialog.exec_()
             else:
                 print("Invalid item index.")
-        elif item_tree_widget == self.strategic_region_tree_widget: # 戦略地域ビューの場合 (新規処理)
-            strategic_region_id_str = item.text(0)
-            strategic_region_id = int(strategic_region_id_str)
-            strategic_region_info = next((info for info in self.filtered_strategic_region_files_info if info["strategic_region_id"] == strategic_region_id), None)
+        elif view == self.strategic_region_view: # 戦略地域ビューの場合 (新規処理)
+            strategic_region_info = record
             if strategic_region_info:
                 owner_country_list = set() # 重複を避けるため set を使用
                 if strategic_region_info["provinces"]: # provinces が存在する場合のみ処理
                     for province_id in strategic_region_info["provinces"]:
                         province_id = str(province_id) # province_id は文字列に変換
-                        province_info = next((p_info for p_info in self.province_data if p_info["province_id"] == province_id), None)
-                        if province_info and province_info["state_id"] != -1:
-                            state_id = province_info["state_id"]
-                            state_info = next((s_info for s_info in self.state_files_info if s_info["state_id"] == state_id), None)
-                            if state_info:
-                                owner_country_list.add(state_info["owner"]) # 領有国をsetに追加
+                        state_info = self.state_by_id.get(self.get_state_id_for_province(province_id))
+                        if state_info:
+                            owner_country_list.add(state_info["owner"]) # 領有国をsetに追加
                 dialog = OwnerCountryDialog(list(owner_country_list), self) # set を list に変換
                 dialog.exec_()
             else:
                 print("Invalid item index.")
 
     def open_strategic_region_file_from_menu(self):
-        current_item = self.strategic_region_tree_widget.currentItem() # strategic_region_tree_widget の currentItem を取得
-        if current_item:
-            self.open_strategic_region_file_in_vscode(current_item)
-
-    def open_strategic_region_file_in_vscode(self, item):
-        strategic_region_id_str = item.text(0)
-        strategic_region_id = int(strategic_region_id_str)
-        strategic_region_info = next((info for info in self.filtered_strategic_region_files_info if info["strategic_region_id"] == strategic_region_id), None)
+        if self.current_record:
+            self.open_strategic_region_file_in_vscode(self.current_record)
+
+    def open_strategic_region_file_in_vscode(self, strategic_region_info):
         if strategic_region_info:
             filepath = os.path.join(self.strategic_regions_dir, strategic_region_info["strategic_region_name"] + ".txt")
             command = f"code \"{filepath}\""
@@ -754,36 +945,32 @@ class StateFileLister(QWidget):
             print("Invalid item index.")
 
     def show_belonging_state_list_from_menu(self):
-        if self.current_item:
-            self.show_belonging_state_list_popup(self.current_item)
-
-    def show_belonging_state_list_popup(self, item):
-        item_tree_widget = self.sender() # sender() でイベントを送信したウィジェットを取得
-        if item_tree_widget == self.strategic_region_tree_widget: # 戦略地域ビューの場合
-            strategic_region_id_str = item.text(0)
-            strategic_region_id = int(strategic_region_id_str)
-            strategic_region_info = next((info for info in self.filtered_strategic_region_files_info if info["strategic_region_id"] == strategic_region_id), None)
+        if self.current_record:
+            self.show_belonging_state_list_popup(self.current_record)
+
+    def show_belonging_state_list_popup(self, record):
+        view = self.stacked_widget.currentWidget() # メニューの QAction から呼ばれるため表示中のビューで判定
+        if view == self.strategic_region_view: # 戦略地域ビューの場合
+            strategic_region_info = record
             if strategic_region_info:
                 belonging_state_list = set() # 重複を避けるため set を使用
                 if strategic_region_info["provinces"]: # provinces が存在する場合のみ処理
                     for province_id in strategic_region_info["provinces"]:
                         province_id = str(province_id) # province id を文字列に変換
-                        province_info = next((p_info for p_info in self.province_data if p_info["province_id"] == province_id), None)
-                        if province_info and province_info["state_id"] != -1:
-                            state_id = province_info["state_id"]
-                            state_info = next((s_info for s_info in self.state_files_info if s_info["state_id"] == state_id), None)
-                            if state_info:
-                                belonging_state_list.add(state_info["localized_name"]) # ステート名 (localized_name) を set に追加
+                        state_info = self.state_by_id.get(self.get_state_id_for_province(province_id))
+                        if state_info:
+                            belonging_state_list.add(state_info["localized_name"]) # ステート名 (localized_name) を set に追加
                 dialog = BelongingStateDialog(list(belonging_state_list), self) # set を list に変換
                 dialog.exec_()
             else:
                 print("Invalid item index.")
 
     def show_transfer_province_dialog(self):
-        if self.current_item:
-            state_id_str = self.current_item.text(0)
-            state_id = int(state_id_str)
-            state_info = next((info for info in self.filtered_state_files_info if info["state_id"] == state_id), None)
+        if self.is_loading():
+            print("読み込み中はプロビンスを移譲できません。")
+            return
+        if self.current_record:
+            state_info = self.current_record
             if state_info:
                 province_list = state_info["provinces"]
                 dialog = ProvinceTransferDialog(province_list, self)
@@ -807,133 +994,476 @@ class StateFileLister(QWidget):
         if not selected_provinces or not target_state_id:
             return
 
-        source_state_info = self.find_state_info_by_id(source_state_id)
-        target_state_info = self.find_state_info_by_id(target_state_id)
-
-        if not source_state_info or not target_state_info:
+        plan = state_tool_core.plan_province_move(self.state_by_id, self.province_to_region, selected_provinces, source_state_id, target_state_id)
+        if plan is None:
             print("Error: Source or target state not found.")
             return
 
-        # 戦略地域の更新処理
-        for province_id in selected_provinces:
-            source_region_info = self.find_strategic_region_by_province(province_id)
-            # 移譲先ステートの最初のプロビンスが属する戦略地域を取得 (存在する場合)
-            target_region_info = None
-            if target_state_info["provinces"]:
-                target_region_info = self.find_strategic_region_by_province(target_state_info["provinces"][0])
-
-            if source_region_info and target_region_info != source_region_info: # 異なる戦略地域に移動する場合のみ更新
-                # 移譲元戦略地域からプロビンスを削除
-                source_region_info["provinces"] = [p for p in source_region_info["provinces"] if p != str(province_id)] # 文字列比較
-                self.update_strategic_region_file(source_region_info)
-
-                # 移譲先戦略地域にプロビンスを追加
-                target_region_info["provinces"].append(str(province_id))
-                target_region_info["provinces"] = sorted(list(set(target_region_info["provinces"]))) # 重複削除とソート
-                self.update_strategic_region_file(target_region_info)
-
-        # プロビンスを移譲元から削除 (ステートファイルの provinces リストを更新)
-        updated_source_provinces = [p for p in source_state_info["provinces"] if p not in selected_provinces]
-        source_state_info["provinces"] = updated_source_provinces
-
-        # プロビンスを移譲先に追加 (ステートファイルの provinces リストを更新)
-        target_state_info["provinces"].extend(selected_provinces)
-        target_state_info["provinces"] = sorted(list(set(target_state_info["provinces"]))) # 重複削除とソート
-
-        # ステートファイルを更新
-        self.update_state_file(source_state_info)
-        self.update_state_file(target_state_info)
-
-        # データと表示を更新
-        self.load_state_files() # ファイルを再読み込みして state_files_info を更新
-        self.filtered_state_files_info = list(self.state_files_info) # フィルタリングリストも更新
-        self.display_state_files() # ステートリストを再表示
-        self.load_province_data() # プロビンスデータも再読み込み
-        self.filtered_province_data = list(self.province_data)
-        self.display_province_data() # プロビンスリストも再表示
-        self.load_strategic_regions() # 戦略地域データも再読み込み
-        self.filtered_strategic_region_files_info = list(self.strategic_region_files_info)
-        self.display_strategic_region_data() # 戦略地域リストも再表示
-
-    def update_state_file(self, state_info):
-        filepath = os.path.join(self.state_dir, state_info["filename"])
-        try:
-            with open(filepath, 'r', encoding='utf-8') as f:
-                content_lines = f.readlines()
+        # レコードを変える前に、変わるファイルをすべて書き換えてみる。1つでも失敗したら何も変えずに中止する
+        contents = {}
+        failures = []
+        for state_info, provinces in plan["states"]:
+            content = self.render_state_file(state_info, provinces)
+            if content is None:
+                failures.append(self.state_filepath(state_info))
+            else:
+                contents[self.state_filepath(state_info)] = content
+        for region_info, provinces in plan["regions"]:
+            content = self.render_strategic_region_file(region_info, provinces)
+            if content is None:
+                failures.append(self.region_filepath(region_info))
+            else:
+                contents[self.region_filepath(region_info)] = content
+        if failures:
+            QMessageBox.warning(self, "移譲エラー", "次のファイルを書き換えられないため、移譲を中止しました。\n" + "\n".join(failures))
+            return
 
-            updated_lines = []
-            provinces_started = False
-            existing_provinces_section_lines = [] # 既存の provinces セクションの行を保持
+        source_state_info, target_state_info, changed_regions, changed_provinces = state_tool_core.apply_province_move(
+            plan, self.province_to_state, self.province_to_region, self.province_by_id)
 
-            for line in content_lines:
-                if re.search(r'provinces\s*=\s*\{', line): # 正規表現で provinces = { を検索 (空白を考慮)
-                    provinces_started = True
-                    updated_lines.append(line) # provinces = { 行はそのまま
-                    continue
-                if provinces_started:
-                    if '}' in line:
-                        provinces_started = False
-                        if state_info["provinces"]: # プロビンスがある場合のみ provinces = { ... } を書き出す
-                            updated_lines.extend([f'\t\t\t{province}\n' for province in sorted(state_info["provinces"])]) # プロビンスIDをソートして追加
-                        updated_lines.append('\t\t}\n') # 閉じ括弧を追加
-                        existing_provinces_section_lines = [] # provinces セクションの処理が終わったらクリア
-                        continue
-                    else:
-                        existing_provinces_section_lines.append(line) # 既存の provinces セクションの行を保持
-                        continue # 既存のプロビンス行はスキップ
-                updated_lines.append(line) # provinces セクション以外の行はそのまま
+        self.records_changed()
+        self.state_search.update([source_state_info, target_state_info], ["プロビンス"])
+        self.province_search.update(changed_provinces, ["ステートID"])
+        self.strategic_region_search.update(changed_regions, ["プロビンス"])
 
-            # provinces = {} がない場合の処理 (ファイルの末尾に追加)
-            if not any(re.search(r'provinces\s*=\s*\{', line) for line in content_lines) and state_info["provinces"]: # 正規表現で provinces = { を検索 (空白を考慮)
-                updated_lines.append('\tprovinces = {\n')
-                updated_lines.extend([f'\t\t\t{province}\n' for province in sorted(state_info["provinces"])])
-                updated_lines.append('\t\t}\n')
+        # 変更後のファイル内容をジャーナルに積む (ディスクへの書き込みは保存時)
+        self.edit_journal.record(f"プロビンス {', '.join(selected_provinces)} を {source_state_id} から {target_state_id} へ移譲", contents)
+        self.update_edit_buttons()
 
-            with open(filepath, 'w', encoding='utf-8') as f:
-                f.writelines(updated_lines)
+        if self.logistics is not None:
+            self.logistics.update_states([source_state_info, target_state_info]) # 補給の集計は変わったステートだけやり直す
 
-        except Exception as e:
-            print(f"Error updating state file {filepath}: {e}")
+        # 変更のあった行だけを再描画する (全体の再読み込みはしない)
+        self.state_model.refresh_records([source_state_info, target_state_info])
+        self.province_model.refresh_records(changed_provinces)
+        self.strategic_region_model.refresh_records(changed_regions)
+        self.run_validation()
 
-    def find_state_info_by_id(self, state_id):
-        return next((info for info in self.state_files_info if info["state_id"] == state_id), None)
+    def state_filepath(self, state_info):
+        return os.path.join(self.state_dir, state_info["filename"])
 
-    def find_strategic_region_by_province(self, province_id):
-        for region_info in self.strategic_region_files_info:
-            if str(province_id) in region_info["provinces"]: # province_id は文字列として比較
-                return region_info
-        return None # 見つからない場合は None を返す
+    def region_filepath(self, region_info):
+        return os.path.join(self.strategic_regions_dir, region_info["strategic_region_name"] + ".txt")
 
-    def update_strategic_region_file(self, region_info):
-        filepath = os.path.join(self.strategic_regions_dir, region_info["strategic_region_name"] + ".txt")
+    def load_logistics(self):
+        """鉄道と補給拠点を読み、ステートの補給の列を埋める。provinces.bmp があれば陸の隣接もたどる。"""
+        if not {"states", "provinces"} <= self.loaded_kinds:
+            return
+        graph = None
+        bmp_path = province_bitmap.find_provinces_bmp(self.config)
+        if bmp_path is not None:
+            try:
+                rows = state_loader.parse_definition_csv(self.definition_csv_path) if self.parse_cache is None else \
+                    self.parse_cache.get("definition", self.definition_csv_path, state_loader.parse_definition_csv)
+                graph = adjacency.load_province_graph(bmp_path, self.definition_csv_path, self.adjacencies_path, rows, self.parse_cache)
+            except (OSError, ValueError) as e:
+                print(f"Error building province graph from {bmp_path}: {e}")
+        land_provinces = {province_info.province_id for province_info in self.province_data if province_info.terrain_type == "land"}
+        self.logistics = logistics.LogisticsNetwork(logistics.parse_railways(self.railways_path),
+                                                    logistics.parse_supply_nodes(self.supply_nodes_path), graph, land_provinces)
+        self.logistics.update_states(self.state_files_info)
+        self.records_changed()
+        self.state_model.refresh_records(self.state_files_info)
+
+    def run_validation(self):
+        """マップ全体の整合性を確認し、結果をツールバーに表示する。"""
+        if self.is_loading() or not {"states", "provinces", "regions"} <= self.loaded_kinds:
+            return
+        issues = state_validator.validate(self.state_files_info, self.province_data, self.strategic_region_files_info)
+        counts = state_validator.summarize(issues)
+        if issues:
+            self.validation_label.setText(f"検証: エラー {counts['errors']} 件、警告 {counts['warnings']} 件")
+            self.validation_label.setStyleSheet("color: red;" if counts["errors"] else "color: darkorange;")
+            lines = [state_validator.format_issue(issue) for issue in issues[:VALIDATION_TOOLTIP_LINES]]
+            if len(issues) > VALIDATION_TOOLTIP_LINES:
+                lines.append(f"ほか {len(issues) - VALIDATION_TOOLTIP_LINES} 件")
+            self.validation_label.setToolTip("\n".join(lines))
+        else:
+            self.validation_label.setText("検証: 問題なし")
+            self.validation_label.setStyleSheet("")
+            self.validation_label.setToolTip("")
+
+    def update_edit_buttons(self):
+        pending_count = len(self.edit_journal.pending_paths())
+        self.save_button.setText(f"保存 ({pending_count})" if pending_count else "保存")
+        self.save_button.setEnabled(pending_count > 0)
+        self.discard_button.setEnabled(pending_count > 0)
+        self.undo_button.setEnabled(self.edit_journal.can_undo())
+        self.redo_button.setEnabled(self.edit_journal.can_redo())
+
+    def save_edits(self):
+        """ジャーナルに積んだ編集をまとめて書き込む。成功すれば True を返す。"""
+        if self.is_loading():
+            print("読み込み中は保存できません。")
+            return False
         try:
-            with open(filepath, 'r', encoding='utf-8') as f:
-                content_lines = f.readlines()
+            paths = self.edit_journal.commit()
+        except JournalCommitError as e:
+            # 書き込み済みのファイルは元に戻されている
+            print(f"Error saving edits: {e}")
+            QMessageBox.warning(self, "保存エラー", f"保存に失敗しました。ファイルは変更前の状態に戻しました。\n{e}")
+            return False
+        self.update_edit_buttons()
+
+        # 書き込んだファイルだけを再パースして、メモリ上のデータと食い違っていれば読み込み直す
+        paths = set(paths)
+        state_infos = [state_info for state_info in self.state_files_info if self.state_filepath(state_info) in paths]
+        region_infos = [region_info for region_info in self.strategic_region_files_info if self.region_filepath(region_info) in paths]
+        if not self.verify_written_files(state_infos, region_infos):
+            print("書き込んだファイルの内容が表示中のデータと一致しないため、再読み込みします。")
+            self.start_loading(["states", "provinces", "regions"])
+        return True
+
+    def discard_edits(self):
+        if self.is_loading():
+            return
+        self.apply_journal_contents(self.edit_journal.discard())
+        self.update_edit_buttons()
 
-            updated_lines = []
-            provinces_started = False
+    def undo_edit(self):
+        if self.is_loading():
+            return
+        result = self.edit_journal.undo()
+        if result:
+            label, paths = result
+            print(f"元に戻しました: {label}")
+            self.apply_journal_contents(paths)
+        self.update_edit_buttons()
+
+    def redo_edit(self):
+        if self.is_loading():
+            return
+        result = self.edit_journal.redo()
+        if result:
+            label, paths = result
+            print(f"やり直しました: {label}")
+            self.apply_journal_contents(paths)
+        self.update_edit_buttons()
+
+    def apply_journal_contents(self, filepaths):
+        """
+        ジャーナル上のファイル内容を再パースし、該当するステート・戦略地域のレコードとインデックスを差し替える。
+
+        Args:
+            filepaths (list[str]): 内容が変わったファイルのパス
+        """
+        state_records = {}
+        region_records = {}
+        for filepath in filepaths:
+            kind = self.classify_path(filepath)
+            if kind == "states":
+                record = state_loader.parse_state_file(filepath, self.edit_journal.read(filepath))
+                if record is not None:
+                    state_records[filepath] = record
+            elif kind == "regions":
+                record = state_loader.parse_strategic_region_file(filepath, self.edit_journal.read(filepath))
+                if record is not None:
+                    region_records[filepath] = record
+        self.apply_file_records(state_records, region_records)
+
+    def apply_file_records(self, state_records, region_records):
+        """
+        ファイル単位で再パースしたレコードを、メモリ上のレコード・インデックス・表示に反映する。
+
+        Args:
+            state_records (dict[str, dict | None]): ステートファイルのパス -> レコード (None ならファイルが削除された)
+            region_records (dict[str, dict | None]): 戦略地域ファイルのパス -> レコード (同上)
+        """
+        state_by_path = {self.state_filepath(state_info): state_info for state_info in self.state_files_info}
+        region_by_path = {self.region_filepath(region_info): region_info for region_info in self.strategic_region_files_info}
+        changed_states = []
+        changed_regions = []
+        changed_province_ids = set()
+        new_states = []
+        new_regions = []
+        states_added_or_removed = False
+        regions_added_or_removed = False
+
+        # 古いプロビンスリストの分をインデックスから外してから、新しいリストで登録し直す
+        for filepath, record in state_records.items():
+            state_info = state_by_path.get(filepath)
+            if state_info is not None:
+                for province_id in state_info["provinces"]:
+                    if self.province_to_state.get(province_id) == state_info["state_id"]:
+                        del self.province_to_state[province_id]
+                changed_province_ids.update(state_info["provinces"])
+            if record is None:
+                if state_info is not None:
+                    self.state_search.remove([state_info])
+                    self.state_files_info.remove(state_info)
+                    if state_info in self.filtered_state_files_info:
+                        self.filtered_state_files_info.remove(state_info)
+                    self.state_by_id.pop(state_info["state_id"], None)
+                    states_added_or_removed = True
+                continue
+            if state_info is None:
+                state_info = dict(record)
+                new_states.append(state_info)
+                self.state_files_info.append(state_info)
+                self.filtered_state_files_info.append(state_info)
+                states_added_or_removed = True
+            else:
+                state_info.update(record)
+            state_info["provinces"] = list(record["provinces"]) # キャッシュ上のレコードと共有しない
+            self.state_by_id[state_info["state_id"]] = state_info
+            self.localize_state_info(state_info)
+            changed_states.append(state_info)
+        for filepath, record in region_records.items():
+            region_info = region_by_path.get(filepath)
+            if region_info is not None:
+                for province_id in region_info["provinces"]:
+                    if self.province_to_region.get(province_id) is region_info:
+                        del self.province_to_region[province_id]
+            if record is None:
+                if region_info is not None:
+                    self.strategic_region_search.remove([region_info])
+                    self.strategic_region_files_info.remove(region_info)
+                    if region_info in self.filtered_strategic_region_files_info:
+                        self.filtered_strategic_region_files_info.remove(region_info)
+                    self.region_by_id.pop(region_info["strategic_region_id"], None)
+                    regions_added_or_removed = True
+                continue
+            if region_info is None:
+                region_info = dict(record)
+                new_regions.append(region_info)
+                self.strategic_region_files_info.append(region_info)
+                self.filtered_strategic_region_files_info.append(region_info)
+                regions_added_or_removed = True
+            else:
+                region_info.update(record)
+            region_info["provinces"] = list(record["provinces"])
+            self.region_by_id[region_info["strategic_region_id"]] = region_info
+            self.localize_region_info(region_info)
+            changed_regions.append(region_info)
+        for state_info in changed_states:
+            self.index_state_provinces(state_info)
+            changed_province_ids.update(state_info["provinces"])
+        for region_info in changed_regions:
+            self.index_region_provinces(region_info)
+        # 外したプロビンスが他のファイルにも書かれていた場合は、そちらで登録し直す
+        orphan_province_ids = {province_id for province_id in changed_province_ids if province_id not in self.province_to_state}
+        if orphan_province_ids:
+            for state_info in self.state_files_info:
+                for province_id in state_info["provinces"]:
+                    if province_id in orphan_province_ids:
+                        self.province_to_state[province_id] = state_info["state_id"]
+        if any(record is None for record in region_records.values()):
+            for region_info in self.strategic_region_files_info:
+                for province_id in region_info["provinces"]:
+                    self.province_to_region.setdefault(province_id, region_info)
+
+        changed_provinces = []
+        for province_id in changed_province_ids:
+            province_info = self.province_by_id.get(province_id)
+            if province_info:
+                province_info["state_id"] = self.get_state_id_for_province(province_id)
+                changed_provinces.append(province_info)
+
+        self.records_changed()
+        # 検索の索引も変更のあったレコードだけ作り直す (新しいレコードは update では無視される)
+        self.state_search.update(changed_states)
+        self.state_search.add(new_states)
+        self.province_search.update(changed_provinces, ["ステートID"])
+        self.strategic_region_search.update(changed_regions)
+        self.strategic_region_search.add(new_regions)
+
+        if self.logistics is not None:
+            self.logistics.update_states(changed_states + new_states)
+
+        if states_added_or_removed:
+            self.display_state_files()
+        else:
+            self.state_model.refresh_records(changed_states)
+        self.province_model.refresh_records(changed_provinces)
+        if regions_added_or_removed:
+            self.display_strategic_region_data()
+        else:
+            self.strategic_region_model.refresh_records(changed_regions)
+        self.run_validation()
+
+    def classify_path(self, filepath):
+        """ファイルのパスから、どのデータのファイルかを返す。対象外なら None。"""
+        def normalize(path):
+            return os.path.normcase(os.path.normpath(path))
+        path = normalize(filepath)
+        if path.endswith(".yml") and any(path.startswith(normalize(os.path.join(self.localisation.root, language)) + os.sep)
+                                         for language in [self.language] + self.extra_languages):
+            return "localisation"
+        if path == normalize(self.definition_csv_path):
+            return "provinces"
+        directory = os.path.dirname(path)
+        if directory == normalize(self.state_dir):
+            return "states"
+        if directory == normalize(self.strategic_regions_dir):
+            return "regions"
+        return None
 
-            for line in content_lines:
-                if re.search(r'provinces\s*=\s*\{', line): # 正規表現で provinces = { を検索 (空白を考慮)
-                    provinces_started = True
-                    updated_lines.append(line)
-                    continue
-                if provinces_started:
-                    if '}' in line:
-                        provinces_started = False
-                        if region_info["provinces"]:
-                            updated_lines.extend([f'\t\t\t{province}\n' for province in sorted(region_info["provinces"])]) # プロビンスIDをソートして追加
-                        updated_lines.append('\t\t}\n')
-                        continue
-                    else:
-                        continue # 既存のプロビンス行はスキップ
-                updated_lines.append(line)
+    def start_file_watcher(self):
+        backend = self.config.get('Watcher', 'backend', fallback='auto')
+        try:
+            watcher = file_watcher.create_watcher(backend)
+            watcher.add_directory(self.state_dir, ".txt")
+            watcher.add_directory(self.strategic_regions_dir, ".txt")
+            watcher.add_file(self.definition_csv_path)
+            for language in [self.language] + self.extra_languages:
+                for directory, _, _ in os.walk(os.path.join(self.localisation.root, language)):
+                    watcher.add_directory(directory, ".yml")
+        except OSError as e:
+            print(f"Error starting file watcher: {e}")
+            return
+        self.file_watcher = watcher
+        # 保存のように短時間に続く変更はまとめて反映する
+        self.watch_debounce_timer = QTimer(self)
+        self.watch_debounce_timer.setSingleShot(True)
+        self.watch_debounce_timer.setInterval(self.config.getint('Watcher', 'debounce_ms', fallback=300))
+        self.watch_debounce_timer.timeout.connect(self.apply_external_changes)
+        self.watch_timer = QTimer(self)
+        self.watch_timer.timeout.connect(self.poll_file_watcher)
+        self.watch_timer.start(self.config.getint('Watcher', 'interval_ms', fallback=500))
+
+    def stop_file_watcher(self):
+        if self.file_watcher is not None:
+            self.watch_timer.stop()
+            self.watch_debounce_timer.stop()
+            self.file_watcher.close()
+            self.file_watcher = None
+
+    def poll_file_watcher(self):
+        changed = self.file_watcher.poll()
+        if changed:
+            self.external_changes.update(changed)
+            self.watch_debounce_timer.start() # 変更が続く間は反映を遅らせる
+
+    def apply_external_changes(self):
+        """外部で変更されたファイルだけを再パースして反映する。"""
+        if self.is_loading():
+            # 読み込みが終わってから反映する
+            self.watch_debounce_timer.start()
+            return
+        filepaths = sorted(self.external_changes)
+        self.external_changes = set()
+
+        changed = []
+        for filepath in filepaths:
+            kind = self.classify_path(filepath)
+            if kind is None:
+                continue
+            if filepath in self.edit_journal.saved:
+                try:
+                    with open(filepath, 'r', encoding=self.edit_journal.encoding, newline='') as f: # ジャーナルと同じく改行コードを変換しない
+                        disk_content = f.read()
+                except OSError:
+                    disk_content = None
+                if disk_content == self.edit_journal.saved[filepath]:
+                    continue # このツールが保存した内容
+            changed.append((kind, filepath))
+        if not changed:
+            return
 
-            with open(filepath, 'w', encoding='utf-8') as f:
-                f.writelines(updated_lines)
+        # 保存していない編集のあるファイルが外部で変更された場合は、どちらを残すか確認する
+        pending_paths = set(self.edit_journal.pending_paths())
+        conflicts = [filepath for _, filepath in changed if filepath in pending_paths]
+        if conflicts:
+            answer = QMessageBox.question(
+                self, "外部での変更",
+                "保存していない編集のあるファイルが外部で変更されました。\n" + "\n".join(conflicts) +
+                "\n\n保存していない編集をすべて破棄して、外部の変更を読み込みますか？\n(「いいえ」の場合は編集を残し、保存時に外部の変更を上書きします)",
+                QMessageBox.Yes | QMessageBox.No)
+            if answer == QMessageBox.Yes:
+                self.apply_journal_contents(self.edit_journal.discard())
+            else:
+                changed = [(kind, filepath) for kind, filepath in changed if filepath not in pending_paths]
+        self.edit_journal.forget([filepath for _, filepath in changed])
+        self.update_edit_buttons()
+
+        state_records = {}
+        region_records = {}
+        for kind, filepath in changed:
+            print(f"外部での変更を反映します: {filepath}")
+            if kind == "localisation":
+                continue # 言語ごとにまとめて読み直す
+            elif kind == "provinces":
+                self.start_loading(["provinces"]) # definition.csv は1ファイルなので読み込み直す
+            else:
+                namespace, parse_func, records = ("state", state_loader.parse_state_file, state_records) if kind == "states" else ("strategic_region", state_loader.parse_strategic_region_file, region_records)
+                if not os.path.exists(filepath):
+                    if self.parse_cache is not None:
+                        self.parse_cache.discard(namespace, filepath)
+                    records[filepath] = None
+                    continue
+                record = self.cached_parse(namespace, filepath, parse_func)
+                if record is None:
+                    print(f"Could not parse {filepath}; keeping the previous data.")
+                    continue
+                records[filepath] = record
+        if any(kind == "localisation" for kind, _ in changed):
+            for language in self.extra_languages:
+                self.localisation.load(language)
+            self.apply_localisation(self.localisation.load(self.language)[1])
+        self.apply_file_records(state_records, region_records)
+
+    def apply_localisation(self, localisation_strings):
+        self.localisation_strings = localisation_strings
+        for state_info in self.state_files_info:
+            self.localize_state_info(state_info)
+        for region_info in self.strategic_region_files_info:
+            self.localize_region_info(region_info)
+        self.records_changed()
+        self.state_search.update(self.state_files_info, ["ローカライズ名"])
+        self.strategic_region_search.update(self.strategic_region_files_info, ["ローカライズ名"])
+        self.state_model.refresh_all()
+        self.province_model.refresh_all()
+        self.strategic_region_model.refresh_all()
+
+    def verify_written_files(self, state_infos, region_infos):
+        """
+        書き込んだステート・戦略地域ファイルを再パースし、メモリ上のレコードと一致するか確認する。
+        再パースの結果はキャッシュに登録されるので、次回のロードでも再パースされない。
+
+        Args:
+            state_infos (list[dict]): 書き込んだステートのレコード
+            region_infos (list[dict]): 書き込んだ戦略地域のレコード
+
+        Returns:
+            bool: すべて一致すれば True
+        """
+        consistent = True
+        for state_info in state_infos:
+            filepath = self.state_filepath(state_info)
+            record = self.cached_parse("state", filepath, state_loader.parse_state_file)
+            if record is None or record["state_id"] != state_info["state_id"] or set(record["provinces"]) != set(state_info["provinces"]):
+                print(f"State file {filepath} does not match the edited data.")
+                consistent = False
+        for region_info in region_infos:
+            filepath = self.region_filepath(region_info)
+            record = self.cached_parse("strategic_region", filepath, state_loader.parse_strategic_region_file)
+            if record is None or set(record["provinces"]) != set(region_info["provinces"]):
+                print(f"Strategic region file {filepath} does not match the edited data.")
+                consistent = False
+        return consistent
+
+    def cached_parse(self, namespace, filepath, parse_func):
+        if self.parse_cache is None:
+            return parse_func(filepath)
+        return self.parse_cache.get(namespace, filepath, parse_func)
+
+    def render_state_file(self, state_info, provinces):
+        """ジャーナル上のステートファイルの provinces を provinces に書き換えた内容を返す。失敗したら None。"""
+        filepath = self.state_filepath(state_info)
+        try:
+            return state_tool_core.render_state_provinces(self.edit_journal.read(filepath), provinces)
+        except Exception as e:
+            print(f"Error updating state file {filepath}: {e}")
+            return None
 
+    def render_strategic_region_file(self, region_info, provinces):
+        """ジャーナル上の戦略地域ファイルの provinces を provinces に書き換えた内容を返す。失敗したら None。"""
+        filepath = self.region_filepath(region_info)
+        try:
+            return state_tool_core.render_region_provinces(self.edit_journal.read(filepath), provinces)
         except Exception as e:
             print(f"Error updating strategic region file {filepath}: {e}")
+            return None
 
 if __name__ == '__main__':
     app = QApplication(sys.argv)
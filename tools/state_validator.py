@@ -0,0 +1,123 @@
+import json
+from collections import Counter
+
+# マップ全体の整合性チェック
+# ステート・戦略地域・プロビンス (definition.csv) のレコードから一度だけ索引を作り、すべての規則をまとめて確認する。
+# ファイルの読み込み (並列・キャッシュ付き) は state_tool_core.StateToolCore.load() が行い、
+# ここではメモリ上のレコードだけを見るので、GUI で編集するたびに呼んでも軽い。
+
+# 規則名 -> (重大度, 説明)
+RULES = {
+    "duplicate_state_id": ("error", "同じステートIDのファイルが複数あります"),
+    "state_unknown_province": ("error", "ステートに definition.csv に無いプロビンスがあります"),
+    "state_sea_province": ("error", "ステートに海のプロビンスがあります"),
+    "province_without_state": ("error", "陸のプロビンスがどのステートにも属していません"),
+    "province_in_multiple_states": ("error", "プロビンスが複数のステートに属しています"),
+    "region_unknown_province": ("error", "戦略地域に definition.csv に無いプロビンスがあります"),
+    "province_without_region": ("error", "プロビンスがどの戦略地域にも属していません"),
+    "province_in_multiple_regions": ("error", "プロビンスが複数の戦略地域に属しています"),
+    "state_split_regions": ("error", "ステートのプロビンスが複数の戦略地域に分かれています"),
+    "building_outside_state": ("error", "buildings のプロビンスがステートに属していません"),
+    "victory_point_outside_state": ("warning", "勝利点のプロビンスがステートに属していません"),
+    "state_not_contiguous": ("warning", "ステートのプロビンスがつながっていません"),
+}
+
+
+def _issue(rule, **fields):
+    severity, message = RULES[rule]
+    return dict({"rule": rule, "severity": severity, "message": message}, **fields)
+
+
+def validate(states, provinces, regions, graph=None):
+    """
+    すべての規則を確認し、問題のリストを返す。
+
+    Args:
+        states (list[dict]): ステートのレコード
+        provinces (list[ProvinceRecord]): プロビンスのレコード (definition.csv)
+        regions (list[dict]): 戦略地域のレコード
+        graph (adjacency.ProvinceGraph): 隣接グラフ (None ならステートのつながりは確認しない)
+
+    Returns:
+        list[dict]: 問題 (rule, severity, message と state / province / region / provinces など)
+    """
+    issues = []
+    terrain_of = {str(province_info.province_id): province_info.terrain_type for province_info in provinces}
+
+    # プロビンスID -> 属するステートID / 戦略地域名のリスト
+    states_of = {}
+    for state_info in states:
+        for province_id in state_info["provinces"]:
+            states_of.setdefault(province_id, []).append(state_info["state_id"])
+    regions_of = {}
+    for region_info in regions:
+        for province_id in region_info["provinces"]:
+            regions_of.setdefault(province_id, []).append(region_info["strategic_region_name"])
+
+    for state_id, count in Counter(state_info["state_id"] for state_info in states).items():
+        if count > 1:
+            issues.append(_issue("duplicate_state_id", state=state_id,
+                                 files=sorted(state_info["filename"] for state_info in states if state_info["state_id"] == state_id)))
+
+    for province_info in provinces:
+        province_id = str(province_info.province_id)
+        state_ids = states_of.get(province_id, ())
+        if len(state_ids) > 1:
+            issues.append(_issue("province_in_multiple_states", province=province_id, states=state_ids))
+        elif not state_ids and province_info.terrain_type == "land":
+            issues.append(_issue("province_without_state", province=province_id))
+        region_names = regions_of.get(province_id, ())
+        if len(region_names) > 1:
+            issues.append(_issue("province_in_multiple_regions", province=province_id, regions=region_names))
+        elif not region_names:
+            issues.append(_issue("province_without_region", province=province_id, terrain=province_info.terrain_type))
+
+    for region_info in regions:
+        for province_id in region_info["provinces"]:
+            if province_id not in terrain_of:
+                issues.append(_issue("region_unknown_province", region=region_info["strategic_region_name"], province=province_id))
+
+    for state_info in states:
+        state_id = state_info["state_id"]
+        state_provinces = set(state_info["provinces"])
+        state_regions = set()
+        for province_id in state_info["provinces"]:
+            terrain = terrain_of.get(province_id)
+            if terrain is None:
+                issues.append(_issue("state_unknown_province", state=state_id, province=province_id))
+            elif terrain == "sea":
+                issues.append(_issue("state_sea_province", state=state_id, province=province_id))
+            state_regions.update(regions_of.get(province_id, ()))
+        if len(state_regions) > 1:
+            issues.append(_issue("state_split_regions", state=state_id, regions=sorted(state_regions)))
+        for province_id in state_info.get("building_provinces", ()):
+            if province_id not in state_provinces:
+                issues.append(_issue("building_outside_state", state=state_id, province=province_id))
+        for province_id in state_info.get("victory_point_provinces", ()):
+            if province_id not in state_provinces:
+                issues.append(_issue("victory_point_outside_state", state=state_id, province=province_id))
+        if graph is not None and len(state_provinces) > 1:
+            components = graph.components(state_provinces)
+            if len(components) > 1:
+                issues.append(_issue("state_not_contiguous", state=state_id, components=[[str(p) for p in component] for component in components]))
+
+    return issues
+
+
+def summarize(issues):
+    """重大度ごとの件数を返す。"""
+    counts = Counter(issue["severity"] for issue in issues)
+    return {"errors": counts.get("error", 0), "warnings": counts.get("warning", 0)}
+
+
+def format_issue(issue):
+    """問題を1行の文字列にする (GUI やログの表示用)。"""
+    details = ", ".join(f"{key}={value}" for key, value in issue.items() if key not in ("rule", "severity", "message"))
+    return f"[{issue['severity']}] {issue['message']} ({details})"
+
+
+def report_json(issues, elapsed=None):
+    report = dict(summarize(issues), issues=issues)
+    if elapsed is not None:
+        report["seconds"] = round(elapsed, 4)
+    return json.dumps(report, ensure_ascii=False, indent=1)
@@ -0,0 +1,71 @@
+import os
+import sys
+import unittest
+
+TOOLS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+REPO_DIR = os.path.join(TOOLS_DIR, '..')
+sys.path.append(TOOLS_DIR)
+import clausewitz
+import state_loader
+import state_tool_core
+
+# clausewitz.set_block_values() とプロビンスの書き換えの回帰テスト
+# リポジトリ直下で python -m unittest discover tools/tests で実行する。
+
+
+def set_values(text, values):
+    block = clausewitz.parse_text(text).get("state").get("provinces")
+    return clausewitz.apply_edits(text, clausewitz.set_block_values(text, block, values))
+
+
+class SetBlockValuesTest(unittest.TestCase):
+
+    def test_remove_values_at_line_start(self):
+        text = "state={\n\tprovinces={\n\t\t1 2 3 4\n\t}\n}\n"
+        self.assertEqual(set_values(text, ["3", "4"]), "state={\n\tprovinces={\n\t\t3 4\n\t}\n}\n")
+        self.assertEqual(set_values(text, ["1", "4"]), "state={\n\tprovinces={\n\t\t1 4\n\t}\n}\n")
+
+    def test_remove_values_on_each_wrapped_line(self):
+        text = "state={\n\tprovinces={\n\t\t1 2 3 \n\t\t4 5 6\n\t}\n}\n"
+        self.assertEqual(set_values(text, ["3", "6"]), "state={\n\tprovinces={\n\t\t3 \n\t\t6\n\t}\n}\n")
+
+    def test_remove_all_values_leaves_no_blank_line(self):
+        expected = "state={\n\tprovinces={\n\t}\n}\n"
+        self.assertEqual(set_values("state={\n\tprovinces={\n\t\t1 2 3 \n\t}\n}\n", []), expected)
+        self.assertEqual(set_values("state={\n\tprovinces={\n\t\t1\n\t\t2\n\t}\n}\n", []), expected)
+
+    def test_unchanged_values_return_same_text(self):
+        text = "state = {\r\n\tprovinces = { # comment\r\n\t\t3 1  2 \r\n\t}\r\n}\r\n"
+        self.assertEqual(set_values(text, ["1", "2", "3"]), text)
+
+
+class TransferRoundTripTest(unittest.TestCase):
+
+    def assert_round_trip(self, source_text, target_text, moved):
+        source = state_loader.parse_state_file("1-Source.txt", source_text)["provinces"]
+        target = state_loader.parse_state_file("2-Target.txt", target_text)["provinces"]
+        moved_source = state_tool_core.render_state_provinces(source_text, [p for p in source if p not in moved])
+        moved_target = state_tool_core.render_state_provinces(target_text, target + moved)
+        self.assertNotEqual(moved_source, source_text)
+        self.assertEqual(state_tool_core.render_state_provinces(moved_source, source), source_text)
+        self.assertEqual(state_tool_core.render_state_provinces(moved_target, target), target_text)
+
+    def test_transfer_and_reverse_is_byte_identical(self):
+        source = "state={\n\tid=1\n\tprovinces={\n\t\t668 671 673 3675 \n\t}\n}\n"
+        target = "state = {\n\tid = 2\n\tprovinces = {\n\t\t704 732 3718 \n\t}\n}\n"
+        self.assert_round_trip(source, target, ["668", "671"])
+
+    def test_transfer_and_reverse_in_repository_states(self):
+        # 153-Tyrol のプロビンス 668 671 を 4-Austria に移して戻す
+        paths = [os.path.join(REPO_DIR, "history", "states", name) for name in ("153-Tyrol.txt", "4-Austria.txt")]
+        if not all(os.path.exists(path) for path in paths):
+            self.skipTest("history/states がありません")
+        texts = []
+        for path in paths:
+            with open(path, "r", encoding="utf-8", newline="") as f:
+                texts.append(f.read())
+        self.assert_round_trip(texts[0], texts[1], ["668", "671"])
+
+
+if __name__ == "__main__":
+    unittest.main()